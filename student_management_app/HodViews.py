@@ -7,86 +7,17 @@ from django.views.decorators.csrf import csrf_exempt
 import json
 
 from .forms import AddStudentForm, EditStudentForm
+from .attendance_analytics import attendance_threshold
+from .attendance import rows_response, attendance_date_rows, session_report_rows, REPORT_FIELDS, attendance_range_rows, report_range
+from .dashboards import hod_dashboard_context, hod_cache_scopes
+from .dashboard_cache import get_cached_dashboard
+from .exports import export_response
 
-from .models import CustomUser, Staffs, Courses, Subjects, Students, SessionYearModel, FeedBackStudent, FeedBackStaffs, LeaveReportStudent, LeaveReportStaff, Attendance, AttendanceReport
+from .models import CustomUser, Staffs, Courses, Subjects, Students, SessionYearModel, FeedBackStudent, FeedBackStaffs, LeaveReportStudent, LeaveReportStaff, Attendance, AttendanceReport, AttendancePercentage
 
 
 def admin_home(request):
-    print("apun sbka baap h")
-    print(request.user.user_type)
-    all_student_count = Students.objects.all().count()
-    subject_count = Subjects.objects.all().count()
-    course_count = Courses.objects.all().count()
-    staff_count = Staffs.objects.all().count()
-
-    # Total Subjects and students in Each Course
-    course_all = Courses.objects.all()
-    course_name_list = []
-    subject_count_list = []
-    student_count_list_in_course = []
-
-    for course in course_all:
-        subjects = Subjects.objects.filter(course_id=course.id).count()
-        students = Students.objects.filter(course_id=course.id).count()
-        course_name_list.append(course.course_name)
-        subject_count_list.append(subjects)
-        student_count_list_in_course.append(students)
-    
-    subject_all = Subjects.objects.all()
-    subject_list = []
-    student_count_list_in_subject = []
-    for subject in subject_all:
-        course = Courses.objects.get(id=subject.course_id.id)
-        student_count = Students.objects.filter(course_id=course.id).count()
-        subject_list.append(subject.subject_name)
-        student_count_list_in_subject.append(student_count)
-    
-    # For Saffs
-    staff_attendance_present_list=[]
-    staff_attendance_leave_list=[]
-    staff_name_list=[]
-
-    staffs = Staffs.objects.all()
-    for staff in staffs:
-        subject_ids = Subjects.objects.filter(staff_id=staff.admin.id)
-        attendance = Attendance.objects.filter(subject_id__in=subject_ids).count()
-        leaves = LeaveReportStaff.objects.filter(staff_id=staff.id, leave_status=1).count()
-        staff_attendance_present_list.append(attendance)
-        staff_attendance_leave_list.append(leaves)
-        staff_name_list.append(staff.admin.first_name)
-
-    # For Students
-    student_attendance_present_list=[]
-    student_attendance_leave_list=[]
-    student_name_list=[]
-
-    students = Students.objects.all()
-    for student in students:
-        attendance = AttendanceReport.objects.filter(student_id=student.id, status=True).count()
-        absent = AttendanceReport.objects.filter(student_id=student.id, status=False).count()
-        leaves = LeaveReportStudent.objects.filter(student_id=student.id, leave_status=1).count()
-        student_attendance_present_list.append(attendance)
-        student_attendance_leave_list.append(leaves+absent)
-        student_name_list.append(student.admin.first_name)
-
-
-    context={
-        "all_student_count": all_student_count,
-        "subject_count": subject_count,
-        "course_count": course_count,
-        "staff_count": staff_count,
-        "course_name_list": course_name_list,
-        "subject_count_list": subject_count_list,
-        "student_count_list_in_course": student_count_list_in_course,
-        "subject_list": subject_list,
-        "student_count_list_in_subject": student_count_list_in_subject,
-        "staff_attendance_present_list": staff_attendance_present_list,
-        "staff_attendance_leave_list": staff_attendance_leave_list,
-        "staff_name_list": staff_name_list,
-        "student_attendance_present_list": student_attendance_present_list,
-        "student_attendance_leave_list": student_attendance_leave_list,
-        "student_name_list": student_name_list,
-    }
+    context = get_cached_dashboard("hod", request.user.id, hod_cache_scopes(), hod_dashboard_context)
     return render(request, "hod_template/home_content.html", context)
 
 
@@ -119,7 +50,7 @@ def add_staff_save(request):
 
 
 def manage_staff(request):
-    staffs = Staffs.objects.all()
+    staffs = Staffs.objects.select_related('admin')
     context = {
         "staffs": staffs
     }
@@ -385,7 +316,7 @@ def add_student_save(request):
 
 
 def manage_student(request):
-    students = Students.objects.all()
+    students = Students.objects.select_related('admin', 'course_id', 'session_year_id')
     context = {
         "students": students
     }
@@ -527,7 +458,7 @@ def add_subject_save(request):
 
 
 def manage_subject(request):
-    subjects = Subjects.objects.all()
+    subjects = Subjects.objects.select_related('course_id', 'staff_id')
     context = {
         "subjects": subjects
     }
@@ -612,7 +543,7 @@ def check_username_exist(request):
 
 
 def student_feedback_message(request):
-    feedbacks = FeedBackStudent.objects.all()
+    feedbacks = FeedBackStudent.objects.select_related('student_id__admin', 'student_id__session_year_id')
     context = {
         "feedbacks": feedbacks
     }
@@ -635,7 +566,7 @@ def student_feedback_message_reply(request):
 
 
 def staff_feedback_message(request):
-    feedbacks = FeedBackStaffs.objects.all()
+    feedbacks = FeedBackStaffs.objects.select_related('staff_id__admin')
     context = {
         "feedbacks": feedbacks
     }
@@ -658,7 +589,7 @@ def staff_feedback_message_reply(request):
 
 
 def student_leave_view(request):
-    leaves = LeaveReportStudent.objects.all()
+    leaves = LeaveReportStudent.objects.select_related('student_id__admin')
     context = {
         "leaves": leaves
     }
@@ -679,7 +610,7 @@ def student_leave_reject(request, leave_id):
 
 
 def staff_leave_view(request):
-    leaves = LeaveReportStaff.objects.all()
+    leaves = LeaveReportStaff.objects.select_related('staff_id__admin')
     context = {
         "leaves": leaves
     }
@@ -716,40 +647,43 @@ def admin_get_attendance_dates(request):
     subject_id = request.POST.get("subject")
     session_year = request.POST.get("session_year_id")
 
-    # Students enroll to Course, Course has Subjects
-    # Getting all data from subject model based on subject_id
-    subject_model = Subjects.objects.get(id=subject_id)
-
-    session_model = SessionYearModel.objects.get(id=session_year)
-
-    # students = Students.objects.filter(course_id=subject_model.course_id, session_year_id=session_model)
-    attendance = Attendance.objects.filter(subject_id=subject_model, session_year_id=session_model)
-
-    # Only Passing Student Id and Student Name Only
-    list_data = []
-
-    for attendance_single in attendance:
-        data_small={"id":attendance_single.id, "attendance_date":str(attendance_single.attendance_date), "session_year_id":attendance_single.session_year_id.id}
-        list_data.append(data_small)
-
-    return JsonResponse(json.dumps(list_data), content_type="application/json", safe=False)
+    return rows_response(request, ["id", "attendance_date", "session_year_id"], attendance_date_rows(subject_id, session_year))
 
 
 @csrf_exempt
 def admin_get_attendance_student(request):
     # Getting Values from Ajax POST 'Fetch Student'
     attendance_date = request.POST.get('attendance_date')
-    attendance = Attendance.objects.get(id=attendance_date)
 
-    attendance_data = AttendanceReport.objects.filter(attendance_id=attendance)
-    # Only Passing Student Id and Student Name Only
-    list_data = []
+    # Only Passing Student Id, Student Name and Status, in one joined query
+    return rows_response(request, ["id", "name", "status"], session_report_rows(attendance_date))
+
+
+def admin_attendance_export(request):
+    if request.method != "POST":
+        messages.error(request, "Invalid Method")
+        return redirect('admin_view_attendance')
+
+    try:
+        subjects, start_date, end_date = report_range(request.POST, Subjects.objects.all())
+    except ValueError as error:
+        messages.error(request, str(error))
+        return redirect('admin_view_attendance')
+
+    rows = attendance_range_rows(start_date, end_date, subjects)
+    return export_response(request.POST.get('format'), REPORT_FIELDS, rows, "attendance_%s_%s" % (start_date, end_date))
 
-    for student in attendance_data:
-        data_small={"id":student.student_id.admin.id, "name":student.student_id.admin.first_name+" "+student.student_id.admin.last_name, "status":student.status}
-        list_data.append(data_small)
 
-    return JsonResponse(json.dumps(list_data), content_type="application/json", safe=False)
+def admin_attendance_alerts(request):
+    # Students flagged by the last run of manage.py compute_attendance_percentages
+    alerts = AttendancePercentage.objects.filter(below_threshold=True).select_related(
+        'student_id__admin', 'student_id__course_id', 'subject_id', 'session_year_id'
+    ).order_by('subject_id__subject_name', 'session_percentage')
+    context = {
+        "alerts": alerts,
+        "threshold": attendance_threshold()
+    }
+    return render(request, "hod_template/attendance_alerts_template.html", context)
 
 
 def admin_profile(request):
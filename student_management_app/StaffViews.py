@@ -1,76 +1,26 @@
 from django.shortcuts import render, redirect
-from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseRedirect, JsonResponse
 from django.contrib import messages
 from django.core.files.storage import FileSystemStorage #To upload Profile Picture
 from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
 from django.core import serializers
 import json
+import uuid
 
 
-from .models import CustomUser, Staffs, Courses, Subjects, Students, SessionYearModel, Attendance, AttendanceReport, LeaveReportStaff, FeedBackStaffs, StudentResult
+from .models import CustomUser, Staffs, Courses, Subjects, Students, SessionYearModel, Attendance, AttendanceReport, LeaveReportStaff, FeedBackStaffs, StudentResult, AttendancePercentage
+from .attendance_analytics import attendance_threshold
+from .attendance_queue import write_behind_enabled, enqueue_attendance, submission_status
+from .attendance import parse_marks, save_attendance_session, save_attendance_batch, update_attendance_session, rows_response, roster_rows, attendance_date_rows, session_report_rows, REPORT_FIELDS, attendance_range_rows, report_range
+from .dashboards import staff_dashboard_context, staff_cache_scopes
+from .dashboard_cache import get_cached_dashboard
+from .exports import export_response, RESULT_FIELDS, result_rows
 
 
 def staff_home(request):
-    # Fetching All Students under Staff
-    print(request.user.id)
-    subjects = Subjects.objects.filter(staff_id=request.user.id)
-    print(subjects)
-    course_id_list = []
-    for subject in subjects:
-        course = Courses.objects.get(id=subject.course_id.id)
-        course_id_list.append(course.id)
-
-    final_course = []
-    # Removing Duplicate Course Id
-    for course_id in course_id_list:
-        if course_id not in final_course:
-            final_course.append(course_id)
-            
-    print(final_course)
-    students_count = Students.objects.filter(course_id__in=final_course).count()
-    subject_count = subjects.count()
-    print(subject_count)
-    print(students_count)
-    #
-    # # Fetch All Attendance Count
-    attendance_count = Attendance.objects.filter(subject_id__in=subjects).count()
-    # # Fetch    All Approve Leave
-    # print(request.user)
-    print(request.user.user_type)
-    staff = Staffs.objects.get(admin=request.user.id)
-    leave_count = LeaveReportStaff.objects.filter(staff_id=staff.id, leave_status=1).count()
-
-    # #Fetch Attendance Data by Subjects
-    subject_list = []
-    attendance_list = []
-    for subject in subjects:
-        attendance_count1 = Attendance.objects.filter(subject_id=subject.id).count()
-        subject_list.append(subject.subject_name)
-        attendance_list.append(attendance_count1)
-
-    students_attendance = Students.objects.filter(course_id__in=final_course)
-    student_list = []
-    student_list_attendance_present = []
-    student_list_attendance_absent = []
-    for student in students_attendance:
-        attendance_present_count = AttendanceReport.objects.filter(status=True, student_id=student.id).count()
-        attendance_absent_count = AttendanceReport.objects.filter(status=False, student_id=student.id).count()
-        student_list.append(student.admin.first_name+" "+ student.admin.last_name)
-        student_list_attendance_present.append(attendance_present_count)
-        student_list_attendance_absent.append(attendance_absent_count)
-
-    context={
-        "students_count": students_count,
-        "attendance_count": attendance_count,
-        "leave_count": leave_count,
-        "subject_count": subject_count,
-        "subject_list": subject_list,
-        "attendance_list": attendance_list,
-        "student_list": student_list,
-        "attendance_present_list": student_list_attendance_present,
-        "attendance_absent_list": student_list_attendance_absent
-    }
+    user_id = request.user.id
+    context = get_cached_dashboard("staff", user_id, staff_cache_scopes(user_id), lambda: staff_dashboard_context(user_id))
     return render(request, "staff_template/staff_home_template.html", context)
 
 
@@ -85,6 +35,18 @@ def staff_take_attendance(request):
     return render(request, "staff_template/take_attendance_template.html", context)
 
 
+def staff_attendance_alerts(request):
+    # Students of the staff's Subjects flagged by manage.py compute_attendance_percentages
+    alerts = AttendancePercentage.objects.filter(below_threshold=True, subject_id__staff_id=request.user.id).select_related(
+        'student_id__admin', 'subject_id', 'session_year_id'
+    ).order_by('subject_id__subject_name', 'session_percentage')
+    context = {
+        "alerts": alerts,
+        "threshold": attendance_threshold()
+    }
+    return render(request, "staff_template/staff_attendance_alerts_template.html", context)
+
+
 def staff_apply_leave(request):
     print(request.user.id)
     staff_obj = Staffs.objects.get(admin=request.user.id)
@@ -149,21 +111,8 @@ def get_students(request):
     session_year = request.POST.get("session_year")
 
     # Students enroll to Course, Course has Subjects
-    # Getting all data from subject model based on subject_id
-    subject_model = Subjects.objects.get(id=subject_id)
-
-    session_model = SessionYearModel.objects.get(id=session_year)
-
-    students = Students.objects.filter(course_id=subject_model.course_id, session_year_id=session_model)
-
-    # Only Passing Student Id and Student Name Only
-    list_data = []
-
-    for student in students:
-        data_small={"id":student.admin.id, "name":student.admin.first_name+" "+student.admin.last_name}
-        list_data.append(data_small)
-
-    return JsonResponse(json.dumps(list_data), content_type="application/json", safe=False)
+    # Only Passing Student Id and Student Name, in one joined query
+    return rows_response(request, ["id", "name"], roster_rows(subject_id, session_year))
 
 
 
@@ -177,26 +126,69 @@ def save_attendance_data(request):
     attendance_date = request.POST.get("attendance_date")
     session_year_id = request.POST.get("session_year_id")
 
-    subject_model = Subjects.objects.get(id=subject_id)
-    session_year_model = SessionYearModel.objects.get(id=session_year_id)
+    # Write-behind mode only spools the submission, the queue worker saves it
+    if write_behind_enabled():
+        try:
+            session = {"subject_id": subject_id, "attendance_date": attendance_date, "session_year_id": session_year_id, "student_ids": json.loads(student_ids)}
+        except:
+            return JsonResponse({"status": "Error", "ticket": None})
+        return JsonResponse({"status": "Queued", "ticket": enqueue_attendance(request.user.id, [session])})
 
-    json_student = json.loads(student_ids)
-    # print(dict_student[0]['id'])
+    # Only the staff's own subjects, with the errors of the batch save
+    try:
+        subject_model = Subjects.objects.get(id=subject_id, staff_id=request.user.id)
+    except (Subjects.DoesNotExist, ValueError):
+        return JsonResponse({"status": "Error", "error": "Unknown subject", "created": False, "saved": 0, "changed": 0, "rejected": []})
+    try:
+        session_year_model = SessionYearModel.objects.get(id=session_year_id)
+    except (SessionYearModel.DoesNotExist, ValueError):
+        return JsonResponse({"status": "Error", "error": "Unknown session year", "created": False, "saved": 0, "changed": 0, "rejected": []})
 
-    # print(student_ids)
+    # Every student is resolved in one query and all reports are written with
+    # one bulk insert in a single transaction; unknown ids are sent back
     try:
-        # First Attendance Data is Saved on Attendance Model
-        attendance = Attendance(subject_id=subject_model, attendance_date=attendance_date, session_year_id=session_year_model)
-        attendance.save()
-
-        for stud in json_student:
-            # Attendance of Individual Student saved on AttendanceReport Model
-            student = Students.objects.get(admin=stud['id'])
-            attendance_report = AttendanceReport(student_id=student, attendance_id=attendance, status=stud['status'])
-            attendance_report.save()
-        return HttpResponse("OK")
+        marks, rejected = parse_marks(json.loads(student_ids))
+        result = save_attendance_session(subject_model, session_year_model, attendance_date, marks)
     except:
-        return HttpResponse("Error")
+        return JsonResponse({"status": "Error", "created": False, "saved": 0, "changed": 0, "rejected": []})
+
+    # A retried save merges into the session saved the first time
+    rejected += result["rejected"]
+    status = "OK" if result["attendance_id"] else "Error"
+    return JsonResponse({"status": status, "created": result["created"], "saved": result["saved"], "changed": result["changed"], "rejected": rejected})
+
+
+@csrf_exempt
+def save_attendance_batch_data(request):
+    # Many sessions (e.g. taken offline) in one request, posted either as a
+    # JSON body {"sessions": [...]} or as a JSON encoded "sessions" field.
+    # Each session has the fields posted by the take attendance page
+    try:
+        if request.content_type == "application/json":
+            sessions = json.loads(request.body)["sessions"]
+        else:
+            sessions = json.loads(request.POST.get("sessions"))
+        if not isinstance(sessions, list):
+            raise ValueError("sessions must be a list")
+        if write_behind_enabled():
+            return JsonResponse({"status": "Queued", "ticket": enqueue_attendance(request.user.id, sessions), "sessions": []})
+        results = save_attendance_batch(request.user.id, sessions)
+    except:
+        return JsonResponse({"status": "Error", "sessions": []})
+
+    return JsonResponse({"status": "OK", "sessions": results})
+
+
+@csrf_exempt
+def attendance_submission_status(request):
+    # Polled by the attendance pages with the ticket of a queued save
+    try:
+        status = submission_status(uuid.UUID(request.POST.get("ticket") or request.GET.get("ticket")), request.user.id)
+    except (TypeError, ValueError):
+        status = None
+    if status is None:
+        return JsonResponse({"status": "Error", "sessions": []}, status=404)
+    return JsonResponse(status)
 
 
 
@@ -212,46 +204,20 @@ def staff_update_attendance(request):
 
 @csrf_exempt
 def get_attendance_dates(request):
-    
-
     # Getting Values from Ajax POST 'Fetch Student'
     subject_id = request.POST.get("subject")
     session_year = request.POST.get("session_year_id")
 
-    # Students enroll to Course, Course has Subjects
-    # Getting all data from subject model based on subject_id
-    subject_model = Subjects.objects.get(id=subject_id)
-
-    session_model = SessionYearModel.objects.get(id=session_year)
-
-    # students = Students.objects.filter(course_id=subject_model.course_id, session_year_id=session_model)
-    attendance = Attendance.objects.filter(subject_id=subject_model, session_year_id=session_model)
-
-    # Only Passing Student Id and Student Name Only
-    list_data = []
-
-    for attendance_single in attendance:
-        data_small={"id":attendance_single.id, "attendance_date":str(attendance_single.attendance_date), "session_year_id":attendance_single.session_year_id.id}
-        list_data.append(data_small)
-
-    return JsonResponse(json.dumps(list_data), content_type="application/json", safe=False)
+    return rows_response(request, ["id", "attendance_date", "session_year_id"], attendance_date_rows(subject_id, session_year))
 
 
 @csrf_exempt
 def get_attendance_student(request):
     # Getting Values from Ajax POST 'Fetch Student'
     attendance_date = request.POST.get('attendance_date')
-    attendance = Attendance.objects.get(id=attendance_date)
-
-    attendance_data = AttendanceReport.objects.filter(attendance_id=attendance)
-    # Only Passing Student Id and Student Name Only
-    list_data = []
-
-    for student in attendance_data:
-        data_small={"id":student.student_id.admin.id, "name":student.student_id.admin.first_name+" "+student.student_id.admin.last_name, "status":student.status}
-        list_data.append(data_small)
 
-    return JsonResponse(json.dumps(list_data), content_type="application/json", safe=False)
+    # Only Passing Student Id, Student Name and Status, in one joined query
+    return rows_response(request, ["id", "name", "status"], session_report_rows(attendance_date))
 
 
 @csrf_exempt
@@ -259,23 +225,33 @@ def update_attendance_data(request):
     student_ids = request.POST.get("student_ids")
 
     attendance_date = request.POST.get("attendance_date")
-    attendance = Attendance.objects.get(id=attendance_date)
-
-    json_student = json.loads(student_ids)
+    attendance = Attendance.objects.select_related('subject_id').get(id=attendance_date)
 
+    # Existing reports are read in one query and only changed statuses are written
     try:
-        
-        for stud in json_student:
-            # Attendance of Individual Student saved on AttendanceReport Model
-            student = Students.objects.get(admin=stud['id'])
+        marks, rejected = parse_marks(json.loads(student_ids))
+        result = update_attendance_session(attendance, marks)
+    except:
+        return JsonResponse({"status": "Error", "changed": 0, "rejected": []})
 
-            attendance_report = AttendanceReport.objects.get(student_id=student, attendance_id=attendance)
-            attendance_report.status=stud['status']
+    rejected += result["rejected"]
+    return JsonResponse({"status": "OK", "changed": result["changed"], "rejected": rejected})
 
-            attendance_report.save()
-        return HttpResponse("OK")
-    except:
-        return HttpResponse("Error")
+
+def staff_attendance_export(request):
+    if request.method != "POST":
+        messages.error(request, "Invalid Method")
+        return redirect('staff_update_attendance')
+
+    # Only the Subjects taught by the logged in Staff
+    try:
+        subjects, start_date, end_date = report_range(request.POST, Subjects.objects.filter(staff_id=request.user.id))
+    except ValueError as error:
+        messages.error(request, str(error))
+        return redirect('staff_update_attendance')
+
+    rows = attendance_range_rows(start_date, end_date, subjects)
+    return export_response(request.POST.get('format'), REPORT_FIELDS, rows, "attendance_%s_%s" % (start_date, end_date))
 
 
 def staff_profile(request):
@@ -329,6 +305,23 @@ def staff_add_result(request):
     return render(request, "staff_template/add_result_template.html", context)
 
 
+def staff_result_export(request):
+    if request.method != "POST":
+        messages.error(request, "Invalid Method")
+        return redirect('staff_add_result')
+
+    # Only the results of Subjects taught by the logged in Staff
+    subjects = Subjects.objects.filter(staff_id=request.user.id)
+    subject_id = request.POST.get('subject') or ''
+    if subject_id != 'all':
+        if not subject_id.isdigit():
+            return HttpResponseBadRequest("Invalid Subject")
+        subjects = subjects.filter(id=subject_id)
+
+    rows = result_rows(StudentResult.objects.filter(subject_id__in=subjects))
+    return export_response(request.POST.get('format'), RESULT_FIELDS, rows, "results")
+
+
 def staff_add_result_save(request):
     if request.method != "POST":
         messages.error(request, "Invalid Method")
@@ -7,46 +7,19 @@ from django.urls import reverse
 import datetime # To Parse input DateTime into Python Date Time Object
 
 from .models import CustomUser, Staffs, Courses, Subjects, Students, Attendance, AttendanceReport, LeaveReportStudent, FeedBackStudent, StudentResult
+from .attendance import REPORT_FIELDS, attendance_range_rows, report_range
+from .dashboards import student_dashboard_context, student_cache_scopes
+from .dashboard_cache import get_cached_dashboard
+from .exports import export_response, RESULT_FIELDS, result_rows
 
 
 def student_home(request):
-    print("idhar aa chuka hu")
-    print(request.user.id)
-    print(request.user.id)
-    ##student_obj = Students.objects.get(admin=request.user.id)``
-    student_obj = Students.objects.get(id = 1)
-    print("yha")
-    
-    total_attendance =   AttendanceReport.objects.filter(student_id=student_obj).count()
-    attendance_present = AttendanceReport.objects.filter(student_id=student_obj, status=True).count()
-    attendance_absent =  AttendanceReport.objects.filter(student_id=student_obj, status=False).count()
-    print("hello")
-
-    course_obj = Courses.objects.get(id=student_obj.course_id.id)
-    total_subjects = Subjects.objects.filter(course_id=course_obj).count()
-
-    subject_name = []
-    data_present = []
-    data_absent = []
-    subject_data = Subjects.objects.filter(course_id=student_obj.course_id)
-    for subject in subject_data:
-        attendance = Attendance.objects.filter(subject_id=subject.id)
-        attendance_present_count = AttendanceReport.objects.filter(attendance_id__in=attendance, status=True, student_id=student_obj.id).count()
-        attendance_absent_count = AttendanceReport.objects.filter(attendance_id__in=attendance, status=False, student_id=student_obj.id).count()
-        subject_name.append(subject.subject_name)
-        data_present.append(attendance_present_count)
-        data_absent.append(attendance_absent_count)
-    
-    context={
-        "total_attendance": total_attendance,
-        "attendance_present": attendance_present,
-        "attendance_absent": attendance_absent,
-        "total_subjects": total_subjects,
-        "subject_name": subject_name,
-        "data_present": data_present,
-        "data_absent": data_absent
-    }
-    return render(request, "student_template/student_home_template.html")
+    student_id, course_id = Students.objects.values_list('id', 'course_id').get(admin=request.user.id)
+    context = get_cached_dashboard(
+        "student", request.user.id, student_cache_scopes(request.user.id, course_id),
+        lambda: student_dashboard_context(student_id, course_id)
+    )
+    return render(request, "student_template/student_home_template.html", context)
 
 
 def student_view_attendance(request):
@@ -65,31 +38,29 @@ def student_view_attendance_post(request):
         messages.error(request, "Invalid Method")
         return redirect('student_view_attendance')
     else:
-        # Getting all the Input Data
-        subject_id = request.POST.get('subject')
-        start_date = request.POST.get('start_date')
-        end_date = request.POST.get('end_date')
-
-        # Parsing the date data into Python object
-        start_date_parse = datetime.datetime.strptime(start_date, '%Y-%m-%d').date()
-        end_date_parse = datetime.datetime.strptime(end_date, '%Y-%m-%d').date()
-
-        # Getting all the Subject Data based on Selected Subject
-        subject_obj = Subjects.objects.get(id=subject_id)
-        # Getting Logged In User Data
-        user_obj = CustomUser.objects.get(id=request.user.id)
         # Getting Student Data Based on Logged in Data
-        stud_obj = Students.objects.get(admin=user_obj)
-
-        # Now Accessing Attendance Data based on the Range of Date Selected and Subject Selected
-        attendance = Attendance.objects.filter(attendance_date__range=(start_date_parse, end_date_parse), subject_id=subject_obj)
-        # Getting Attendance Report based on the attendance details obtained above
-        attendance_reports = AttendanceReport.objects.filter(attendance_id__in=attendance, student_id=stud_obj)
+        student_id, course_id = Students.objects.values_list('id', 'course_id').get(admin=request.user.id)
 
-        # for attendance_report in attendance_reports:
-        #     print("Date: "+ str(attendance_report.attendance_id.attendance_date), "Status: "+ str(attendance_report.status))
-
-        # messages.success(request, "Attendacne View Success")
+        # Subject Selected (or all Subjects of the Course) and the Range of Date Selected
+        try:
+            subjects, start_date, end_date = report_range(request.POST, Subjects.objects.filter(course_id=course_id))
+        except ValueError as error:
+            messages.error(request, str(error))
+            return redirect('student_view_attendance')
+
+        # Only one of the Student's Subjects can be selected
+        subject_obj = None
+        if request.POST.get('subject', 'all') != 'all':
+            subject_obj = subjects.first()
+            if subject_obj is None:
+                messages.error(request, "Invalid Subject")
+                return redirect('student_view_attendance')
+
+        # Attendance Data in one joined query, with the date and Subject on every row
+        attendance_reports = [
+            {"attendance_date": attendance_date, "subject_name": subject_name, "status": status}
+            for attendance_date, subject_id, subject_name, admin_id, name, status in attendance_range_rows(start_date, end_date, subjects, student_id=student_id)
+        ]
 
         context = {
             "subject_obj": subject_obj,
@@ -97,6 +68,22 @@ def student_view_attendance_post(request):
         }
 
         return render(request, 'student_template/student_attendance_data.html', context)
+
+
+def student_attendance_export(request):
+    if request.method != "POST":
+        messages.error(request, "Invalid Method")
+        return redirect('student_view_attendance')
+
+    student_id, course_id = Students.objects.values_list('id', 'course_id').get(admin=request.user.id)
+    try:
+        subjects, start_date, end_date = report_range(request.POST, Subjects.objects.filter(course_id=course_id))
+    except ValueError as error:
+        messages.error(request, str(error))
+        return redirect('student_view_attendance')
+
+    rows = attendance_range_rows(start_date, end_date, subjects, student_id=student_id)
+    return export_response(request.POST.get('format'), REPORT_FIELDS, rows, "attendance_%s_%s" % (start_date, end_date))
        
 
 def student_apply_leave(request):
@@ -196,13 +183,17 @@ def student_profile_update(request):
 
 def student_view_result(request):
     student = Students.objects.get(admin=request.user.id)
-    student_result = StudentResult.objects.filter(student_id=student.id)
+    student_result = StudentResult.objects.filter(student_id=student.id).select_related('subject_id')
     context = {
         "student_result": student_result,
     }
     return render(request, "student_template/student_view_result.html", context)
 
 
+def student_result_export(request):
+    if request.method != "POST":
+        messages.error(request, "Invalid Method")
+        return redirect('student_view_result')
 
-
-
+    rows = result_rows(StudentResult.objects.filter(student_id__admin=request.user.id))
+    return export_response(request.POST.get('format'), RESULT_FIELDS, rows, "results")
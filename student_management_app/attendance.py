@@ -0,0 +1,491 @@
+import datetime
+import heapq
+
+from django.db import IntegrityError, transaction
+from django.http import JsonResponse
+from django.utils import timezone
+
+from .attendance_bitmap import bitmap_storage_enabled, bitmap_statuses, bitmap_status, session_bitmap, unpack_marks, unpack_roster, write_bitmap_marks
+from .attendance_summary import apply_attendance_deltas, status_delta, status_change_delta
+from .dashboard_cache import bump_dashboard_versions_on_commit
+from .models import Subjects, SessionYearModel, Students, Attendance, AttendanceReport, AttendanceBitmap, ArchivedAttendance
+
+
+# Attendance Reads and Writes
+# Shared by the staff and HOD attendance views: rosters and sessions are read
+# and written with a fixed number of statements, whatever the size of the class.
+# Sessions are stored either as AttendanceReport rows or as one packed
+# AttendanceBitmap (see attendance_bitmap.py); the helpers below read both,
+# and the sessions of archived session years (see attendance_archive.py).
+
+
+def rows_response(request, fields, rows):
+    """
+    JSON response for the attendance AJAX endpoints. By default a list of
+    objects; with format=compact in the request, {"fields": [...], "rows":
+    [[...], ...]} which leaves the keys out of every row.
+    """
+    if request.POST.get("format", request.GET.get("format")) == "compact":
+        return JsonResponse({"fields": fields, "rows": [list(row) for row in rows]})
+    return JsonResponse([dict(zip(fields, row)) for row in rows], safe=False)
+
+
+def roster_rows(subject_id, session_year_id):
+    # (admin_id, name) of the students of a Subject's Course in a Session Year, in one joined query
+    students = Students.objects.filter(course_id__subjects=subject_id, session_year_id=session_year_id).order_by('id')
+    return [
+        (admin_id, first_name+" "+last_name)
+        for admin_id, first_name, last_name in students.values_list('admin_id', 'admin__first_name', 'admin__last_name')
+    ]
+
+
+def attendance_date_rows(subject_id, session_year_id):
+    # (id, attendance_date, session_year_id) of a Subject's sessions, live and archived, in date order
+    live = Attendance.objects.filter(subject_id=subject_id, session_year_id=session_year_id).values_list('id', 'attendance_date', 'session_year_id')
+    archived = ArchivedAttendance.objects.filter(subject_id=subject_id, session_year_id=session_year_id).values_list('attendance_id', 'attendance_date', 'session_year_id')
+    return live.union(archived, all=True).order_by('attendance_date')
+
+
+def packed_session_rows(statuses):
+    # (admin_id, name, status) of a packed session's {student_id: status}, in roster order
+    names = {
+        student_id: (admin_id, first_name+" "+last_name)
+        for student_id, admin_id, first_name, last_name in Students.objects.filter(id__in=statuses).values_list('id', 'admin_id', 'admin__first_name', 'admin__last_name')
+    }
+    return [names[student_id] + (status,) for student_id, status in statuses.items() if student_id in names]
+
+
+def session_report_rows(attendance_id):
+    # (admin_id, name, status) of every student marked in one session
+    bitmap = session_bitmap(attendance_id)
+    if bitmap is not None:
+        return packed_session_rows(bitmap_statuses(bitmap))
+
+    reports = AttendanceReport.objects.filter(attendance_id=attendance_id).order_by('id')
+    rows = [
+        (admin_id, first_name+" "+last_name, status)
+        for admin_id, first_name, last_name, status in reports.values_list('student_id__admin_id', 'student_id__admin__first_name', 'student_id__admin__last_name', 'status')
+    ]
+    if rows:
+        return rows
+
+    # Sessions of archived years keep their id in the archive
+    archived = ArchivedAttendance.objects.filter(attendance_id=attendance_id).values_list('roster', 'marks', 'student_count').first()
+    if archived is None:
+        return []
+    roster, marks, count = archived
+    return packed_session_rows(dict(zip(unpack_roster(roster).tolist(), unpack_marks(marks, count).tolist())))
+
+
+def report_range(data, subjects):
+    """
+    Reads the subject ("all" or an id), start_date and end_date of a report
+    form. Returns (subjects narrowed to the selected one, start, end); raises
+    ValueError, with the message to show, on a malformed subject or a missing
+    or malformed date.
+    """
+    subject_id = data.get('subject', 'all')
+    if subject_id != 'all':
+        if not str(subject_id).isdigit():
+            raise ValueError("Invalid Subject")
+        subjects = subjects.filter(id=subject_id)
+    try:
+        start_date = datetime.datetime.strptime(data.get('start_date') or '', '%Y-%m-%d').date()
+        end_date = datetime.datetime.strptime(data.get('end_date') or '', '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError("Invalid Date Range")
+    return subjects, start_date, end_date
+
+
+REPORT_FIELDS = ["date", "subject_id", "subject", "student_id", "student", "status"]
+
+
+def attendance_range_rows(start_date, end_date, subjects, student_id=None):
+    """
+    Yields (attendance_date, subject_id, subject_name, admin_id, student name,
+    status) for the sessions of `subjects` (a Subjects queryset) between two
+    dates, optionally for one student, in (date, subject) order.
+
+    Both storages and the archive are read with .iterator() and merged, so
+    the report is never held in memory whatever the range; the joins use the
+    indexes on Attendance(attendance_date) and AttendanceReport(student_id,
+    status), archived sessions are found by ArchivedAttendance(subject_id,
+    attendance_date).
+    """
+    sessions = {'attendance_id__subject_id__in': subjects, 'attendance_id__attendance_date__range': (start_date, end_date)}
+    order = ('attendance_id__attendance_date', 'attendance_id__subject_id')
+
+    reports = AttendanceReport.objects.filter(**sessions)
+    if student_id is not None:
+        reports = reports.filter(student_id=student_id)
+    report_rows = (
+        (attendance_date, subject_id, subject_name, admin_id, first_name+" "+last_name, status)
+        for attendance_date, subject_id, subject_name, admin_id, first_name, last_name, status in reports.order_by(*order, 'student_id').values_list(
+            'attendance_id__attendance_date', 'attendance_id__subject_id', 'attendance_id__subject_id__subject_name',
+            'student_id__admin_id', 'student_id__admin__first_name', 'student_id__admin__last_name', 'status'
+        ).iterator()
+    )
+    # Packed and archived sessions have the same columns and come in one query
+    bitmaps = AttendanceBitmap.objects.filter(**sessions).values_list(
+        'attendance_id__attendance_date', 'attendance_id__subject_id', 'attendance_id__subject_id__subject_name', 'roster', 'marks', 'student_count'
+    )
+    archived = ArchivedAttendance.objects.filter(subject_id__in=subjects, attendance_date__range=(start_date, end_date)).values_list(
+        'attendance_date', 'subject_id', 'subject_id__subject_name', 'roster', 'marks', 'student_count'
+    )
+    packed = bitmaps.union(archived, all=True).order_by(*order)
+    return heapq.merge(report_rows, bitmap_range_rows(packed, student_id), key=lambda row: row[:2])
+
+
+def bitmap_range_rows(bitmaps, student_id=None):
+    # Expands packed sessions into the rows of attendance_range_rows, looking names up in batches
+    names = {}
+    for attendance_date, subject_id, subject_name, roster, marks, count in bitmaps.iterator():
+        if student_id is not None:
+            statuses = {student_id: bitmap_status(roster, marks, count, student_id)}
+            statuses = {student_id: status for student_id, status in statuses.items() if status is not None}
+        else:
+            statuses = dict(zip(unpack_roster(roster).tolist(), unpack_marks(marks, count).tolist()))
+
+        missing = [student for student in statuses if student not in names]
+        if missing:
+            names.update(
+                (student, (admin_id, first_name+" "+last_name))
+                for student, admin_id, first_name, last_name in Students.objects.filter(id__in=missing).values_list('id', 'admin_id', 'admin__first_name', 'admin__last_name')
+            )
+        for student, status in statuses.items():
+            if student in names:
+                yield (attendance_date, subject_id, subject_name) + names[student] + (status,)
+
+
+def parse_marks(json_student):
+    """
+    Turns the [{"id": <CustomUser id>, "status": 0|1}, ...] payload posted by
+    the attendance pages into ({admin_id: status}, rejected_ids).
+    """
+    marks = {}
+    rejected = []
+    for stud in json_student:
+        try:
+            marks[int(stud['id'])] = bool(int(stud['status']))
+        except (KeyError, TypeError, ValueError):
+            rejected.append(stud.get('id') if isinstance(stud, dict) else stud)
+    return marks, rejected
+
+
+def enrolled_students(subject, admin_ids):
+    # {admin_id: student_id} of the given users enrolled in the subject's course, in one query
+    return dict(Students.objects.filter(admin__in=admin_ids, course_id=subject.course_id_id).values_list('admin_id', 'id'))
+
+
+def bump_attendance_dashboards(course_id, admin_ids):
+    # Bulk writes don't send post_save, so invalidate the dashboards once committed
+    scopes = ["hod", "course_attendance:%s" % course_id] + ["student:%s" % admin_id for admin_id in admin_ids]
+    bump_dashboard_versions_on_commit(*scopes)
+
+
+def session_reports(attendance, admin_ids):
+    # {admin_id: (report_id, student_id, status)} of the given users' reports in one session, in one query
+    return {
+        admin_id: (report_id, student_id, status)
+        for report_id, student_id, admin_id, status in AttendanceReport.objects.filter(attendance_id=attendance, student_id__admin_id__in=admin_ids).values_list('id', 'student_id', 'student_id__admin_id', 'status')
+    }
+
+
+def write_status_changes(reports, marks):
+    """
+    Writes the marks that differ from the existing `reports` ({key:
+    (report_id, student_id, status)}, e.g. from session_reports) with one
+    UPDATE per new status. `marks` uses the same keys. Returns the changes as
+    (key, student_id, old_status, new_status) tuples.
+    """
+    changed = {True: [], False: []}
+    changes = []
+    for key, (report_id, student_id, status) in reports.items():
+        if marks[key] != status:
+            changed[marks[key]].append(report_id)
+            changes.append((key, student_id, status, marks[key]))
+
+    # update() skips auto_now, so updated_at is set explicitly
+    now = timezone.now()
+    for status, report_ids in changed.items():
+        if report_ids:
+            AttendanceReport.objects.filter(id__in=report_ids).update(status=status, updated_at=now)
+    return changes
+
+
+def change_deltas(changes):
+    # Summary deltas {student_id: (present_delta, absent_delta)} of one session's write_status_changes
+    return {student_id: status_change_delta(old, new) for key, student_id, old, new in changes}
+
+
+def write_session_reports(attendance, reports, students, marks):
+    """
+    Inserts the reports of one session stored as rows that aren't in
+    `reports` (from session_reports) and updates the changed ones.
+    `students` is {admin_id: student_id} of `marks`. Returns (added
+    {admin_id: student_id}, write_status_changes).
+    """
+    added = {admin_id: student_id for admin_id, student_id in students.items() if admin_id not in reports}
+    AttendanceReport.objects.bulk_create([
+        AttendanceReport(student_id_id=student_id, attendance_id=attendance, status=marks[admin_id])
+        for admin_id, student_id in added.items()
+    ])
+    return added, write_status_changes(reports, marks)
+
+
+def save_attendance_session(subject, session_year, attendance_date, marks):
+    """
+    Upserts the Attendance row of one class session and its AttendanceReport
+    rows in a single transaction. `marks` is {admin_id: status}; users who
+    aren't students of the subject's course are rejected instead of saved.
+
+    Saving the same subject, date and session year again (a double click or a
+    retried request) merges into the existing session: missing reports are
+    inserted and changed statuses updated, nothing is duplicated.
+
+    Returns {"attendance_id", "created", "saved", "changed", "rejected"};
+    raises ValueError for an archived session year.
+    """
+    if session_year.archived_at is not None:
+        raise ValueError("Session year is archived")
+    students = enrolled_students(subject, marks)
+    rejected = [admin_id for admin_id in marks if admin_id not in students]
+    if not students:
+        return {"attendance_id": None, "created": False, "saved": 0, "changed": 0, "rejected": rejected}
+
+    with transaction.atomic():
+        # Locked, so a concurrent save of the same session (a double click)
+        # waits for this one and then merges into it
+        attendance, created = Attendance.objects.select_for_update().get_or_create(subject_id=subject, attendance_date=attendance_date, session_year_id=session_year)
+        bitmap = None if created else session_bitmap(attendance, for_update=True)
+
+        if bitmap is not None or (created and bitmap_storage_enabled()):
+            added, changes, skipped = write_bitmap_marks(bitmap or AttendanceBitmap(attendance_id=attendance), {
+                student_id: marks[admin_id] for admin_id, student_id in students.items()
+            })
+            deltas = {student_id: status_delta(status) for student_id, status in added.items()}
+            deltas.update({student_id: status_change_delta(old, new) for student_id, (old, new) in changes.items()})
+        else:
+            reports = {} if created else session_reports(attendance, students)
+            try:
+                with transaction.atomic():
+                    added, changes = write_session_reports(attendance, reports, students, marks)
+            except IntegrityError:
+                # Some reports were inserted since they were read (by a writer
+                # not waiting on the lock, e.g. the batch save), which counted
+                # them in the summary itself: read again and merge into them
+                reports = session_reports(attendance, students)
+                added, changes = write_session_reports(attendance, reports, students, marks)
+            deltas = {student_id: status_delta(marks[admin_id]) for admin_id, student_id in added.items()}
+            deltas.update(change_deltas(changes))
+
+        apply_attendance_deltas(subject.id, session_year.id, deltas)
+        bump_attendance_dashboards(subject.course_id_id, students)
+
+    return {"attendance_id": attendance.id, "created": created, "saved": len(added), "changed": len(changes), "rejected": rejected}
+
+
+def update_attendance_session(attendance, marks):
+    """
+    Applies `marks` ({admin_id: status}) to the existing reports of one
+    Attendance row, fetched with select_related('subject_id'). The reports
+    (or the bitmap) are read in one query and only changed statuses are
+    written. Users who aren't marked in this session are rejected.
+
+    Returns {"changed", "rejected"}.
+    """
+    with transaction.atomic():
+        bitmap = session_bitmap(attendance, for_update=True)
+        if bitmap is None:
+            reports = session_reports(attendance, marks)
+            rejected = [admin_id for admin_id in marks if admin_id not in reports]
+            deltas = change_deltas(write_status_changes(reports, marks))
+            student_admins = {student_id: admin_id for admin_id, (report_id, student_id, status) in reports.items()}
+        else:
+            student_admins = dict(Students.objects.filter(admin__in=marks).values_list('id', 'admin_id'))
+            added, changes, skipped = write_bitmap_marks(bitmap, {student_id: marks[admin_id] for student_id, admin_id in student_admins.items()}, append=False)
+            known = set(student_admins.values()) - {student_admins[student_id] for student_id in skipped}
+            rejected = [admin_id for admin_id in marks if admin_id not in known]
+            deltas = {student_id: status_change_delta(old, new) for student_id, (old, new) in changes.items()}
+
+        apply_attendance_deltas(attendance.subject_id_id, attendance.session_year_id_id, deltas)
+        if deltas:
+            bump_attendance_dashboards(attendance.subject_id.course_id_id, [student_admins[student_id] for student_id in deltas])
+
+    return {"changed": len(deltas), "rejected": rejected}
+
+
+# Batch Submission
+# Many sessions (e.g. taken offline) saved in one request: every lookup is
+# prefetched for the whole batch and the sessions are written together.
+
+def parse_batch_session(session, subjects, session_years):
+    """
+    Validates one session of a batch against the prefetched lookup maps.
+    Returns (subject, session_year, attendance_date, marks, rejected); raises
+    ValueError with a message for the client.
+    """
+    if not isinstance(session, dict):
+        raise ValueError("Session must be an object")
+    try:
+        subject = subjects[int(session.get("subject_id"))]
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("Unknown subject")
+    try:
+        session_year = session_years[int(session.get("session_year_id"))]
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("Unknown session year")
+    if session_year.archived_at is not None:
+        raise ValueError("Session year is archived")
+    try:
+        attendance_date = datetime.datetime.strptime(session.get("attendance_date") or "", '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        raise ValueError("Invalid attendance date")
+    student_ids = session.get("student_ids")
+    if not isinstance(student_ids, list):
+        raise ValueError("student_ids must be a list")
+    marks, rejected = parse_marks(student_ids)
+    return subject, session_year, attendance_date, marks, rejected
+
+
+def save_attendance_batch(staff_id, sessions):
+    """
+    Upserts many sessions of the Subjects taught by `staff_id` in a single
+    transaction. Each session is {"subject_id", "attendance_date"
+    (YYYY-MM-DD), "session_year_id", "student_ids": [{"id", "status"}, ...]}
+    as posted by the take attendance page.
+
+    Subjects, session years and students are looked up once for the whole
+    batch, new sessions and reports are bulk inserted and changed statuses
+    updated with one statement per status, so the number of queries doesn't
+    grow with the number of sessions stored as rows.
+
+    Returns one result per session, in order: {"status": "OK", ...the fields
+    of save_attendance_session} or {"status": "Error", "error"} for sessions
+    that failed validation; those don't stop the others from being saved.
+    """
+    def ids(field):
+        values = set()
+        for session in sessions:
+            try:
+                values.add(int(session[field]))
+            except (KeyError, TypeError, ValueError):
+                pass
+        return values
+
+    subjects = Subjects.objects.filter(staff_id=staff_id).in_bulk(ids("subject_id"))
+    session_years = SessionYearModel.objects.in_bulk(ids("session_year_id"))
+
+    results = [None] * len(sessions)
+    parsed = {}
+    for index, session in enumerate(sessions):
+        try:
+            subject, session_year, attendance_date, marks, rejected = parse_batch_session(session, subjects, session_years)
+        except ValueError as error:
+            results[index] = {"status": "Error", "error": str(error)}
+            continue
+        key = (subject.id, attendance_date, session_year.id)
+        if key in parsed:
+            results[index] = {"status": "Error", "error": "Session appears twice in the batch"}
+            continue
+        parsed[key] = (index, subject, marks, rejected)
+
+    # {admin_id: (student_id, course_id)} of every student in the batch, in one query
+    all_admin_ids = {admin_id for index, subject, marks, rejected in parsed.values() for admin_id in marks}
+    students = {
+        admin_id: (student_id, course_id)
+        for admin_id, student_id, course_id in Students.objects.filter(admin__in=all_admin_ids).values_list('admin_id', 'id', 'course_id')
+    }
+    # Per session {student_id: status} of the students enrolled in the Subject's Course
+    session_marks = {}
+    for key, (index, subject, marks, rejected) in parsed.items():
+        enrolled = {admin_id: students[admin_id][0] for admin_id in marks if admin_id in students and students[admin_id][1] == subject.course_id_id}
+        rejected += [admin_id for admin_id in marks if admin_id not in enrolled]
+        session_marks[key] = {student_id: marks[admin_id] for admin_id, student_id in enrolled.items()}
+        if not enrolled:
+            results[index] = {"attendance_id": None, "created": False, "saved": 0, "changed": 0, "rejected": rejected, "status": "Error", "error": "No students of the subject's course"}
+    keys = [key for key in parsed if session_marks[key]]
+    if not keys:
+        return results
+
+    def existing_sessions():
+        # {(subject_id, attendance_date, session_year_id): attendance_id} of the batch's sessions, in one query
+        rows = Attendance.objects.filter(
+            subject_id__in={key[0] for key in keys}, attendance_date__in={key[1] for key in keys}, session_year_id__in={key[2] for key in keys}
+        ).values_list('subject_id', 'attendance_date', 'session_year_id', 'id')
+        return {row[:3]: row[3] for row in rows if row[:3] in session_marks}
+
+    with transaction.atomic():
+        attendance_ids = existing_sessions()
+        missing = [key for key in keys if key not in attendance_ids]
+        created = []
+        if missing:
+            # SQLite doesn't return ids from bulk inserts, so they are read back
+            Attendance.objects.bulk_create([
+                Attendance(subject_id_id=key[0], attendance_date=key[1], session_year_id_id=key[2])
+                for key in missing
+            ], ignore_conflicts=True)
+            attendance_ids = existing_sessions()
+        bitmap_sessions = set(AttendanceBitmap.objects.filter(attendance_id__in=attendance_ids.values()).values_list('attendance_id', flat=True))
+        if missing:
+            # A session saved concurrently since the first read was skipped by
+            # the insert and already has its marks (saves write them in the
+            # same transaction); it's merged into like a retry, not created
+            missing_ids = [attendance_ids[key] for key in missing]
+            saved = bitmap_sessions | set(AttendanceReport.objects.filter(attendance_id__in=missing_ids).values_list('attendance_id', flat=True).distinct())
+            created = [key for key in missing if attendance_ids[key] not in saved]
+            if bitmap_storage_enabled():
+                bitmap_sessions.update(attendance_ids[key] for key in created)
+
+        counts = {key: {"saved": 0, "changed": 0} for key in keys}
+        deltas = {}
+
+        def add_delta(key, student_id, delta):
+            group = deltas.setdefault((key[0], key[2]), {})
+            present, absent = group.get(student_id, (0, 0))
+            group[student_id] = (present + delta[0], absent + delta[1])
+
+        # Packed sessions are one row each, written one by one
+        for key in keys:
+            if attendance_ids[key] in bitmap_sessions:
+                bitmap = session_bitmap(attendance_ids[key], for_update=True) or AttendanceBitmap(attendance_id_id=attendance_ids[key])
+                added, changes, skipped = write_bitmap_marks(bitmap, session_marks[key])
+                for student_id, status in added.items():
+                    add_delta(key, student_id, status_delta(status))
+                for student_id, (old, new) in changes.items():
+                    add_delta(key, student_id, status_change_delta(old, new))
+                counts[key] = {"saved": len(added), "changed": len(changes)}
+
+        # Row sessions: one read of the existing reports, one bulk insert and one UPDATE per status
+        row_keys = {attendance_ids[key]: key for key in keys if attendance_ids[key] not in bitmap_sessions}
+        existing_reports = AttendanceReport.objects.filter(
+            attendance_id__in=list(row_keys),
+            student_id__in={student_id for key in row_keys.values() for student_id in session_marks[key]}
+        ).values_list('id', 'attendance_id', 'student_id', 'status')
+        reports = {
+            (row_keys[attendance_id], student_id): (report_id, student_id, status)
+            for report_id, attendance_id, student_id, status in existing_reports
+            if student_id in session_marks[row_keys[attendance_id]]
+        }
+        new_reports = []
+        for attendance_id, key in row_keys.items():
+            for student_id, status in session_marks[key].items():
+                if (key, student_id) not in reports:
+                    new_reports.append(AttendanceReport(attendance_id_id=attendance_id, student_id_id=student_id, status=status))
+                    add_delta(key, student_id, status_delta(status))
+                    counts[key]["saved"] += 1
+        AttendanceReport.objects.bulk_create(new_reports, batch_size=1000)
+        report_marks = {(key, student_id): session_marks[key][student_id] for key, student_id in reports}
+        for (key, _), student_id, old, new in write_status_changes(reports, report_marks):
+            add_delta(key, student_id, status_change_delta(old, new))
+            counts[key]["changed"] += 1
+
+        for (subject_id, session_year_id), group in deltas.items():
+            apply_attendance_deltas(subject_id, session_year_id, group)
+        for course_id in {parsed[key][1].course_id_id for key in keys}:
+            bump_attendance_dashboards(course_id, [admin_id for key in keys if parsed[key][1].course_id_id == course_id for admin_id in parsed[key][2] if admin_id in students])
+
+    for key in keys:
+        index, subject, marks, rejected = parsed[key]
+        results[index] = dict(counts[key], attendance_id=attendance_ids[key], created=key in created, rejected=rejected, status="OK")
+    return results
@@ -0,0 +1,134 @@
+from itertools import chain
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .attendance_bitmap import unpack_marks, unpack_roster
+from .models import SessionYearModel, Attendance, AttendanceReport, AttendanceBitmap, ArchivedAttendance, AttendancePercentage
+
+
+# Attendance Percentages
+# Percentages per Student and Subject over the last ATTENDANCE_WINDOW_DAYS
+# days and over the whole session year, computed with NumPy from one columnar
+# fetch of the session year's marks instead of counting per student. Students
+# under ATTENDANCE_THRESHOLD percent in either window are flagged. Results are
+# stored in AttendancePercentage for the HOD and staff alert pages;
+# manage.py compute_attendance_percentages refreshes them and is meant to run
+# daily (e.g. from cron).
+
+MARK_DTYPE = np.dtype([('attendance_id', '<i8'), ('student_id', '<i8'), ('status', '?')])
+
+
+def attendance_threshold():
+    return getattr(settings, 'ATTENDANCE_THRESHOLD', 75)
+
+
+def attendance_window_days():
+    return getattr(settings, 'ATTENDANCE_WINDOW_DAYS', 30)
+
+
+def session_year_marks(session_year_id):
+    """
+    Every mark of a session year as NumPy columns (attendance_id, student_id,
+    status): the AttendanceReport rows followed by the packed and archived
+    sessions.
+    """
+    # Only the report's own columns are fetched; dates and subjects are joined
+    # in from the (much smaller) Attendance table by attendance_percentages
+    reports = AttendanceReport.objects.filter(attendance_id__session_year_id=session_year_id).values_list('attendance_id', 'student_id', 'status')
+    columns = [np.fromiter(reports.iterator(chunk_size=10000), dtype=MARK_DTYPE)]
+
+    bitmaps = AttendanceBitmap.objects.filter(attendance_id__session_year_id=session_year_id).values_list('attendance_id', 'roster', 'marks', 'student_count')
+    archived = ArchivedAttendance.objects.filter(session_year_id=session_year_id).values_list('attendance_id', 'roster', 'marks', 'student_count')
+    for attendance_id, roster, marks, count in chain(bitmaps.iterator(), archived.iterator()):
+        column = np.empty(count, dtype=MARK_DTYPE)
+        column['attendance_id'] = attendance_id
+        column['student_id'] = unpack_roster(roster)
+        column['status'] = unpack_marks(marks, count)
+        columns.append(column)
+    return np.concatenate(columns)
+
+
+def percentages(present, total):
+    # 100 * present / total, NaN where there was no session
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 100.0 * present / total
+
+
+def attendance_percentages(session_year, as_of=None, window_days=None, threshold=None):
+    """
+    Computes the (unsaved) AttendancePercentage rows of a session year as of
+    `as_of` (default today) for every Student and Subject with at least one
+    session on or before that day.
+    """
+    as_of = as_of or timezone.now().date()
+    window_days = window_days or attendance_window_days()
+    threshold = attendance_threshold() if threshold is None else threshold
+
+    live = Attendance.objects.filter(session_year_id=session_year.id).values_list('id', 'subject_id', 'attendance_date')
+    archived = ArchivedAttendance.objects.filter(session_year_id=session_year.id).values_list('attendance_id', 'subject_id', 'attendance_date')
+    sessions = list(live.union(archived, all=True).order_by('id'))
+    if not sessions:
+        return []
+    session_ids, session_subjects, session_dates = (np.array(column) for column in zip(*sessions))
+    session_dates = session_dates.astype('datetime64[D]')
+
+    # Join each mark to its session's subject and date; marks of sessions
+    # saved after the sessions were read are left for the next run
+    marks = session_year_marks(session_year.id)
+    index = np.minimum(np.searchsorted(session_ids, marks['attendance_id']), len(session_ids) - 1)
+    dates = session_dates[index]
+    counted = (session_ids[index] == marks['attendance_id']) & (dates <= np.datetime64(as_of))
+    marks, index, dates = marks[counted], index[counted], dates[counted]
+    if not len(marks):
+        return []
+
+    # Group by (student, subject), packed into one integer key
+    subjects = session_subjects[index]
+    base = int(session_subjects.max()) + 1
+    keys, groups = np.unique(marks['student_id'] * base + subjects, return_inverse=True)
+    status = marks['status']
+    in_window = dates > np.datetime64(as_of) - np.timedelta64(window_days, 'D')
+
+    session_total = np.bincount(groups, minlength=len(keys))
+    session_present = np.bincount(groups, weights=status, minlength=len(keys)).astype(int)
+    window_total = np.bincount(groups[in_window], minlength=len(keys))
+    window_present = np.bincount(groups[in_window], weights=status[in_window], minlength=len(keys)).astype(int)
+
+    session_percentage = percentages(session_present, session_total)
+    window_percentage = percentages(window_present, window_total)
+    below_threshold = (session_percentage < threshold) | ((window_total > 0) & (window_percentage < threshold))
+
+    return [
+        AttendancePercentage(
+            student_id_id=key // base, subject_id_id=key % base, session_year_id=session_year,
+            window_days=window_days, window_present=window_present_count, window_total=window_total_count,
+            window_percentage=round(window_value, 2) if window_total_count else None,
+            session_present=session_present_count, session_total=session_total_count,
+            session_percentage=round(session_value, 2), below_threshold=below, computed_for=as_of,
+        )
+        for key, window_present_count, window_total_count, window_value, session_present_count, session_total_count, session_value, below in zip(
+            keys.tolist(), window_present.tolist(), window_total.tolist(), window_percentage.tolist(),
+            session_present.tolist(), session_total.tolist(), session_percentage.tolist(), below_threshold.tolist(),
+        )
+    ]
+
+
+def refresh_attendance_percentages(session_year, as_of=None, window_days=None, threshold=None):
+    """
+    Replaces the stored AttendancePercentage rows of a session year. Returns
+    (rows stored, rows below threshold).
+    """
+    rows = attendance_percentages(session_year, as_of, window_days, threshold)
+    with transaction.atomic():
+        AttendancePercentage.objects.filter(session_year_id=session_year).delete()
+        AttendancePercentage.objects.bulk_create(rows, batch_size=1000)
+    return len(rows), sum(row.below_threshold for row in rows)
+
+
+def current_session_years(as_of=None):
+    # Session years running on `as_of` (default today)
+    as_of = as_of or timezone.now().date()
+    return SessionYearModel.objects.filter(session_start_year__lte=as_of, session_end_year__gte=as_of)
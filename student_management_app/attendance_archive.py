@@ -0,0 +1,161 @@
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .attendance_bitmap import bitmap_statuses, count_bitmaps, pack_marks, pack_roster
+from .models import SessionYearModel, Attendance, AttendanceReport, AttendanceBitmap, ArchivedAttendance
+
+
+# Session Year Archive
+# Once a session year is over its sessions are moved out of Attendance,
+# AttendanceReport and AttendanceBitmap into ArchivedAttendance: one row per
+# session with its marks packed like an AttendanceBitmap. The live tables
+# (and their indexes) then only hold the running years, so the pages and
+# reports working on the current year don't pay for the history.
+#
+# AttendanceSummary and AttendancePercentage are left as they are, so the
+# dashboards and alert pages keep counting archived years. The reads in
+# attendance.py also look in the archive: the attendance history pages and
+# exports show archived sessions like live ones. Archived sessions are read
+# only, new attendance can't be saved for an archived year.
+#
+# Sessions are moved a batch per transaction and each batch leaves the data
+# readable, so an interrupted run can simply be started again.
+# manage.py archive_session_years runs it, and moves a year back with --restore.
+
+
+def closed_session_years(today=None):
+    # Session years that ended before `today` and aren't (completely) archived yet
+    today = today or timezone.now().date()
+    return SessionYearModel.objects.filter(session_end_year__lt=today).filter(
+        Q(archived_at__isnull=True) | Q(id__in=Attendance.objects.values('session_year_id'))
+    )
+
+
+def delete_rows(model, field, values):
+    # Deleting through the ORM would load every row to send post_delete and
+    # follow the cascades, and the dashboard counts don't change here
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "DELETE FROM %s WHERE %s IN (%s)" % (
+                connection.ops.quote_name(model._meta.db_table),
+                connection.ops.quote_name(model._meta.get_field(field).column),
+                ", ".join(["%s"] * len(values)),
+            ),
+            list(values)
+        )
+
+
+def archive_sessions(session_year_id, batch_size=200):
+    """
+    Moves up to `batch_size` live sessions of a session year into
+    ArchivedAttendance in one transaction. Returns the number moved, 0 once
+    there are none left.
+    """
+    with transaction.atomic():
+        sessions = list(
+            Attendance.objects.select_for_update().filter(session_year_id=session_year_id).order_by('id')
+            .values_list('id', 'subject_id', 'attendance_date', 'created_at', 'updated_at')[:batch_size]
+        )
+        if not sessions:
+            return 0
+        attendance_ids = [session[0] for session in sessions]
+
+        statuses = defaultdict(dict)
+        reports = AttendanceReport.objects.filter(attendance_id__in=attendance_ids).order_by('attendance_id', 'student_id').values_list('attendance_id', 'student_id', 'status')
+        for attendance_id, student_id, status in reports.iterator():
+            statuses[attendance_id][student_id] = status
+        # A session holds either rows or a bitmap; should it hold both, the
+        # rows are appended to the bitmap's roster like convert_to_bitmaps does
+        for bitmap in AttendanceBitmap.objects.filter(attendance_id__in=attendance_ids):
+            marks = bitmap_statuses(bitmap)
+            marks.update((student_id, status) for student_id, status in statuses[bitmap.attendance_id_id].items() if student_id not in marks)
+            statuses[bitmap.attendance_id_id] = marks
+
+        archived = []
+        for attendance_id, subject_id, attendance_date, created_at, updated_at in sessions:
+            marks = statuses.get(attendance_id, {})
+            archived.append(ArchivedAttendance(
+                attendance_id=attendance_id, subject_id_id=subject_id, attendance_date=attendance_date, session_year_id_id=session_year_id,
+                roster=pack_roster(list(marks)), marks=pack_marks(list(marks.values())),
+                student_count=len(marks), present_count=sum(marks.values()),
+                created_at=created_at, updated_at=updated_at,
+            ))
+        ArchivedAttendance.objects.bulk_create(archived)
+
+        delete_rows(AttendanceReport, 'attendance_id', attendance_ids)
+        delete_rows(AttendanceBitmap, 'attendance_id', attendance_ids)
+        delete_rows(Attendance, 'id', attendance_ids)
+    return len(sessions)
+
+
+def restore_sessions(session_year_id, batch_size=200):
+    """
+    Moves up to `batch_size` archived sessions of a session year back into
+    Attendance, under their old ids, with their marks as AttendanceBitmaps.
+    Returns the number moved, 0 once there are none left.
+    """
+    with transaction.atomic():
+        archived = list(ArchivedAttendance.objects.select_for_update().filter(session_year_id=session_year_id).order_by('attendance_id')[:batch_size])
+        if not archived:
+            return 0
+        Attendance.objects.bulk_create([
+            Attendance(id=session.attendance_id, subject_id_id=session.subject_id_id, attendance_date=session.attendance_date, session_year_id_id=session_year_id)
+            for session in archived
+        ])
+        AttendanceBitmap.objects.bulk_create([
+            AttendanceBitmap(attendance_id_id=session.attendance_id, roster=session.roster, marks=session.marks, student_count=session.student_count, present_count=session.present_count)
+            for session in archived
+        ])
+        delete_rows(ArchivedAttendance, 'id', [session.id for session in archived])
+    return len(archived)
+
+
+def archive_session_year(session_year, batch_size=200):
+    """
+    Archives every session of a session year. The year is marked archived
+    first, so no new sessions are saved for it while it's being moved.
+    Returns the number of sessions archived.
+    """
+    if session_year.archived_at is None:
+        session_year.archived_at = timezone.now()
+        SessionYearModel.objects.filter(id=session_year.id).update(archived_at=session_year.archived_at)
+    archived = 0
+    while True:
+        moved = archive_sessions(session_year.id, batch_size)
+        if not moved:
+            return archived
+        archived += moved
+
+
+def restore_session_year(session_year, batch_size=200):
+    """
+    Moves every archived session of a session year back into the live
+    tables and reopens the year for saving. Returns the number of sessions
+    restored.
+    """
+    restored = 0
+    while True:
+        moved = restore_sessions(session_year.id, batch_size)
+        if not moved:
+            break
+        restored += moved
+    session_year.archived_at = None
+    SessionYearModel.objects.filter(id=session_year.id).update(archived_at=None)
+    return restored
+
+
+def count_archived_attendance():
+    # Counts every archived session: {(student_id, subject_id, session_year_id): (present, absent)}
+    groups = defaultdict(list)
+    rows = ArchivedAttendance.objects.values_list('subject_id', 'session_year_id', 'roster', 'marks', 'student_count')
+    for subject_id, session_year_id, roster, marks, count in rows.iterator():
+        groups[(subject_id, session_year_id)].append((roster, marks, count))
+
+    counts = {}
+    for (subject_id, session_year_id), sessions in groups.items():
+        for student_id, student_counts in count_bitmaps(sessions).items():
+            counts[(student_id, subject_id, session_year_id)] = student_counts
+    return counts
@@ -0,0 +1,237 @@
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+
+from .dashboard_cache import bump_dashboard_versions_on_commit
+from .models import Students, Attendance, AttendanceReport, AttendanceBitmap
+
+
+# Attendance Bitmaps
+# With ATTENDANCE_STORAGE = "bitmap" each new Attendance session keeps its
+# marks in one AttendanceBitmap row instead of one AttendanceReport row per
+# student. The roster (Students ids) is frozen when the session is first saved,
+# students marked later are appended, and bit i is the status of roster[i].
+# Sessions can be moved between the two storages with convert_to_bitmaps and
+# convert_to_rows (manage.py convert_attendance_storage).
+
+ROSTER_DTYPE = np.dtype('<u4')
+
+
+def bitmap_storage_enabled():
+    return getattr(settings, 'ATTENDANCE_STORAGE', 'rows') == 'bitmap'
+
+
+def pack_roster(student_ids):
+    return np.asarray(student_ids, dtype=ROSTER_DTYPE).tobytes()
+
+
+def unpack_roster(data):
+    return np.frombuffer(bytes(data), dtype=ROSTER_DTYPE)
+
+
+def pack_marks(statuses):
+    return np.packbits(np.asarray(statuses, dtype=bool), bitorder='little').tobytes()
+
+
+def unpack_marks(data, count):
+    return np.unpackbits(np.frombuffer(bytes(data), dtype=np.uint8), count=count, bitorder='little').astype(bool)
+
+
+def bitmap_statuses(bitmap):
+    # {student_id: status} of one bitmap, in roster order
+    roster = unpack_roster(bitmap.roster)
+    return dict(zip(roster.tolist(), unpack_marks(bitmap.marks, bitmap.student_count).tolist()))
+
+
+def set_bitmap_statuses(bitmap, statuses):
+    # Packs {student_id: status} (in roster order) into the bitmap
+    bitmap.roster = pack_roster(list(statuses))
+    bitmap.marks = pack_marks(list(statuses.values()))
+    bitmap.student_count = len(statuses)
+    bitmap.present_count = sum(statuses.values())
+
+
+def bitmap_status(roster, marks, count, student_id):
+    # Status of one student in a packed session, or None if not on its roster
+    index = np.flatnonzero(unpack_roster(roster) == student_id)
+    if not len(index):
+        return None
+    return bool(unpack_marks(marks, count)[index[0]])
+
+
+def session_bitmap(attendance_id, for_update=False):
+    bitmaps = AttendanceBitmap.objects.filter(attendance_id=attendance_id)
+    if for_update:
+        bitmaps = bitmaps.select_for_update()
+    return bitmaps.first()
+
+
+def write_bitmap_marks(bitmap, marks, append=True):
+    """
+    Applies {student_id: status} to a (possibly unsaved) bitmap and saves it.
+    Students missing from the roster are appended when `append` is set and
+    skipped otherwise.
+
+    Returns (added {student_id: status}, changed {student_id: (old, new)},
+    skipped [student_id]).
+    """
+    statuses = bitmap_statuses(bitmap) if bitmap.pk else {}
+    added = {}
+    changed = {}
+    skipped = []
+    for student_id, status in marks.items():
+        if student_id not in statuses:
+            if not append:
+                skipped.append(student_id)
+                continue
+            added[student_id] = status
+        elif statuses[student_id] != status:
+            changed[student_id] = (statuses[student_id], status)
+        statuses[student_id] = status
+
+    if added or changed or not bitmap.pk:
+        set_bitmap_statuses(bitmap, statuses)
+        bitmap.save()
+    return added, changed, skipped
+
+
+# Counting
+# Bitmaps are unpacked with NumPy and counted per student with bincount, so
+# counts never touch AttendanceReport.
+
+def count_bitmaps(bitmaps):
+    """
+    Present/absent counts per student over (roster, marks, student_count)
+    tuples: {student_id: (present, absent)}.
+    """
+    rosters = []
+    marks = []
+    for roster, data, count in bitmaps:
+        rosters.append(unpack_roster(roster))
+        marks.append(unpack_marks(data, count))
+    if not rosters:
+        return {}
+
+    student_ids, index = np.unique(np.concatenate(rosters), return_inverse=True)
+    present = np.bincount(index, weights=np.concatenate(marks), minlength=len(student_ids)).astype(int)
+    total = np.bincount(index, minlength=len(student_ids))
+    return {
+        student_id: (int(present_count), int(total_count - present_count))
+        for student_id, present_count, total_count in zip(student_ids.tolist(), present, total)
+    }
+
+
+def count_bitmap_attendance():
+    # Counts every bitmap: {(student_id, subject_id, session_year_id): (present, absent)}
+    groups = defaultdict(list)
+    rows = AttendanceBitmap.objects.values_list('attendance_id__subject_id', 'attendance_id__session_year_id', 'roster', 'marks', 'student_count')
+    for subject_id, session_year_id, roster, marks, count in rows.iterator():
+        groups[(subject_id, session_year_id)].append((roster, marks, count))
+
+    counts = {}
+    for (subject_id, session_year_id), bitmaps in groups.items():
+        for student_id, student_counts in count_bitmaps(bitmaps).items():
+            counts[(student_id, subject_id, session_year_id)] = student_counts
+    return counts
+
+
+# Converters
+# Both directions keep the counts unchanged, so AttendanceSummary and the
+# cached dashboards stay valid. The exception is a session holding both
+# rows and a bitmap, whose marks of the same student were both counted: one
+# of them is dropped and taken out of the summary (drop_counted_marks).
+
+def drop_counted_marks(dropped):
+    """
+    Takes marks dropped by a conversion, {attendance_id: {student_id:
+    status}}, out of AttendanceSummary and refreshes the dashboards showing
+    them.
+    """
+    # attendance_summary imports this module
+    from .attendance_summary import apply_attendance_deltas
+
+    dropped = {attendance_id: marks for attendance_id, marks in dropped.items() if marks}
+    if not dropped:
+        return
+    deltas = defaultdict(dict)
+    course_ids = set()
+    for attendance_id, subject_id, session_year_id, course_id in Attendance.objects.filter(id__in=dropped).values_list('id', 'subject_id', 'session_year_id', 'subject_id__course_id'):
+        group = deltas[(subject_id, session_year_id)]
+        for student_id, status in dropped[attendance_id].items():
+            present, absent = group.get(student_id, (0, 0))
+            group[student_id] = (present - 1, absent) if status else (present, absent - 1)
+        course_ids.add(course_id)
+    for (subject_id, session_year_id), group in deltas.items():
+        apply_attendance_deltas(subject_id, session_year_id, group)
+
+    admin_ids = Students.objects.filter(id__in={student_id for marks in dropped.values() for student_id in marks}).values_list('admin_id', flat=True)
+    bump_dashboard_versions_on_commit("hod", *["course_attendance:%s" % course_id for course_id in course_ids], *["student:%s" % admin_id for admin_id in admin_ids])
+
+
+def convert_to_bitmaps(attendance_ids):
+    """
+    Packs the AttendanceReport rows of the given sessions into bitmaps and
+    deletes the rows. Returns the number of sessions converted.
+    """
+    with transaction.atomic():
+        statuses = defaultdict(dict)
+        reports = AttendanceReport.objects.filter(attendance_id__in=attendance_ids).order_by('attendance_id', 'student_id').values_list('attendance_id', 'student_id', 'status')
+        for attendance_id, student_id, status in reports.iterator():
+            statuses[attendance_id][student_id] = status
+        if not statuses:
+            return 0
+
+        # A session already holding a bitmap keeps it, the rows are merged in
+        # and replace the bitmap's marks of the same students
+        bitmaps = {bitmap.attendance_id_id: bitmap for bitmap in AttendanceBitmap.objects.filter(attendance_id__in=statuses)}
+        new_bitmaps = []
+        dropped = {}
+        for attendance_id, marks in statuses.items():
+            if attendance_id in bitmaps:
+                added, changes, skipped = write_bitmap_marks(bitmaps[attendance_id], marks)
+                dropped[attendance_id] = {
+                    student_id: changes[student_id][0] if student_id in changes else status
+                    for student_id, status in marks.items() if student_id not in added
+                }
+            else:
+                bitmap = AttendanceBitmap(attendance_id_id=attendance_id)
+                set_bitmap_statuses(bitmap, marks)
+                new_bitmaps.append(bitmap)
+        AttendanceBitmap.objects.bulk_create(new_bitmaps)
+        drop_counted_marks(dropped)
+
+        # Deleting through the ORM would load every row to send post_delete
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM %s WHERE attendance_id_id IN (%s)" % (connection.ops.quote_name(AttendanceReport._meta.db_table), ", ".join(["%s"] * len(statuses))),
+                list(statuses)
+            )
+    return len(statuses)
+
+
+def convert_to_rows(attendance_ids, batch_size=1000):
+    """
+    Expands the bitmaps of the given sessions back into AttendanceReport rows
+    and deletes the bitmaps. Students deleted since a session was saved stay
+    out of the rows (the rows would reference them). Existing rows of the
+    session are kept. Returns the number of sessions converted.
+    """
+    with transaction.atomic():
+        bitmaps = list(AttendanceBitmap.objects.filter(attendance_id__in=attendance_ids))
+        statuses = {bitmap.attendance_id_id: bitmap_statuses(bitmap) for bitmap in bitmaps}
+        students = set(Students.objects.filter(id__in={student_id for marks in statuses.values() for student_id in marks}).values_list('id', flat=True))
+        existing = set(AttendanceReport.objects.filter(attendance_id__in=list(statuses)).values_list('attendance_id', 'student_id'))
+        AttendanceReport.objects.bulk_create([
+            AttendanceReport(attendance_id_id=attendance_id, student_id_id=student_id, status=status)
+            for attendance_id, marks in statuses.items()
+            for student_id, status in marks.items()
+            if student_id in students and (attendance_id, student_id) not in existing
+        ], batch_size=batch_size)
+        drop_counted_marks({
+            attendance_id: {student_id: status for student_id, status in marks.items() if student_id in students and (attendance_id, student_id) in existing}
+            for attendance_id, marks in statuses.items()
+        })
+        AttendanceBitmap.objects.filter(id__in=[bitmap.id for bitmap in bitmaps]).delete()
+    return len(bitmaps)
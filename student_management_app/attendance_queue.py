@@ -0,0 +1,183 @@
+import datetime
+import json
+import logging
+import threading
+import uuid
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .attendance import save_attendance_batch
+from .models import AttendanceSubmission
+
+
+# Write-Behind Attendance Queue
+# With ATTENDANCE_WRITE_BEHIND on, attendance saves are spooled into
+# AttendanceSubmission (one small insert) and acknowledged with a ticket right
+# away, so a request holds the SQLite writer lock for one row instead of the
+# whole save. The queue is drained oldest first, many submissions per
+# transaction, by a worker thread in the web process (ATTENDANCE_QUEUE_THREAD)
+# or by manage.py drain_attendance_queue. Pages poll
+# attendance_submission_status with the ticket.
+#
+# A worker claims its batch before saving it, so several workers (threads of
+# different web processes, the command) can drain side by side. A submission
+# that hits a database error such as "database is locked" goes back in the
+# queue, up to ATTENDANCE_QUEUE_MAX_ATTEMPTS tries, each after waiting
+# ATTENDANCE_QUEUE_RETRY_DELAY seconds for the lock to clear; one that can't
+# be saved for any other reason fails right away.
+
+logger = logging.getLogger(__name__)
+
+
+def write_behind_enabled():
+    return getattr(settings, 'ATTENDANCE_WRITE_BEHIND', False)
+
+
+def enqueue_attendance(staff_id, sessions):
+    """
+    Spools a list of sessions (the payload of save_attendance_batch) for
+    `staff_id` and returns the submission's ticket.
+    """
+    submission = AttendanceSubmission.objects.create(ticket=uuid.uuid4(), staff_id_id=staff_id, sessions=json.dumps(sessions))
+    transaction.on_commit(wake_attendance_worker)
+    return submission.ticket
+
+
+def retry_at():
+    # When a submission put back in the queue now may be claimed again
+    return timezone.now() + datetime.timedelta(seconds=getattr(settings, 'ATTENDANCE_QUEUE_RETRY_DELAY', 5))
+
+
+def claim_attendance_submissions(batch_size):
+    # Marks up to `batch_size` pending submissions, oldest first, as processing
+    # under a new claim and returns them. The update checks the status again,
+    # so of two workers racing for a submission only one gets it. Retries wait
+    # for their not_before. Claims older than ATTENDANCE_QUEUE_CLAIM_TIMEOUT
+    # seconds are taken over: their worker died mid-batch.
+    now = timezone.now()
+    stale = now - datetime.timedelta(seconds=getattr(settings, 'ATTENDANCE_QUEUE_CLAIM_TIMEOUT', 300))
+    claimable = (
+        Q(status=AttendanceSubmission.PENDING) & (Q(not_before__isnull=True) | Q(not_before__lte=now))
+        | Q(status=AttendanceSubmission.PROCESSING, claimed_at__lt=stale)
+    )
+    ids = list(AttendanceSubmission.objects.filter(claimable).order_by('id').values_list('id', flat=True)[:batch_size])
+    if not ids:
+        return []
+    claim = uuid.uuid4()
+    AttendanceSubmission.objects.filter(claimable, id__in=ids).update(status=AttendanceSubmission.PROCESSING, claim=claim, claimed_at=now)
+    return list(AttendanceSubmission.objects.filter(claim=claim).order_by('id'))
+
+
+def error_results(sessions, error):
+    return json.dumps([{"status": "Error", "error": str(error)} for session in sessions])
+
+
+def drain_attendance_queue(batch_size=None):
+    """
+    Claims up to `batch_size` pending submissions, oldest first, and saves
+    them in one transaction. Returns the number of submissions processed,
+    including those put back in the queue for a retry.
+    """
+    batch_size = batch_size or getattr(settings, 'ATTENDANCE_QUEUE_BATCH_SIZE', 50)
+    max_attempts = getattr(settings, 'ATTENDANCE_QUEUE_MAX_ATTEMPTS', 5)
+    submissions = claim_attendance_submissions(batch_size)
+    if not submissions:
+        return 0
+    try:
+        with transaction.atomic():
+            now = timezone.now()
+            for submission in submissions:
+                sessions = json.loads(submission.sessions)
+                # A savepoint per submission, so a bad one fails alone
+                try:
+                    with transaction.atomic():
+                        results = save_attendance_batch(submission.staff_id_id, sessions)
+                except OperationalError as error:
+                    submission.attempts += 1
+                    if submission.attempts < max_attempts:
+                        logger.warning("Attendance submission %s will be retried: %s", submission.ticket, error)
+                        submission.status = AttendanceSubmission.PENDING
+                        submission.not_before = retry_at()
+                        continue
+                    logger.exception("Attendance submission %s failed after %d attempts", submission.ticket, submission.attempts)
+                    submission.status = AttendanceSubmission.FAILED
+                    submission.results = error_results(sessions, error)
+                except Exception as error:
+                    logger.exception("Attendance submission %s failed", submission.ticket)
+                    submission.status = AttendanceSubmission.FAILED
+                    submission.results = error_results(sessions, error)
+                else:
+                    submission.status = AttendanceSubmission.SAVED
+                    submission.results = json.dumps(results)
+                submission.processed_at = now
+            AttendanceSubmission.objects.bulk_update(submissions, ['status', 'results', 'processed_at', 'attempts', 'not_before'])
+    except OperationalError:
+        # The whole batch rolled back (e.g. the commit found the database
+        # locked): hand it back to the queue. Should this fail too, the claim
+        # times out.
+        AttendanceSubmission.objects.filter(claim=submissions[0].claim, status=AttendanceSubmission.PROCESSING).update(
+            status=AttendanceSubmission.PENDING, attempts=F('attempts') + 1, not_before=retry_at()
+        )
+        raise
+    return len(submissions)
+
+
+def submission_status(ticket, staff_id):
+    """
+    {"ticket", "status": "Pending"|"Processing"|"Saved"|"Failed", "sessions": [per session
+    results]} of one of the staff's submissions, or None if there's no such
+    ticket.
+    """
+    submission = AttendanceSubmission.objects.filter(ticket=ticket, staff_id=staff_id).values_list('status', 'results').first()
+    if submission is None:
+        return None
+    status, results = submission
+    return {
+        "ticket": str(ticket),
+        "status": dict(AttendanceSubmission.status_choices)[status],
+        "sessions": json.loads(results) if results else [],
+    }
+
+
+# Worker Thread
+# One per process, started by the first submission. Besides being woken by new
+# submissions it polls every ATTENDANCE_QUEUE_INTERVAL seconds, which picks up
+# submissions left pending by a restart and retries once their delay is over.
+
+class AttendanceQueueWorker(threading.Thread):
+
+    def __init__(self, interval):
+        super().__init__(name="attendance-queue", daemon=True)
+        self.interval = interval
+        self.wake = threading.Event()
+
+    def run(self):
+        while True:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            try:
+                while drain_attendance_queue():
+                    pass
+            except Exception:
+                logger.exception("Draining the attendance queue failed")
+            finally:
+                # The thread's connection isn't closed by request_finished
+                connection.close()
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def wake_attendance_worker():
+    global _worker
+    if not getattr(settings, 'ATTENDANCE_QUEUE_THREAD', True):
+        return
+    with _worker_lock:
+        if _worker is None:
+            _worker = AttendanceQueueWorker(getattr(settings, 'ATTENDANCE_QUEUE_INTERVAL', 5))
+            _worker.start()
+    _worker.wake.set()
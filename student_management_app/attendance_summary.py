@@ -0,0 +1,117 @@
+from collections import defaultdict
+from itertools import chain
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from .attendance_archive import count_archived_attendance
+from .attendance_bitmap import count_bitmap_attendance
+from .dashboard_cache import bump_dashboard_versions_on_commit
+from .models import Courses, AttendanceReport, AttendanceSummary
+
+
+# Attendance Summary
+# AttendanceSummary holds present/absent counters per (student, subject,
+# session year). Writers apply deltas here in the same transaction as the
+# AttendanceReport rows so the two never drift apart.
+
+
+def status_delta(status):
+    # (present, absent) change caused by adding one report with this status
+    return (1, 0) if status else (0, 1)
+
+
+def status_change_delta(old_status, new_status):
+    # (present, absent) change caused by flipping a report's status
+    if bool(old_status) == bool(new_status):
+        return (0, 0)
+    return (1, -1) if new_status else (-1, 1)
+
+
+def apply_attendance_deltas(subject_id, session_year_id, deltas):
+    """
+    Applies {student_id: (present_delta, absent_delta)} to the summary rows of
+    one subject and session year. Runs one INSERT for missing rows and one
+    UPDATE per distinct delta, regardless of how many students are affected.
+    """
+    deltas = {student_id: delta for student_id, delta in deltas.items() if delta != (0, 0)}
+    if not deltas:
+        return
+
+    with transaction.atomic():
+        summaries = AttendanceSummary.objects.filter(subject_id=subject_id, session_year_id=session_year_id)
+        existing = set(summaries.filter(student_id__in=deltas).values_list('student_id', flat=True))
+        AttendanceSummary.objects.bulk_create([
+            AttendanceSummary(student_id_id=student_id, subject_id_id=subject_id, session_year_id_id=session_year_id)
+            for student_id in deltas if student_id not in existing
+        ], ignore_conflicts=True)
+
+        students_by_delta = defaultdict(list)
+        for student_id, delta in deltas.items():
+            students_by_delta[delta].append(student_id)
+
+        for (present_delta, absent_delta), student_ids in students_by_delta.items():
+            summaries.filter(student_id__in=student_ids).update(
+                present_count=F('present_count') + present_delta,
+                absent_count=F('absent_count') + absent_delta,
+            )
+
+
+def count_attendance_reports():
+    # Recounts AttendanceReport (and the packed and archived sessions) from
+    # scratch: {(student_id, subject_id, session_year_id): (present, absent)}
+    rows = AttendanceReport.objects.values(
+        'student_id', 'attendance_id__subject_id', 'attendance_id__session_year_id'
+    ).annotate(
+        present=Count('id', filter=Q(status=True)),
+        absent=Count('id', filter=Q(status=False)),
+    ).order_by()
+    counts = {
+        (row['student_id'], row['attendance_id__subject_id'], row['attendance_id__session_year_id']): (row['present'], row['absent'])
+        for row in rows
+    }
+    for key, (present, absent) in chain(count_bitmap_attendance().items(), count_archived_attendance().items()):
+        row_present, row_absent = counts.get(key, (0, 0))
+        counts[key] = (row_present + present, row_absent + absent)
+    return counts
+
+
+def rebuild_attendance_summary(batch_size=1000):
+    """
+    Replaces every summary row with counts taken from AttendanceReport.
+    Returns the number of summary rows written.
+    """
+    with transaction.atomic():
+        # Counted in the same transaction as the rewrite: SQLite's read lock
+        # keeps saves from committing in between, they'd be lost otherwise
+        counts = count_attendance_reports()
+        AttendanceSummary.objects.all().delete()
+        AttendanceSummary.objects.bulk_create([
+            AttendanceSummary(student_id_id=student_id, subject_id_id=subject_id, session_year_id_id=session_year_id, present_count=present, absent_count=absent)
+            for (student_id, subject_id, session_year_id), (present, absent) in counts.items()
+        ], batch_size=batch_size)
+        # Every dashboard showing attendance counts may have changed
+        course_ids = Courses.objects.values_list('id', flat=True)
+        bump_dashboard_versions_on_commit("hod", *["%s:%s" % (scope, course_id) for course_id in course_ids for scope in ("course", "course_attendance")])
+    return len(counts)
+
+
+def find_attendance_summary_mismatches():
+    """
+    Compares the summary table with AttendanceReport and returns a list of
+    (key, expected, actual) tuples, where key is
+    (student_id, subject_id, session_year_id) and counts are (present, absent).
+    """
+    expected = count_attendance_reports()
+    actual = {
+        (row[0], row[1], row[2]): (row[3], row[4])
+        for row in AttendanceSummary.objects.values_list('student_id', 'subject_id', 'session_year_id', 'present_count', 'absent_count')
+    }
+
+    mismatches = []
+    for key in sorted(set(expected) | set(actual)):
+        expected_counts = expected.get(key, (0, 0))
+        actual_counts = actual.get(key, (0, 0))
+        if expected_counts != actual_counts:
+            mismatches.append((key, expected_counts, actual_counts))
+    return mismatches
@@ -0,0 +1,159 @@
+import base64
+import datetime
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .attendance_bitmap import unpack_marks, unpack_roster
+from .models import Students, Attendance, AttendanceReport, AttendanceBitmap, ArchivedAttendance, StudentResult, LeaveReportStudent, LeaveReportStaff
+
+
+# Change Feed
+# Rows modified after a cursor, for syncing a reporting warehouse without
+# re-exporting whole tables. Pages are keyset-paginated over
+# (updated_at, id): a cursor is the (updated_at, id) of the last row a client
+# has seen and the next page is read from the (updated_at, id) index of each
+# feed's table, so a page costs the same however far into the table it is.
+#
+# Rows younger than CHANGE_FEED_SETTLE_SECONDS are held back: updated_at is
+# stamped before the row is written, so a transaction committing late could
+# otherwise land behind a cursor that has already moved past it. Bulk
+# updates must set updated_at themselves (auto_now only applies to save()).
+# Deleted rows don't show up in the feed.
+#
+# A session's marks live in one of three places: attendance_reports rows,
+# an attendance_bitmaps row or, once its session year is archived, an
+# archived_attendance row (listed by archived_at, as it keeps the
+# timestamps of its Attendance row). Packed rows list their marks like
+# attendance_reports rows, [{"student_id", "status"}, ...]. The bulk moves
+# between them delete the source rows without a trace and write the
+# session anew at the destination:
+#   - convert_to_bitmaps: the session's reports are deleted, its marks
+#     appear in attendance_bitmaps
+#   - convert_to_rows: the bitmap is deleted, the marks appear as new
+#     attendance_reports rows (students deleted meanwhile are left out)
+#   - archive_sessions: the Attendance row, its reports and bitmap are
+#     deleted, the session appears in archived_attendance under its old
+#     attendance_id
+#   - restore_sessions: the archived row is deleted, the session appears in
+#     attendance and attendance_bitmaps again
+# So a consumer keeps, per session, the marks of whichever feed reported
+# the session last and drops what it held for it elsewhere.
+
+FEEDS = {
+    "students": Students,
+    "attendance": Attendance,
+    "attendance_reports": AttendanceReport,
+    "attendance_bitmaps": AttendanceBitmap,
+    "archived_attendance": ArchivedAttendance,
+    "results": StudentResult,
+    "student_leaves": LeaveReportStudent,
+    "staff_leaves": LeaveReportStaff,
+}
+
+# The column a feed is paginated over, when it isn't updated_at
+CHANGED_AT = {
+    ArchivedAttendance: "archived_at",
+}
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+
+def settle_seconds():
+    return getattr(settings, 'CHANGE_FEED_SETTLE_SECONDS', 60)
+
+
+def encode_cursor(updated_at, row_id):
+    return base64.urlsafe_b64encode(("%s,%d" % (updated_at.isoformat(), row_id)).encode()).decode()
+
+
+def decode_cursor(cursor):
+    # (updated_at, id) of a cursor; raises ValueError if it's malformed
+    try:
+        updated_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit(",", 1)
+        updated_at = parse_datetime(updated_at)
+        row_id = int(row_id)
+    except (ValueError, UnicodeError):
+        raise ValueError("Invalid cursor")
+    if updated_at is None:
+        raise ValueError("Invalid cursor")
+    return updated_at, row_id
+
+
+def since_cursor(since):
+    """
+    Cursor from which a feed yields every row modified at or after `since`
+    (an ISO 8601 date or datetime; naive values are in the current time
+    zone). Raises ValueError.
+    """
+    updated_at = parse_datetime(since)
+    if updated_at is None:
+        updated_at = datetime.datetime.combine(datetime.date.fromisoformat(since), datetime.time())
+    if timezone.is_naive(updated_at):
+        updated_at = timezone.make_aware(updated_at)
+    # Ids start at 1, so (since, 0) comes before every row stamped `since`
+    return encode_cursor(updated_at, 0)
+
+
+def changed_at(model):
+    return CHANGED_AT.get(model, "updated_at")
+
+
+def feed_fields(model):
+    # Every column; foreign keys as ids under the field's name
+    return [field.name for field in model._meta.concrete_fields]
+
+
+def feed_row(row):
+    # Packed sessions get their marks unpacked in place of roster and marks
+    if "roster" not in row:
+        return row
+    roster = unpack_roster(row.pop("roster")).tolist()
+    statuses = unpack_marks(row.pop("marks"), row["student_count"]).tolist()
+    row["marks"] = [{"student_id": student_id, "status": status} for student_id, status in zip(roster, statuses)]
+    return row
+
+
+def change_page(feed, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    One page of a feed's rows modified after `cursor` (None: from the
+    start), oldest first. Returns {"feed", "rows": [{column: value}, ...],
+    "next_cursor", "has_more"}; pass next_cursor back for the next page.
+    Raises KeyError for an unknown feed and ValueError for a bad cursor.
+    """
+    model = FEEDS[feed]
+    field = changed_at(model)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    changes = model.objects.filter(**{
+        field + "__lte": timezone.now() - datetime.timedelta(seconds=settle_seconds())
+    }).order_by(field, 'id').values(*feed_fields(model))
+    # One extra row tells whether there's another page
+    if cursor:
+        updated_at, row_id = decode_cursor(cursor)
+        # The rest of the rows stamped with the cursor's updated_at, then the
+        # later ones: each query is a single index seek, however many rows
+        # share a timestamp (bulk writes stamp thousands alike)
+        rows = list(changes.filter(**{field: updated_at, "id__gt": row_id})[:limit+1])
+        if len(rows) <= limit:
+            rows += changes.filter(**{field + "__gt": updated_at})[:limit+1-len(rows)]
+    else:
+        rows = list(changes[:limit+1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if rows:
+        cursor = encode_cursor(rows[-1][field], rows[-1]["id"])
+    return {"feed": feed, "rows": [feed_row(row) for row in rows], "next_cursor": cursor, "has_more": has_more}
+
+
+def iter_changes(feed, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    # Yields (row, cursor after that row) for every change after `cursor`, a page at a time
+    field = changed_at(FEEDS[feed])
+    while True:
+        page = change_page(feed, cursor, page_size)
+        for row in page["rows"]:
+            yield row, encode_cursor(row[field], row["id"])
+        if not page["has_more"]:
+            return
+        cursor = page["next_cursor"]
@@ -0,0 +1,142 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.db import transaction
+
+
+# Versioned Dashboard Cache
+# A cached dashboard context is stored under a key built from the role, the
+# user and the current version stamp of every "scope" the context depends on:
+#
+#   hod                       anything shown on the HOD dashboard
+#   staff:<user_id>           a staff member's own subjects and leaves
+#   student:<user_id>         a student's own attendance, results and leaves
+#   course:<course_id>        subjects and students enrolled in a course
+#   course_attendance:<id>    attendance taken for a course's subjects
+#
+# Writes bump only the scopes they touch (see the signals in models.py), which
+# changes the key of the dashboards that depend on them. Stale entries are
+# never read again and simply expire. Bumps are made once the write commits,
+# so a dashboard rebuilt meanwhile can't be cached from the data before it
+# under the new stamps.
+#
+# Version stamps live in the cache, so a bump only reaches the processes
+# sharing it. The shipped file cache is shared by the processes of one
+# machine. A LocMemCache is per process: bumps made by the import worker,
+# drain_attendance_queue, convert_attendance_storage, archive_session_years
+# or another web process wouldn't reach it, and its dashboards would stay
+# stale until they expire (DASHBOARD_CACHE_TIMEOUT); the check below warns
+# about it.
+
+VERSION_KEY_PREFIX = "dashboard:version:"
+STATS_KEY_PREFIX = "dashboard:stats:"
+
+
+def _cache():
+    return caches[getattr(settings, 'DASHBOARD_CACHE_ALIAS', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 300)
+
+
+def _new_stamp():
+    # Stamps are random so a version key that was evicted and recreated never
+    # matches a context cached under its old value.
+    return uuid.uuid4().hex
+
+
+def _increment(name):
+    cache = _cache()
+    key = STATS_KEY_PREFIX + name
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Key doesn't exist yet (or was evicted)
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def get_dashboard_versions(scopes):
+    """
+    Returns the current version stamp of each scope, creating missing ones.
+    """
+    cache = _cache()
+    keys = [VERSION_KEY_PREFIX + scope for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            stamp = _new_stamp()
+            if not cache.add(key, stamp, None):
+                # Another process created it first
+                stamp = cache.get(key, stamp)
+            versions[key] = stamp
+    return [versions[key] for key in keys]
+
+
+def bump_dashboard_versions(*scopes):
+    """
+    Invalidates every cached dashboard that depends on one of the scopes.
+    """
+    scopes = {scope for scope in scopes if scope}
+    if scopes:
+        _cache().set_many({VERSION_KEY_PREFIX + scope: _new_stamp() for scope in scopes}, None)
+
+
+def bump_dashboard_versions_on_commit(*scopes):
+    # Bumps the scopes once the current transaction commits (right away outside one)
+    transaction.on_commit(lambda: bump_dashboard_versions(*scopes))
+
+
+def get_cached_dashboard(role, user_id, scopes, build_context):
+    """
+    Returns the cached context for this role and user, calling build_context()
+    to rebuild it when any of the scopes changed since it was cached.
+    """
+    cache = _cache()
+    versions = get_dashboard_versions(scopes)
+    digest = hashlib.md5("|".join(scopes + versions).encode()).hexdigest()
+    key = "dashboard:%s:%s:%s" % (role, user_id, digest)
+
+    context = cache.get(key)
+    if context is not None:
+        _increment("hits")
+        return context
+
+    _increment("misses")
+    context = build_context()
+    cache.set(key, context, _timeout())
+    return context
+
+
+def dashboard_cache_stats():
+    cache = _cache()
+    stats = cache.get_many([STATS_KEY_PREFIX + "hits", STATS_KEY_PREFIX + "misses"])
+    return {
+        "hits": stats.get(STATS_KEY_PREFIX + "hits", 0),
+        "misses": stats.get(STATS_KEY_PREFIX + "misses", 0),
+    }
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_dashboard_cache(app_configs, **kwargs):
+    # The import worker and the attendance queue write from other processes
+    alias = getattr(settings, 'DASHBOARD_CACHE_ALIAS', 'default')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND', '')
+    features = [
+        name for name, enabled in (
+            ("IMPORT_JOB_AUTOSTART", getattr(settings, 'IMPORT_JOB_AUTOSTART', True)),
+            ("ATTENDANCE_WRITE_BEHIND", getattr(settings, 'ATTENDANCE_WRITE_BEHIND', False)),
+        ) if enabled
+    ]
+    if backend.endswith(".LocMemCache") and features:
+        return [checks.Warning(
+            "The dashboard cache (%s) is local to each process, but with %s other processes write too: "
+            "their changes won't refresh cached dashboards until they expire." % (alias, " and ".join(features)),
+            hint="Use a shared cache backend for CACHES[%r] (file, database, memcached, ...)." % alias,
+            id="student_management_app.W001",
+        )]
+    return []
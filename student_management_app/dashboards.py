@@ -0,0 +1,196 @@
+from django.db.models import Count, Sum
+
+from .models import Staffs, Courses, Subjects, Students, Attendance, ArchivedAttendance, AttendanceSummary, LeaveReportStudent, LeaveReportStaff
+
+
+# Dashboard Aggregation Layer
+# Every chart series is built from a fixed number of grouped queries, so the
+# number of queries stays the same no matter how many rows the tables hold.
+# Per-student present/absent counts come from AttendanceSummary rather than
+# AttendanceReport, so they don't grow with the attendance history.
+# Session counts include the sessions of archived years (attendance_archive.py).
+
+
+def _count_by(queryset, field):
+    # Returns {field_value: row_count} from a single GROUP BY query
+    rows = queryset.values(field).annotate(total=Count('id')).order_by()
+    return {row[field]: row['total'] for row in rows}
+
+
+def _count_sessions_by(field, **filters):
+    # Returns {field_value: session_count} over the live and archived sessions, in one UNION ALL query
+    counts = {}
+    live = Attendance.objects.filter(**filters).values(field).annotate(total=Count('id')).order_by()
+    archived = ArchivedAttendance.objects.filter(**filters).values(field).annotate(total=Count('id')).order_by()
+    for row in live.union(archived, all=True):
+        counts[row[field]] = counts.get(row[field], 0) + row['total']
+    return counts
+
+
+def hod_dashboard_context():
+    """
+    Builds the context used by hod_template/home_content.html.
+    """
+    # Total Subjects and students in Each Course
+    courses = list(Courses.objects.values_list('id', 'course_name').order_by('id'))
+    subjects = list(Subjects.objects.values_list('subject_name', 'course_id').order_by('id'))
+    subject_count_by_course = _count_by(Subjects.objects.all(), 'course_id')
+    student_count_by_course = _count_by(Students.objects.all(), 'course_id')
+
+    course_name_list = [course_name for course_id, course_name in courses]
+    subject_count_list = [subject_count_by_course.get(course_id, 0) for course_id, course_name in courses]
+    student_count_list_in_course = [student_count_by_course.get(course_id, 0) for course_id, course_name in courses]
+
+    subject_list = [subject_name for subject_name, course_id in subjects]
+    student_count_list_in_subject = [student_count_by_course.get(course_id, 0) for subject_name, course_id in subjects]
+
+    # For Staffs
+    staffs = list(Staffs.objects.values_list('id', 'admin_id', 'admin__first_name').order_by('id'))
+    attendance_by_staff = _count_sessions_by('subject_id__staff_id')
+    leave_by_staff = _count_by(LeaveReportStaff.objects.filter(leave_status=1), 'staff_id')
+
+    staff_attendance_present_list = [attendance_by_staff.get(admin_id, 0) for staff_id, admin_id, first_name in staffs]
+    staff_attendance_leave_list = [leave_by_staff.get(staff_id, 0) for staff_id, admin_id, first_name in staffs]
+    staff_name_list = [first_name for staff_id, admin_id, first_name in staffs]
+
+    # For Students
+    students = list(Students.objects.values_list('id', 'admin__first_name').order_by('id'))
+    attendance_by_student = {
+        row['student_id']: row
+        for row in AttendanceSummary.objects.values('student_id').annotate(
+            present=Sum('present_count'),
+            absent=Sum('absent_count'),
+        ).order_by()
+    }
+    leave_by_student = _count_by(LeaveReportStudent.objects.filter(leave_status=1), 'student_id')
+
+    student_attendance_present_list = []
+    student_attendance_leave_list = []
+    student_name_list = []
+    for student_id, first_name in students:
+        attendance = attendance_by_student.get(student_id, {})
+        student_attendance_present_list.append(attendance.get('present', 0))
+        student_attendance_leave_list.append(attendance.get('absent', 0) + leave_by_student.get(student_id, 0))
+        student_name_list.append(first_name)
+
+    return {
+        "all_student_count": len(students),
+        "subject_count": len(subjects),
+        "course_count": len(courses),
+        "staff_count": len(staffs),
+        "course_name_list": course_name_list,
+        "subject_count_list": subject_count_list,
+        "student_count_list_in_course": student_count_list_in_course,
+        "subject_list": subject_list,
+        "student_count_list_in_subject": student_count_list_in_subject,
+        "staff_attendance_present_list": staff_attendance_present_list,
+        "staff_attendance_leave_list": staff_attendance_leave_list,
+        "staff_name_list": staff_name_list,
+        "student_attendance_present_list": student_attendance_present_list,
+        "student_attendance_leave_list": student_attendance_leave_list,
+        "student_name_list": student_name_list,
+    }
+
+
+def staff_dashboard_context(user_id):
+    """
+    Builds the context used by staff_template/staff_home_template.html.
+    """
+    # Subjects taught by the Staff and the Courses they belong to
+    subjects = list(Subjects.objects.filter(staff_id=user_id).values_list('id', 'subject_name', 'course_id').order_by('id'))
+    course_ids = {course_id for subject_id, subject_name, course_id in subjects}
+
+    # Fetch Attendance Data by Subjects
+    attendance_by_subject = _count_sessions_by('subject_id', subject_id__in=[subject_id for subject_id, subject_name, course_id in subjects])
+    subject_list = [subject_name for subject_id, subject_name, course_id in subjects]
+    attendance_list = [attendance_by_subject.get(subject_id, 0) for subject_id, subject_name, course_id in subjects]
+
+    # Fetch All Approve Leave
+    leave_count = LeaveReportStaff.objects.filter(staff_id__admin=user_id, leave_status=1).count()
+
+    # Fetching All Students under Staff with their Attendance
+    students = list(Students.objects.filter(course_id__in=course_ids).values_list('id', 'admin__first_name', 'admin__last_name').order_by('id'))
+    attendance_by_student = {
+        row['student_id']: row
+        for row in AttendanceSummary.objects.filter(student_id__course_id__in=course_ids).values('student_id').annotate(
+            present=Sum('present_count'),
+            absent=Sum('absent_count'),
+        ).order_by()
+    }
+
+    student_list = []
+    student_list_attendance_present = []
+    student_list_attendance_absent = []
+    for student_id, first_name, last_name in students:
+        attendance = attendance_by_student.get(student_id, {})
+        student_list.append(first_name+" "+ last_name)
+        student_list_attendance_present.append(attendance.get('present', 0))
+        student_list_attendance_absent.append(attendance.get('absent', 0))
+
+    return {
+        "students_count": len(students),
+        "attendance_count": sum(attendance_list),
+        "leave_count": leave_count,
+        "subject_count": len(subjects),
+        "subject_list": subject_list,
+        "attendance_list": attendance_list,
+        "student_list": student_list,
+        "attendance_present_list": student_list_attendance_present,
+        "attendance_absent_list": student_list_attendance_absent
+    }
+
+
+def student_dashboard_context(student_id, course_id):
+    """
+    Builds the context used by student_template/student_home_template.html.
+    """
+    subjects = list(Subjects.objects.filter(course_id=course_id).values_list('id', 'subject_name').order_by('id'))
+
+    # Present/Absent count of the Student in every Subject, summed over Session Years in one grouped query
+    attendance_by_subject = {
+        row['subject_id']: row
+        for row in AttendanceSummary.objects.filter(student_id=student_id).values('subject_id').annotate(
+            present=Sum('present_count'),
+            absent=Sum('absent_count'),
+        ).order_by()
+    }
+    attendance_present = sum(row['present'] for row in attendance_by_subject.values())
+    attendance_absent = sum(row['absent'] for row in attendance_by_subject.values())
+
+    subject_name = []
+    data_present = []
+    data_absent = []
+    for subject_id, name in subjects:
+        attendance = attendance_by_subject.get(subject_id, {})
+        subject_name.append(name)
+        data_present.append(attendance.get('present', 0))
+        data_absent.append(attendance.get('absent', 0))
+
+    return {
+        "total_attendance": attendance_present + attendance_absent,
+        "attendance_present": attendance_present,
+        "attendance_absent": attendance_absent,
+        "total_subjects": len(subjects),
+        "subject_name": subject_name,
+        "data_present": data_present,
+        "data_absent": data_absent
+    }
+
+
+# Cache Scopes (see dashboard_cache.py)
+
+def hod_cache_scopes():
+    return ["hod"]
+
+
+def staff_cache_scopes(user_id):
+    course_ids = sorted(set(Subjects.objects.filter(staff_id=user_id).values_list('course_id', flat=True)))
+    return (
+        ["staff:%s" % user_id]
+        + ["course:%s" % course_id for course_id in course_ids]
+        + ["course_attendance:%s" % course_id for course_id in course_ids]
+    )
+
+
+def student_cache_scopes(user_id, course_id):
+    return ["student:%s" % user_id, "course:%s" % course_id]
@@ -0,0 +1,123 @@
+import csv
+import tempfile
+from wsgiref.util import FileWrapper
+
+from django.http import StreamingHttpResponse
+
+
+# Streaming Exports
+# Rows are written to the response as they come out of the database iterator,
+# so an export never holds the whole report in memory (Parquet holds one row
+# group at a time).
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+PARQUET_CONTENT_TYPE = "application/vnd.apache.parquet"
+PARQUET_ROW_GROUP_SIZE = 10000
+
+
+class Echo:
+    # File-like object whose write() hands the line back to csv.writer's caller
+    def write(self, value):
+        return value
+
+
+def csv_response(header, rows, filename):
+    writer = csv.writer(Echo())
+    lines = (writer.writerow(row) for row in _with_header(header, rows))
+    response = StreamingHttpResponse(lines, content_type="text/csv")
+    response["Content-Disposition"] = 'attachment; filename="%s.csv"' % filename
+    return response
+
+
+def xlsx_response(header, rows, filename):
+    # openpyxl's write-only mode streams rows into a temporary file instead of
+    # building the sheet in memory; the finished file is then streamed in chunks
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    for row in _with_header(header, rows):
+        sheet.append(row)
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+
+    response = StreamingHttpResponse(FileWrapper(output), content_type=XLSX_CONTENT_TYPE)
+    response["Content-Disposition"] = 'attachment; filename="%s.xlsx"' % filename
+    return response
+
+
+def parquet_response(header, rows, filename):
+    # Written a row group of PARQUET_ROW_GROUP_SIZE rows at a time to a
+    # temporary file, the column types taken from the first group
+    import pyarrow
+    import pyarrow.parquet
+
+    output = tempfile.TemporaryFile()
+    writer = None
+    for batch in _batches(rows, PARQUET_ROW_GROUP_SIZE):
+        columns = dict(zip(header, zip(*batch)))
+        if writer is None:
+            table = pyarrow.table(columns)
+            writer = pyarrow.parquet.ParquetWriter(output, table.schema)
+        else:
+            table = pyarrow.Table.from_pydict(columns, schema=writer.schema)
+        writer.write_table(table)
+    if writer is None:
+        # No rows: an empty file with the columns, typed as text
+        writer = pyarrow.parquet.ParquetWriter(output, pyarrow.schema([(name, pyarrow.string()) for name in header]))
+    writer.close()
+    output.seek(0)
+
+    response = StreamingHttpResponse(FileWrapper(output), content_type=PARQUET_CONTENT_TYPE)
+    response["Content-Disposition"] = 'attachment; filename="%s.parquet"' % filename
+    return response
+
+
+def export_response(export_format, header, rows, filename):
+    """
+    Streams `rows` (any iterable of tuples) as a CSV (default), XLSX or
+    Parquet attachment.
+    """
+    if export_format == "xlsx":
+        return xlsx_response(header, rows, filename)
+    if export_format == "parquet":
+        return parquet_response(header, rows, filename)
+    return csv_response(header, rows, filename)
+
+
+def _with_header(header, rows):
+    yield header
+    yield from rows
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# Results
+# Exam results in the export formats above, in (subject, student) order.
+
+RESULT_FIELDS = ["subject_id", "subject", "student_id", "student", "assignment_marks", "exam_marks", "status"]
+PASS_MARK = 40
+
+
+def result_rows(results):
+    """
+    Yields (subject_id, subject_name, admin_id, student name, assignment
+    marks, exam marks, "Pass"/"Fail") for a StudentResult queryset, from one
+    joined query read with .iterator().
+    """
+    rows = results.order_by('subject_id__subject_name', 'student_id__admin__first_name', 'id').values_list(
+        'subject_id', 'subject_id__subject_name', 'student_id__admin_id', 'student_id__admin__first_name', 'student_id__admin__last_name',
+        'subject_assignment_marks', 'subject_exam_marks'
+    ).iterator()
+    for subject_id, subject_name, admin_id, first_name, last_name, assignment_marks, exam_marks in rows:
+        yield subject_id, subject_name, admin_id, first_name+" "+last_name, assignment_marks, exam_marks, "Pass" if exam_marks >= PASS_MARK else "Fail"
@@ -0,0 +1,198 @@
+import datetime
+import json
+import logging
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ImportJob
+from .student_import import count_import_rows, import_students, read_import_rows
+
+
+# Background Import Jobs
+# Student imports are too slow to run inside a request (hashing the passwords
+# of 20,000 students takes minutes), so the upload is saved under
+# MEDIA_ROOT/imports and recorded as an ImportJob; the request returns the
+# job's id right away. Jobs are run oldest first by a separate worker process,
+# manage.py run_import_jobs, which is started on submit
+# (IMPORT_JOB_AUTOSTART) or run as a service with --loop. After each chunk
+# the worker records the rows processed, imported and failed, which the HOD
+# page polls through import_job_status, and checks whether the job was
+# cancelled. Chunks already imported when a job is cancelled stay imported.
+#
+# The progress writes double as the worker's heartbeat. A running job whose
+# heartbeat is older than IMPORT_JOB_STALE_SECONDS lost its worker (killed,
+# server restarted) and is marked failed by the next worker or status poll.
+#
+# The worker being another process, its imports only reach the cached
+# dashboards through a shared cache backend; with the default LocMemCache
+# they show once the cached pages expire (check student_management_app.W001).
+
+logger = logging.getLogger(__name__)
+
+IMPORT_UPLOAD_DIR = "imports"
+
+
+def import_storage():
+    return FileSystemStorage(location=os.path.join(settings.MEDIA_ROOT, IMPORT_UPLOAD_DIR))
+
+
+def submit_import_job(user_id, file):
+    """
+    Saves an uploaded import file and queues its import for `user_id`. Returns
+    the ImportJob.
+    """
+    file_name = import_storage().save(os.path.basename(file.name), file)
+    job = ImportJob.objects.create(created_by_id=user_id, file_name=file_name)
+    transaction.on_commit(start_import_worker)
+    return job
+
+
+def stale_import_jobs():
+    # Running jobs whose worker stopped writing progress
+    stale = timezone.now() - datetime.timedelta(seconds=getattr(settings, 'IMPORT_JOB_STALE_SECONDS', 600))
+    return ImportJob.objects.filter(status=ImportJob.RUNNING).filter(
+        Q(heartbeat_at__lt=stale) | Q(heartbeat_at__isnull=True, started_at__lt=stale)
+    )
+
+
+def fail_stale_import_jobs():
+    # Stale jobs are failed rather than run again: the chunks they imported
+    # stay imported, and a second run would report each of their rows as a
+    # duplicate. Returns the number of jobs failed.
+    failed = 0
+    for job_id, file_name in stale_import_jobs().values_list('id', 'file_name'):
+        if stale_import_jobs().filter(id=job_id).update(status=ImportJob.FAILED, error="The import worker stopped responding", finished_at=timezone.now()):
+            import_storage().delete(file_name)
+            failed += 1
+    return failed
+
+
+def claim_next_import_job():
+    # Oldest queued job, marked running. The conditional update lets several
+    # workers run side by side without taking the same job.
+    fail_stale_import_jobs()
+    for job in ImportJob.objects.filter(status=ImportJob.QUEUED).order_by('id')[:5]:
+        now = timezone.now()
+        if ImportJob.objects.filter(id=job.id, status=ImportJob.QUEUED).update(status=ImportJob.RUNNING, started_at=now, heartbeat_at=now):
+            job.status = ImportJob.RUNNING
+            return job
+    return None
+
+
+def run_import_job(job):
+    """
+    Imports the file of a claimed job, recording progress after each
+    chunk, and stores the outcome. Returns the job's final status.
+    """
+    storage = import_storage()
+    path = storage.path(job.file_name)
+
+    def progress(processed, imported, failed):
+        # Writing the counters also tells whether a cancel came in: a
+        # cancelled job, or one failed as stale, no longer matches
+        return bool(ImportJob.objects.filter(id=job.id, status=ImportJob.RUNNING, cancel_requested=False).update(
+            processed_rows=processed, imported_rows=imported, failed_rows=failed, heartbeat_at=timezone.now()
+        ))
+
+    fields = {}
+    try:
+        ImportJob.objects.filter(id=job.id).update(total_rows=count_import_rows(path))
+        result = import_students(read_import_rows(path), progress=progress)
+    except Exception as error:
+        logger.exception("Import job %s failed", job.id)
+        fields.update(status=ImportJob.FAILED, error=str(error))
+    else:
+        fields.update(
+            status=ImportJob.CANCELLED if result["stopped"] else ImportJob.DONE,
+            errors=json.dumps(result["errors"]),
+            processed_rows=result["processed"],
+            imported_rows=result["imported"],
+            failed_rows=result["failed"],
+        )
+        if not result["stopped"]:
+            # A workbook's dimension may have counted trailing blank rows
+            fields["total_rows"] = result["processed"]
+    fields["finished_at"] = timezone.now()
+    ImportJob.objects.filter(id=job.id, status=ImportJob.RUNNING).update(**fields)
+    storage.delete(job.file_name)
+    return fields["status"]
+
+
+def run_import_jobs():
+    # Runs queued jobs until there are none left, returns how many ran
+    count = 0
+    while True:
+        job = claim_next_import_job()
+        if job is None:
+            return count
+        run_import_job(job)
+        count += 1
+
+
+def request_import_job_cancel(job_id, user_id):
+    """
+    Cancels a queued or running job of `user_id`: a queued job won't start,
+    a running one stops after its current chunk. Returns False if there's no
+    such job or it has already finished.
+    """
+    jobs = ImportJob.objects.filter(id=job_id, created_by=user_id)
+    file_name = jobs.values_list('file_name', flat=True).first()
+    if file_name is None:
+        return False
+    if jobs.filter(status=ImportJob.QUEUED).update(status=ImportJob.CANCELLED, cancel_requested=True, finished_at=timezone.now()):
+        import_storage().delete(file_name)
+        return True
+    return bool(jobs.filter(status=ImportJob.RUNNING).update(cancel_requested=True))
+
+
+def import_job_progress(job_id, user_id):
+    """
+    Progress of one of the user's jobs: {"job_id", "status",
+    "cancel_requested", "total", "processed", "remaining", "imported",
+    "failed", "errors", "error"}, or None if there's no such job. The row errors come with the finished job.
+    """
+    job = ImportJob.objects.filter(id=job_id, created_by=user_id).first()
+    if job is None:
+        return None
+    if job.status == ImportJob.RUNNING and stale_import_jobs().filter(id=job.id).exists():
+        # No worker may be left to notice
+        fail_stale_import_jobs()
+        job.refresh_from_db()
+    return {
+        "job_id": job.id,
+        "status": dict(ImportJob.status_choices)[job.status],
+        "cancel_requested": job.cancel_requested,
+        "total": job.total_rows,
+        "processed": job.processed_rows,
+        "remaining": None if job.total_rows is None else max(job.total_rows - job.processed_rows, 0),
+        "imported": job.imported_rows,
+        "failed": job.failed_rows,
+        "errors": json.loads(job.errors) if job.errors else [],
+        "error": job.error,
+    }
+
+
+# Worker Process
+# Submitting a job starts `manage.py run_import_jobs` in its own session, so it
+# outlives the request and the web worker; it exits once the queue is empty. A
+# second worker started meanwhile finds nothing to claim and exits too. With
+# IMPORT_JOB_AUTOSTART = False run `manage.py run_import_jobs --loop` instead.
+
+def start_import_worker():
+    if not getattr(settings, 'IMPORT_JOB_AUTOSTART', True):
+        return
+    manage_py = os.path.join(settings.BASE_DIR, "manage.py")
+    subprocess.Popen(
+        [sys.executable, manage_py, "run_import_jobs"],
+        cwd=settings.BASE_DIR,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        start_new_session=True,
+    )
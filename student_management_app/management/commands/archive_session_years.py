@@ -0,0 +1,48 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from student_management_app.attendance_archive import archive_session_year, closed_session_years, restore_session_year
+from student_management_app.models import SessionYearModel
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves the attendance of closed session years from Attendance, AttendanceReport and AttendanceBitmap into "
+        "ArchivedAttendance, a batch of sessions per transaction. Summaries stay online and the attendance pages keep "
+        "reading archived years. Run it after a session year ends, e.g. from cron: 0 3 1 * * python manage.py archive_session_years"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--session-year', type=int, action='append', help="Session Year id (repeatable). Defaults to every session year that ended before --date.")
+        parser.add_argument('--date', help="Archive the session years that ended before this day (YYYY-MM-DD) instead of today.")
+        parser.add_argument('--restore', action='store_true', help="Move the given session years back into the live tables.")
+        parser.add_argument('--batch-size', type=int, default=200, help="Sessions per transaction.")
+
+    def handle(self, *args, **options):
+        if options['restore']:
+            if not options['session_year']:
+                raise CommandError("--restore needs --session-year")
+            session_years = SessionYearModel.objects.filter(id__in=options['session_year'])
+            move, verb = restore_session_year, "Restored"
+        else:
+            try:
+                today = datetime.datetime.strptime(options['date'], '%Y-%m-%d').date() if options['date'] else timezone.now().date()
+            except ValueError:
+                raise CommandError("--date must be YYYY-MM-DD")
+            session_years = closed_session_years(today)
+            if options['session_year']:
+                session_years = session_years.filter(id__in=options['session_year'])
+            move, verb = archive_session_year, "Archived"
+
+        session_years = list(session_years.order_by('id'))
+        for session_year in session_years:
+            start = time.perf_counter()
+            moved = move(session_year, options['batch_size'])
+            self.stdout.write(
+                "Session year %s (%s to %s): %s %d sessions in %.2fs"
+                % (session_year.id, session_year.session_start_year, session_year.session_end_year, verb.lower(), moved, time.perf_counter() - start)
+            )
+        self.stdout.write(self.style.SUCCESS("%s attendance of %d session years." % (verb, len(session_years))))
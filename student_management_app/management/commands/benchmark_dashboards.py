@@ -0,0 +1,139 @@
+import json
+import math
+import platform
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from student_management_app.models import CustomUser, Subjects, Students, SessionYearModel, Attendance
+
+
+class QueryCounter:
+    # Execute wrapper counting queries; unlike CaptureQueriesContext it has no 9000 query cap
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def benchmark_endpoints():
+    # (url name, user, method, data) for the busiest HOD, staff and student
+    endpoints = []
+    hod = CustomUser.objects.filter(user_type=CustomUser.HOD).first()
+    if hod:
+        endpoints.append(("admin_home", hod, "get", {}))
+
+    subject = Subjects.objects.select_related('staff_id').order_by('-id').first()
+    session_year = SessionYearModel.objects.order_by('-id').first()
+    attendance = Attendance.objects.filter(subject_id=subject).order_by('-id').first() if subject else None
+    if subject and session_year and attendance:
+        endpoints += [
+            ("staff_home", subject.staff_id, "get", {}),
+            ("get_students", subject.staff_id, "post", {"subject": subject.id, "session_year": session_year.id}),
+            ("get_attendance_dates", subject.staff_id, "post", {"subject": subject.id, "session_year_id": session_year.id}),
+            ("get_attendance_student", subject.staff_id, "post", {"attendance_date": attendance.id}),
+        ]
+        if hod:
+            endpoints += [
+                ("admin_get_attendance_dates", hod, "post", {"subject": subject.id, "session_year_id": session_year.id}),
+                ("admin_get_attendance_student", hod, "post", {"attendance_date": attendance.id}),
+            ]
+
+        roster = list(Students.objects.filter(course_id=subject.course_id_id).values_list('admin_id', flat=True))
+        marks = json.dumps([{"id": admin_id, "status": i % 2} for i, admin_id in enumerate(roster)])
+        endpoints += [
+            ("save_attendance_data", subject.staff_id, "post", {"student_ids": marks, "subject_id": subject.id, "attendance_date": str(timezone.now().date()), "session_year_id": session_year.id}),
+            ("update_attendance_data", subject.staff_id, "post", {"student_ids": marks, "attendance_date": attendance.id}),
+        ]
+
+        student = Students.objects.filter(course_id=subject.course_id_id).select_related('admin').first()
+        if student:
+            endpoints += [
+                ("student_home", student.admin, "get", {}),
+                ("student_view_attendance_post", student.admin, "post", {"subject": subject.id, "start_date": str(session_year.session_start_year), "end_date": str(session_year.session_end_year)}),
+            ]
+    return endpoints
+
+
+def percentile(sorted_values, percent):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(percent / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Command(BaseCommand):
+    help = "Times every dashboard and AJAX endpoint through the Django test client and writes latency percentiles and query counts as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warm', action='store_true', help="Keep the dashboard cache between requests instead of clearing it.")
+        parser.add_argument('--output', default='benchmark.json')
+        parser.add_argument('--only', nargs='*', help="Only run these URL names.")
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError("--iterations must be at least 1.")
+        endpoints = benchmark_endpoints()
+        if options['only']:
+            endpoints = [endpoint for endpoint in endpoints if endpoint[0] in options['only']]
+        if not endpoints:
+            raise CommandError("Nothing to benchmark, generate some data first (manage.py generate_dataset).")
+
+        results = {}
+        for name, user, method, data in endpoints:
+            client = Client(HTTP_HOST='localhost')
+            client.force_login(user)
+            results[name] = self.run(client, name, method, data, options['iterations'], options['warm'])
+            self.stdout.write("%-32s p50 %8.1fms  p95 %8.1fms  queries %d" % (name, results[name]['p50_ms'], results[name]['p95_ms'], results[name]['queries']))
+
+        report = {
+            "created_at": timezone.now().isoformat(),
+            "iterations": options['iterations'],
+            "warm_cache": options['warm'],
+            "database": connection.vendor,
+            "python": platform.python_version(),
+            "endpoints": results,
+        }
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, indent=2)
+        self.stdout.write(self.style.SUCCESS("Wrote %s" % options['output']))
+
+    def run(self, client, name, method, data, iterations, warm):
+        url = reverse(name)
+        timings = []
+        queries = 0
+        status_code = None
+        for i in range(iterations):
+            if not warm:
+                cache.clear()
+            counter = QueryCounter()
+            # Writes are rolled back so every iteration sees the same data
+            with transaction.atomic(), connection.execute_wrapper(counter):
+                started = time.perf_counter()
+                response = getattr(client, method)(url, data)
+                timings.append((time.perf_counter() - started) * 1000)
+                transaction.set_rollback(True)
+            queries = max(queries, counter.count)
+            status_code = response.status_code
+            response_size = len(response.content) if not response.streaming else None
+
+        timings.sort()
+        return {
+            "p50_ms": percentile(timings, 50),
+            "p95_ms": percentile(timings, 95),
+            "min_ms": timings[0],
+            "max_ms": timings[-1],
+            "queries": queries,
+            "status_code": status_code,
+            "response_bytes": response_size,
+        }
@@ -0,0 +1,34 @@
+import time
+
+from django.contrib.auth.hashers import check_password, get_hasher
+from django.core.management.base import BaseCommand, CommandError
+
+from student_management_app.password_hashing import PasswordHashingPool, password_hashing_workers
+
+
+class Command(BaseCommand):
+    help = "Measures bulk password hashing throughput for each number of worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=64, help="Passwords hashed per run.")
+        parser.add_argument('--workers', type=int, nargs='+', help="Worker counts to try (default: 1, 2, 4, ... up to the available cores).")
+
+    def handle(self, *args, **options):
+        cores = password_hashing_workers()
+        worker_counts = options['workers'] or sorted({1, cores} | {2 ** i for i in range(1, 8) if 2 ** i < cores})
+        passwords = ["password%d" % i for i in range(options['count'])]
+        self.stdout.write("%s, %d passwords, %d available cores" % (get_hasher().algorithm, len(passwords), cores))
+        self.stdout.write("%8s %10s %12s %8s" % ("workers", "seconds", "hashes/s", "speedup"))
+
+        baseline = None
+        for workers in worker_counts:
+            # Includes starting the pool, as a bulk import pays for it too
+            start = time.perf_counter()
+            with PasswordHashingPool(workers) as pool:
+                hashes = pool.hash(passwords)
+            elapsed = time.perf_counter() - start
+
+            if not check_password(passwords[-1], hashes[-1]):
+                raise CommandError("Hashes came back out of order with %d workers." % workers)
+            baseline = baseline or elapsed
+            self.stdout.write("%8d %10.2f %12.1f %7.2fx" % (workers, elapsed, len(passwords) / elapsed, baseline / elapsed))
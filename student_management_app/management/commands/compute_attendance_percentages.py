@@ -0,0 +1,46 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from student_management_app.attendance_analytics import attendance_threshold, attendance_window_days, current_session_years, refresh_attendance_percentages
+from student_management_app.models import SessionYearModel
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the stored attendance percentages (last N days and whole session) and flags students below the "
+        "attendance threshold. Run it daily, e.g. from cron: 0 2 * * * python manage.py compute_attendance_percentages"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--session-year', type=int, action='append', help="Session Year id (repeatable). Defaults to the running session years.")
+        parser.add_argument('--all', action='store_true', help="Every session year, each as of its last day at the latest.")
+        parser.add_argument('--date', help="Compute as of this day (YYYY-MM-DD) instead of today.")
+        parser.add_argument('--window-days', type=int, help="Length of the recent window (default ATTENDANCE_WINDOW_DAYS).")
+        parser.add_argument('--threshold', type=float, help="Minimum percentage (default ATTENDANCE_THRESHOLD).")
+
+    def handle(self, *args, **options):
+        try:
+            as_of = datetime.datetime.strptime(options['date'], '%Y-%m-%d').date() if options['date'] else timezone.now().date()
+        except ValueError:
+            raise CommandError("--date must be YYYY-MM-DD")
+
+        if options['all']:
+            session_years = SessionYearModel.objects.all()
+        elif options['session_year']:
+            session_years = SessionYearModel.objects.filter(id__in=options['session_year'])
+        else:
+            session_years = current_session_years(as_of)
+
+        window_days = options['window_days'] or attendance_window_days()
+        threshold = attendance_threshold() if options['threshold'] is None else options['threshold']
+        for session_year in session_years.order_by('id'):
+            start = time.perf_counter()
+            stored, flagged = refresh_attendance_percentages(session_year, min(as_of, session_year.session_end_year), window_days, threshold)
+            self.stdout.write(
+                "Session year %s (%s to %s): %d students/subjects, %d below %s%% in %.2fs"
+                % (session_year.id, session_year.session_start_year, session_year.session_end_year, stored, flagged, threshold, time.perf_counter() - start)
+            )
+        self.stdout.write(self.style.SUCCESS("Attendance percentages computed as of %s." % as_of))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from student_management_app.attendance_bitmap import convert_to_bitmaps, convert_to_rows
+from student_management_app.models import Attendance, AttendanceReport, AttendanceBitmap
+
+
+class Command(BaseCommand):
+    help = "Moves Attendance sessions between AttendanceReport rows and packed AttendanceBitmaps, a batch of sessions per transaction."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--to', choices=['bitmap', 'rows'], required=True)
+        parser.add_argument('--subject', type=int, help="Only sessions of this Subject id.")
+        parser.add_argument('--session-year', type=int, help="Only sessions of this Session Year id.")
+        parser.add_argument('--before', help="Only sessions taken before this date (YYYY-MM-DD).")
+        parser.add_argument('--batch-size', type=int, default=200, help="Sessions per transaction.")
+
+    def handle(self, *args, **options):
+        sessions = Attendance.objects.all()
+        if options['subject']:
+            sessions = sessions.filter(subject_id=options['subject'])
+        if options['session_year']:
+            sessions = sessions.filter(session_year_id=options['session_year'])
+        if options['before']:
+            sessions = sessions.filter(attendance_date__lt=options['before'])
+
+        if options['to'] == 'bitmap':
+            sessions = sessions.filter(id__in=AttendanceReport.objects.values('attendance_id'))
+            convert = convert_to_bitmaps
+        else:
+            sessions = sessions.filter(id__in=AttendanceBitmap.objects.values('attendance_id'))
+            convert = convert_to_rows
+
+        attendance_ids = list(sessions.order_by('id').values_list('id', flat=True))
+        converted = 0
+        for start in range(0, len(attendance_ids), options['batch_size']):
+            converted += convert(attendance_ids[start:start+options['batch_size']])
+            self.stdout.write("%d/%d sessions" % (converted, len(attendance_ids)))
+        self.stdout.write(self.style.SUCCESS("Converted %d sessions to %s." % (converted, options['to'])))
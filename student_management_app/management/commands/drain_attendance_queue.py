@@ -0,0 +1,40 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+
+from student_management_app.attendance_queue import drain_attendance_queue
+
+
+class Command(BaseCommand):
+    help = (
+        "Saves the attendance submissions queued in write-behind mode (ATTENDANCE_WRITE_BEHIND), a batch per transaction. "
+        "Use --loop to run it as the queue worker process with ATTENDANCE_QUEUE_THREAD = False."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Keep draining, polling every --interval seconds.")
+        parser.add_argument('--interval', type=float, default=getattr(settings, 'ATTENDANCE_QUEUE_INTERVAL', 5))
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'ATTENDANCE_QUEUE_BATCH_SIZE', 50), help="Submissions per transaction.")
+
+    def handle(self, *args, **options):
+        while True:
+            drained = 0
+            try:
+                while True:
+                    processed = drain_attendance_queue(options['batch_size'])
+                    if not processed:
+                        break
+                    drained += processed
+            except OperationalError as error:
+                # The batch went back in the queue, try again next round
+                if not options['loop']:
+                    raise
+                self.stderr.write("Draining stopped: %s" % error)
+            if drained:
+                self.stdout.write("Saved %d queued submissions." % drained)
+            if not options['loop']:
+                break
+            connection.close()
+            time.sleep(options['interval'])
@@ -0,0 +1,100 @@
+import re
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.urls import reverse
+
+from student_management_app.middleware import query_shape
+from .benchmark_dashboards import benchmark_endpoints
+
+
+SQLITE_SCAN_RE = re.compile(r"^SCAN (?:TABLE )?(\S+)")
+POSTGRES_SCAN_RE = re.compile(r"Seq Scan on (\S+)")
+
+
+class SelectRecorder:
+    # Execute wrapper keeping the first SQL and parameters of every SELECT shape
+
+    def __init__(self):
+        self.queries = {}
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip().upper().startswith("SELECT"):
+            self.count += 1
+            self.queries.setdefault(query_shape(sql), (sql, params))
+        return execute(sql, params, many, context)
+
+
+def explain(sql, params):
+    """
+    Returns (plan lines, tables read with a full scan) for one query on the
+    default database.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            plan = [row[-1] for row in cursor.fetchall()]
+            # "SCAN t USING (COVERING) INDEX" walks an index, plain "SCAN t" reads every row
+            scans = [SQLITE_SCAN_RE.match(line).group(1) for line in plan if SQLITE_SCAN_RE.match(line) and "INDEX" not in line]
+        elif connection.vendor == 'postgresql':
+            cursor.execute("EXPLAIN " + sql, params)
+            plan = [row[0] for row in cursor.fetchall()]
+            scans = [match.group(1) for line in plan for match in POSTGRES_SCAN_RE.finditer(line)]
+        elif connection.vendor == 'mysql':
+            cursor.execute("EXPLAIN " + sql, params)
+            columns = [column[0] for column in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            plan = ["%s: type=%s key=%s rows=%s" % (row['table'], row['type'], row['key'], row['rows']) for row in rows]
+            scans = [row['table'] for row in rows if row['type'] == 'ALL']
+        else:
+            raise CommandError("EXPLAIN isn't supported for %s." % connection.vendor)
+    return plan, scans
+
+
+class Command(BaseCommand):
+    help = "Runs EXPLAIN on every SELECT behind the dashboard and attendance endpoints and flags full table scans."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', nargs='*', help="Only explain these URL names.")
+        parser.add_argument('--all', action='store_true', help="Print every query plan, not only the ones with full scans.")
+        parser.add_argument('--fail-on-scan', action='store_true', help="Exit with an error if any full scan is found.")
+
+    def handle(self, *args, **options):
+        endpoints = benchmark_endpoints()
+        if options['only']:
+            endpoints = [endpoint for endpoint in endpoints if endpoint[0] in options['only']]
+        if not endpoints:
+            raise CommandError("Nothing to explain, generate some data first (manage.py generate_dataset).")
+
+        flagged = 0
+        for name, user, method, data in endpoints:
+            recorder = self.record(name, user, method, data)
+            self.stdout.write(self.style.MIGRATE_HEADING("%s: %d SELECTs, %d distinct" % (name, recorder.count, len(recorder.queries))))
+            for shape, (sql, params) in recorder.queries.items():
+                plan, scans = explain(sql, params)
+                if scans:
+                    flagged += 1
+                    self.stdout.write(self.style.WARNING("  FULL SCAN of %s" % ", ".join(scans)))
+                elif not options['all']:
+                    continue
+                self.stdout.write("    %s" % shape[:300])
+                for line in plan:
+                    self.stdout.write("      %s" % line)
+
+        if flagged and options['fail_on_scan']:
+            raise CommandError("%d queries read a whole table." % flagged)
+        self.stdout.write(self.style.SUCCESS("%d queries with full table scans." % flagged))
+
+    def record(self, name, user, method, data):
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(user)
+        cache.clear()
+        recorder = SelectRecorder()
+        # Writes are rolled back, only the statements are kept
+        with transaction.atomic(), connection.execute_wrapper(recorder):
+            getattr(client, method)(reverse(name), data)
+            transaction.set_rollback(True)
+        return recorder
@@ -0,0 +1,134 @@
+import datetime
+import itertools
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from student_management_app.attendance_summary import rebuild_attendance_summary
+from student_management_app.dashboard_cache import bump_dashboard_versions_on_commit
+from student_management_app.models import CustomUser, Staffs, Courses, Subjects, Students, SessionYearModel, Attendance, AttendanceReport, LeaveReportStudent, LeaveReportStaff, StudentResult
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = "Generates a synthetic dataset (courses, subjects, staff, students, attendance and results) with bulk inserts."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--courses', type=int, default=10)
+        parser.add_argument('--subjects', type=int, default=5, help="Subjects per course.")
+        parser.add_argument('--staff', type=int, default=20)
+        parser.add_argument('--students', type=int, default=4000)
+        parser.add_argument('--days', type=int, default=50, help="Days of attendance taken for every subject.")
+        parser.add_argument('--present-rate', type=float, default=0.8)
+        parser.add_argument('--no-results', action='store_true', help="Don't generate StudentResult rows.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--prefix', default=None, help="Username prefix, defaults to a unique run tag.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        prefix = options['prefix'] or "gen%d" % int(time.time())
+        batch_size = options['batch_size']
+        started = time.perf_counter()
+
+        with transaction.atomic():
+            session_year = SessionYearModel.objects.create(session_start_year=datetime.date(2021, 1, 1), session_end_year=datetime.date(2021, 12, 31))
+
+            # Courses
+            Courses.objects.bulk_create([Courses(course_name="%s Course %d" % (prefix, i)) for i in range(options['courses'])], batch_size=batch_size)
+            course_ids = list(Courses.objects.filter(course_name__startswith=prefix+" Course ").order_by('id').values_list('id', flat=True))
+
+            # Users share one password hash, hashing each of them would dominate the run
+            password = make_password("password")
+            staff_ids = self.create_users(prefix, "staff", options['staff'], CustomUser.STAFF, password, batch_size)
+            Staffs.objects.bulk_create([Staffs(admin_id=user_id, address="") for user_id in staff_ids], batch_size=batch_size)
+
+            student_user_ids = self.create_users(prefix, "student", options['students'], CustomUser.STUDENT, password, batch_size)
+            Students.objects.bulk_create([
+                Students(admin_id=user_id, gender=rng.choice(["Male", "Female"]), profile_pic="", address="", course_id_id=course_ids[i % len(course_ids)], session_year_id=session_year)
+                for i, user_id in enumerate(student_user_ids)
+            ], batch_size=batch_size)
+            students_by_course = {}
+            for student_id, course_id in Students.objects.filter(admin_id__in=student_user_ids).values_list('id', 'course_id').order_by('id'):
+                students_by_course.setdefault(course_id, []).append(student_id)
+
+            # Subjects
+            Subjects.objects.bulk_create([
+                Subjects(subject_name="%s Subject %d.%d" % (prefix, course_index, i), course_id_id=course_id, staff_id_id=staff_ids[(course_index*options['subjects']+i) % len(staff_ids)])
+                for course_index, course_id in enumerate(course_ids) for i in range(options['subjects'])
+            ], batch_size=batch_size)
+            subjects = list(Subjects.objects.filter(course_id__in=course_ids).values_list('id', 'course_id').order_by('id'))
+
+            # Attendance, one session per subject and day
+            dates = [session_year.session_start_year + datetime.timedelta(days=day) for day in range(options['days'])]
+            Attendance.objects.bulk_create([
+                Attendance(subject_id_id=subject_id, attendance_date=date, session_year_id=session_year)
+                for subject_id, course_id in subjects for date in dates
+            ], batch_size=batch_size)
+            course_by_subject = dict(subjects)
+            attendance_rows = list(Attendance.objects.filter(session_year_id=session_year).values_list('id', 'subject_id').order_by('id'))
+
+            report_count = self.create_attendance_reports(attendance_rows, course_by_subject, students_by_course, options['present_rate'], rng, batch_size)
+
+            if not options['no_results']:
+                StudentResult.objects.bulk_create([
+                    StudentResult(student_id_id=student_id, subject_id_id=subject_id, subject_exam_marks=rng.randint(0, 70), subject_assignment_marks=rng.randint(0, 30))
+                    for subject_id, course_id in subjects for student_id in students_by_course.get(course_id, [])
+                ], batch_size=batch_size)
+
+            # A few leaves so every dashboard series has data
+            LeaveReportStudent.objects.bulk_create([
+                LeaveReportStudent(student_id_id=student_id, leave_date=str(rng.choice(dates)), leave_message="Generated", leave_status=rng.choice([0, 1, 2]))
+                for student_ids in students_by_course.values() for student_id in student_ids[::20]
+            ], batch_size=batch_size)
+            LeaveReportStaff.objects.bulk_create([
+                LeaveReportStaff(staff_id=staff, leave_date=str(rng.choice(dates)), leave_message="Generated", leave_status=rng.choice([0, 1, 2]))
+                for staff in Staffs.objects.filter(admin_id__in=staff_ids)
+            ], batch_size=batch_size)
+
+            rebuild_attendance_summary(batch_size=batch_size)
+            bump_dashboard_versions_on_commit("hod")
+
+        self.stdout.write(self.style.SUCCESS(
+            "Generated %d courses, %d subjects, %d staff, %d students, %d attendance sessions and %d attendance reports in %.1fs (prefix %s)."
+            % (len(course_ids), len(subjects), len(staff_ids), len(student_user_ids), len(subjects)*len(dates), report_count, time.perf_counter()-started, prefix)
+        ))
+
+    def create_users(self, prefix, label, count, user_type, password, batch_size):
+        # SQLite doesn't return ids from bulk inserts, so they are read back by username
+        username_prefix = "%s_%s_" % (prefix, label)
+        CustomUser.objects.bulk_create([
+            CustomUser(username="%s%d" % (username_prefix, i), email="%s%d@example.com" % (username_prefix, i), password=password, first_name="%s%d" % (label.title(), i), last_name=prefix, user_type=user_type)
+            for i in range(count)
+        ], batch_size=batch_size)
+        return list(CustomUser.objects.filter(username__startswith=username_prefix).order_by('id').values_list('id', flat=True))
+
+    def create_attendance_reports(self, attendance_rows, course_by_subject, students_by_course, present_rate, rng, batch_size):
+        # This is by far the largest table, so rows go straight to executemany()
+        # instead of through model instances.
+        now = connection.ops.adapt_datetimefield_value(datetime.datetime.now(datetime.timezone.utc))
+        rows = (
+            (student_id, attendance_id, rng.random() < present_rate, now, now)
+            for attendance_id, subject_id in attendance_rows
+            for student_id in students_by_course.get(course_by_subject[subject_id], [])
+        )
+        table = AttendanceReport._meta.db_table
+        sql = "INSERT INTO %s (student_id_id, attendance_id_id, status, created_at, updated_at) VALUES (%%s, %%s, %%s, %%s, %%s)" % connection.ops.quote_name(table)
+
+        total = 0
+        with connection.cursor() as cursor:
+            for chunk in chunked(rows, batch_size):
+                cursor.executemany(sql, chunk)
+                total += len(chunk)
+        return total
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from student_management_app.attendance_summary import rebuild_attendance_summary, find_attendance_summary_mismatches
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the AttendanceSummary table from AttendanceReport and checks it against the raw rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help="Only compare the summary with AttendanceReport, don't rebuild it.")
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            total = rebuild_attendance_summary()
+            self.stdout.write("Rebuilt %d summary rows." % total)
+
+        mismatches = find_attendance_summary_mismatches()
+        for (student_id, subject_id, session_year_id), expected, actual in mismatches[:20]:
+            self.stderr.write(
+                "student=%s subject=%s session_year=%s expected present/absent=%s/%s found %s/%s"
+                % (student_id, subject_id, session_year_id, expected[0], expected[1], actual[0], actual[1])
+            )
+        if mismatches:
+            raise CommandError("%d summary rows don't match AttendanceReport." % len(mismatches))
+        self.stdout.write(self.style.SUCCESS("Attendance summary matches AttendanceReport."))
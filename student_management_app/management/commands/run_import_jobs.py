@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from student_management_app.import_jobs import run_import_jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs the queued student import jobs, oldest first, and exits when none are left. "
+        "Started on each upload unless IMPORT_JOB_AUTOSTART = False; then run it with --loop as a service."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Keep running, polling every --interval seconds.")
+        parser.add_argument('--interval', type=float, default=5)
+
+    def handle(self, *args, **options):
+        while True:
+            count = run_import_jobs()
+            if count:
+                self.stdout.write("Ran %d import jobs." % count)
+            if not options['loop']:
+                break
+            connection.close()
+            time.sleep(options['interval'])
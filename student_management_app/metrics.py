@@ -0,0 +1,104 @@
+import threading
+from bisect import bisect_left
+
+from .dashboard_cache import dashboard_cache_stats
+
+
+# Request Metrics
+# Histograms kept in memory by MetricsMiddleware, per URL name and method, and
+# rendered in the Prometheus text format by the /metrics view. Each process
+# keeps its own numbers, so scrape every worker (or run a single one).
+
+METRIC_PREFIX = "student_management_"
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.total = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += 1
+        self.sum += value
+
+    def cumulative_counts(self):
+        running = 0
+        for count in self.counts:
+            running += count
+            yield running
+
+
+class MetricsRegistry:
+
+    HISTOGRAMS = (
+        ("request_duration_seconds", "Time spent handling the request.", DURATION_BUCKETS),
+        ("request_sql_queries", "SQL queries run while handling the request.", QUERY_COUNT_BUCKETS),
+        ("request_sql_duration_seconds", "Time spent in SQL queries while handling the request.", DURATION_BUCKETS),
+        ("response_size_bytes", "Size of the response body.", SIZE_BUCKETS),
+    )
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+
+    def observe(self, view, method, duration, sql_queries, sql_duration, response_size):
+        values = (duration, sql_queries, sql_duration, response_size)
+        with self.lock:
+            for (name, help_text, buckets), value in zip(self.HISTOGRAMS, values):
+                if value is None:
+                    continue
+                key = (name, view, method)
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram(buckets)
+                self.histograms[key].observe(value)
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+
+    def render(self):
+        """
+        Returns every metric in the Prometheus text exposition format.
+        """
+        lines = []
+        with self.lock:
+            for name, help_text, buckets in self.HISTOGRAMS:
+                metric = METRIC_PREFIX + name
+                lines.append("# HELP %s %s" % (metric, help_text))
+                lines.append("# TYPE %s histogram" % metric)
+                for (key_name, view, method), histogram in sorted(self.histograms.items()):
+                    if key_name != name:
+                        continue
+                    labels = 'view="%s",method="%s"' % (escape_label(view), escape_label(method))
+                    bounds = [format_number(bound) for bound in buckets] + ["+Inf"]
+                    for bound, count in zip(bounds, histogram.cumulative_counts()):
+                        lines.append('%s_bucket{%s,le="%s"} %d' % (metric, labels, bound, count))
+                    lines.append("%s_sum{%s} %s" % (metric, labels, format_number(histogram.sum)))
+                    lines.append("%s_count{%s} %d" % (metric, labels, histogram.total))
+
+        stats = dashboard_cache_stats()
+        for name in ("hits", "misses"):
+            metric = "%sdashboard_cache_%s_total" % (METRIC_PREFIX, name)
+            lines.append("# HELP %s Dashboard cache %s." % (metric, name))
+            lines.append("# TYPE %s counter" % metric)
+            lines.append("%s %d" % (metric, stats[name]))
+        return "\n".join(lines) + "\n"
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,135 @@
+import logging
+import os
+import random
+import re
+import time
+import traceback
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from .metrics import registry
+
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# Repeated Query Detection
+# Queries are grouped by "shape": the SQL with its parameters and literals left
+# out and IN (...) lists collapsed, so the same lookup made once per row of a
+# loop shows up as one shape run many times.
+
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+IN_LIST_RE = re.compile(r"IN \((?:%s, )*%s\)")
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+def query_shape(sql):
+    sql = WHITESPACE_RE.sub(" ", sql.strip())
+    sql = LITERAL_RE.sub("%s", sql)
+    return IN_LIST_RE.sub("IN (...)", sql)
+
+
+def app_call_site():
+    # Innermost frame of our own code (usually a view) that ran the query
+    for frame in reversed(traceback.extract_stack()):
+        filename = os.path.abspath(frame.filename)
+        if filename.startswith(APP_DIR) and filename != os.path.abspath(__file__):
+            return "%s:%s in %s" % (os.path.relpath(filename, os.path.dirname(APP_DIR)), frame.lineno, frame.name)
+    return "unknown"
+
+
+class QueryShapeRecorder:
+    """
+    Database execute wrapper that counts queries by shape and remembers where
+    each shape was first run from.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        self.call_sites = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        shape = query_shape(sql)
+        self.counts[shape] += 1
+        if shape not in self.call_sites:
+            self.call_sites[shape] = app_call_site()
+        return execute(sql, params, many, context)
+
+    def repeated(self, threshold):
+        return [(shape, count, self.call_sites[shape]) for shape, count in self.counts.most_common() if count >= threshold]
+
+
+class QueryShapeMiddleware:
+    """
+    Logs a warning for every query shape run QUERY_SHAPE_THRESHOLD (default 5)
+    or more times while handling one request, with the line that ran it.
+    Meant for development; add it to MIDDLEWARE to enable it.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.threshold = getattr(settings, 'QUERY_SHAPE_THRESHOLD', 5)
+
+    def __call__(self, request):
+        recorder = QueryShapeRecorder()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+
+        for shape, count, call_site in recorder.repeated(self.threshold):
+            logger.warning("Repeated query on %s: %d x %s (from %s)", request.path, count, shape, call_site)
+        return response
+
+
+class SQLTimer:
+    """
+    Database execute wrapper that counts queries and the time spent in them.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    """
+    Records latency, SQL query count and time, and response size per URL name
+    into metrics.registry, served by the /metrics view. Set
+    METRICS_SAMPLE_RATE below 1 to only measure that fraction of requests.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'METRICS_SAMPLE_RATE', 1.0)
+
+    def __call__(self, request):
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        timer = SQLTimer()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.url_name if match and match.url_name else "unresolved"
+        response_size = None if response.streaming else len(response.content)
+        registry.observe(view, request.method, duration, timer.count, timer.duration, response_size)
+        return response
@@ -0,0 +1,57 @@
+# Generated by Django 3.2.3 on 2026-10-18 13:17
+
+from django.db import migrations
+from django.db.models import Count, Max, Min, Q
+
+
+def deduplicate_attendance(apps, schema_editor):
+    # Retried saves used to create a second Attendance for the same subject,
+    # date and session year. The oldest session is kept and the duplicates'
+    # reports are moved onto it; per student the last submitted report wins.
+    Attendance = apps.get_model('student_management_app', 'Attendance')
+    AttendanceReport = apps.get_model('student_management_app', 'AttendanceReport')
+    AttendanceSummary = apps.get_model('student_management_app', 'AttendanceSummary')
+
+    sessions = Attendance.objects.values('subject_id', 'attendance_date', 'session_year_id').annotate(n=Count('id'), keep=Min('id')).filter(n__gt=1).order_by()
+    for session in sessions:
+        duplicate_ids = list(Attendance.objects.filter(
+            subject_id=session['subject_id'], attendance_date=session['attendance_date'], session_year_id=session['session_year_id']
+        ).exclude(id=session['keep']).values_list('id', flat=True))
+        AttendanceReport.objects.filter(attendance_id__in=duplicate_ids).update(attendance_id=session['keep'])
+        Attendance.objects.filter(id__in=duplicate_ids).delete()
+
+    reports = AttendanceReport.objects.values('attendance_id', 'student_id').annotate(n=Count('id'), keep=Max('id')).filter(n__gt=1).order_by()
+    for report in reports:
+        AttendanceReport.objects.filter(attendance_id=report['attendance_id'], student_id=report['student_id']).exclude(id=report['keep']).delete()
+
+    # The summary counted the duplicates, recount it from the remaining reports
+    rows = AttendanceReport.objects.values(
+        'student_id', 'attendance_id__subject_id', 'attendance_id__session_year_id'
+    ).annotate(
+        present=Count('id', filter=Q(status=True)),
+        absent=Count('id', filter=Q(status=False)),
+    ).order_by()
+    AttendanceSummary.objects.all().delete()
+    AttendanceSummary.objects.bulk_create([
+        AttendanceSummary(student_id_id=row['student_id'], subject_id_id=row['attendance_id__subject_id'], session_year_id_id=row['attendance_id__session_year_id'], present_count=row['present'], absent_count=row['absent'])
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('student_management_app', '0007_attendancesummary'),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate_attendance, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='attendance',
+            unique_together={('subject_id', 'attendance_date', 'session_year_id')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='attendancereport',
+            unique_together={('attendance_id', 'student_id')},
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.2.3 on 2026-10-18 13:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('student_management_app', '0008_attendance_unique_sessions'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['subject_id', 'session_year_id', 'attendance_date'], name='attendance_subject_session_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attendancereport',
+            index=models.Index(fields=['student_id', 'status'], name='attreport_student_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leavereportstaff',
+            index=models.Index(fields=['staff_id', 'leave_status'], name='leave_staff_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leavereportstudent',
+            index=models.Index(fields=['student_id', 'leave_status'], name='leave_student_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentresult',
+            index=models.Index(fields=['student_id', 'subject_id'], name='result_student_subject_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subjects',
+            index=models.Index(fields=['staff_id', 'course_id'], name='subject_staff_course_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.3 on 2026-10-18 13:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('student_management_app', '0009_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceBitmap',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('roster', models.BinaryField()),
+                ('marks', models.BinaryField()),
+                ('student_count', models.IntegerField(default=0)),
+                ('present_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('attendance_id', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='student_management_app.attendance')),
+            ],
+        ),
+    ]
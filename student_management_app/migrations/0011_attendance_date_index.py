@@ -0,0 +1,17 @@
+# Generated by Django 3.2.3 on 2026-10-18 13:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('student_management_app', '0010_attendancebitmap'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['attendance_date'], name='attendance_date_idx'),
+        ),
+    ]
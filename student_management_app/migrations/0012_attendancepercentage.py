@@ -0,0 +1,41 @@
+# Generated by Django 3.2.3 on 2026-10-18 13:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('student_management_app', '0011_attendance_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendancePercentage',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('window_days', models.IntegerField()),
+                ('window_present', models.IntegerField(default=0)),
+                ('window_total', models.IntegerField(default=0)),
+                ('window_percentage', models.FloatField(null=True)),
+                ('session_present', models.IntegerField(default=0)),
+                ('session_total', models.IntegerField(default=0)),
+                ('session_percentage', models.FloatField()),
+                ('below_threshold', models.BooleanField(default=False)),
+                ('computed_for', models.DateField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('session_year_id', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='student_management_app.sessionyearmodel')),
+                ('student_id', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='student_management_app.students')),
+                ('subject_id', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='student_management_app.subjects')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='attendancepercentage',
+            index=models.Index(fields=['below_threshold', 'subject_id'], name='percentage_flag_subject_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='attendancepercentage',
+            unique_together={('student_id', 'subject_id', 'session_year_id')},
+        ),
+    ]
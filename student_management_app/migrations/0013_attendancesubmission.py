@@ -0,0 +1,32 @@
+# Generated by Django 3.2.3 on 2026-10-18 13:34
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('student_management_app', '0012_attendancepercentage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceSubmission',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('ticket', models.UUIDField(unique=True)),
+                ('sessions', models.TextField()),
+                ('status', models.IntegerField(choices=[(0, 'Pending'), (1, 'Saved'), (2, 'Failed')], default=0)),
+                ('results', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(null=True)),
+                ('staff_id', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='attendancesubmission',
+            index=models.Index(fields=['status', 'id'], name='submission_status_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 3.2.3 on 2026-10-18 13:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('student_management_app', '0015_change_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sessionyearmodel',
+            name='archived_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='ArchivedAttendance',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('attendance_id', models.IntegerField(unique=True)),
+                ('attendance_date', models.DateField()),
+                ('roster', models.BinaryField()),
+                ('marks', models.BinaryField()),
+                ('student_count', models.IntegerField(default=0)),
+                ('present_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('session_year_id', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='student_management_app.sessionyearmodel')),
+                ('subject_id', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='student_management_app.subjects')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedattendance',
+            index=models.Index(fields=['subject_id', 'session_year_id', 'attendance_date'], name='archived_subject_session_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedattendance',
+            index=models.Index(fields=['attendance_date'], name='archived_date_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='archivedattendance',
+            unique_together={('subject_id', 'attendance_date', 'session_year_id')},
+        ),
+    ]
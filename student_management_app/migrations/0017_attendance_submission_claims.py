@@ -0,0 +1,33 @@
+# Generated by Django 3.2.3 on 2026-10-18 14:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('student_management_app', '0016_attendance_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendancesubmission',
+            name='attempts',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='attendancesubmission',
+            name='claim',
+            field=models.UUIDField(null=True),
+        ),
+        migrations.AddField(
+            model_name='attendancesubmission',
+            name='claimed_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='attendancesubmission',
+            name='status',
+            field=models.IntegerField(choices=[(0, 'Pending'), (1, 'Saved'), (2, 'Failed'), (3, 'Processing')], default=0),
+        ),
+    ]
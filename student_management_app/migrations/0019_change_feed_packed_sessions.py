@@ -0,0 +1,21 @@
+# Generated by Django 3.2.3 on 2026-10-18 14:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('student_management_app', '0018_importjob_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='archivedattendance',
+            index=models.Index(fields=['archived_at', 'id'], name='archived_changes_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attendancebitmap',
+            index=models.Index(fields=['updated_at', 'id'], name='attbitmap_changes_idx'),
+        ),
+    ]
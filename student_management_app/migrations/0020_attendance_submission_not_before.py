@@ -0,0 +1,18 @@
+# Generated by Django 3.2.3 on 2026-10-18 14:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('student_management_app', '0019_change_feed_packed_sessions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendancesubmission',
+            name='not_before',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
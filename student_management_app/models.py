@@ -1,16 +1,22 @@
 
 
 from django.contrib.auth.models import AbstractUser
+from django.core.exceptions import ObjectDoesNotExist
 from django.db import models
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
+from .dashboard_cache import bump_dashboard_versions_on_commit
+
 
 
 class SessionYearModel(models.Model):
     id = models.AutoField(primary_key=True)
     session_start_year = models.DateField()
     session_end_year = models.DateField()
+    # Set once the year's attendance has been moved to ArchivedAttendance,
+    # see attendance_archive.py
+    archived_at = models.DateTimeField(null=True, blank=True)
     objects = models.Manager()
 
 
@@ -70,6 +76,12 @@ class Subjects(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     objects = models.Manager()
 
+    class Meta:
+        indexes = [
+            # Staff pages list their Subjects and the Courses they teach
+            models.Index(fields=['staff_id', 'course_id'], name='subject_staff_course_idx'),
+        ]
+
 
 
 class Students(models.Model):
@@ -84,6 +96,12 @@ class Students(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     objects = models.Manager()
 
+    class Meta:
+        indexes = [
+            # Change feed pages, see change_feed.py
+            models.Index(fields=['updated_at', 'id'], name='students_changes_idx'),
+        ]
+
 
 class Attendance(models.Model):
     # Subject Attendance
@@ -95,6 +113,18 @@ class Attendance(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     objects = models.Manager()
 
+    class Meta:
+        # One session per Subject and day, retried saves merge into it
+        unique_together = (('subject_id', 'attendance_date', 'session_year_id'),)
+        indexes = [
+            # Attendance dates of a Subject in a Session Year, in date order
+            models.Index(fields=['subject_id', 'session_year_id', 'attendance_date'], name='attendance_subject_session_idx'),
+            # Date range reports across Subjects
+            models.Index(fields=['attendance_date'], name='attendance_date_idx'),
+            # Change feed pages, see change_feed.py
+            models.Index(fields=['updated_at', 'id'], name='attendance_changes_idx'),
+        ]
+
 
 class AttendanceReport(models.Model):
     # Individual Student Attendance
@@ -106,6 +136,182 @@ class AttendanceReport(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     objects = models.Manager()
 
+    class Meta:
+        # The unique index also serves lookups by attendance_id alone
+        unique_together = (('attendance_id', 'student_id'),)
+        indexes = [
+            # Present/absent counts per Student
+            models.Index(fields=['student_id', 'status'], name='attreport_student_status_idx'),
+            # Change feed pages
+            models.Index(fields=['updated_at', 'id'], name='attreport_changes_idx'),
+        ]
+
+
+class AttendanceBitmap(models.Model):
+    # Packed Attendance of one session, used instead of AttendanceReport rows
+    # when ATTENDANCE_STORAGE is "bitmap" (see attendance_bitmap.py)
+    id = models.AutoField(primary_key=True)
+    attendance_id = models.OneToOneField(Attendance, on_delete=models.CASCADE)
+    # Frozen roster snapshot: Students ids as little-endian uint32, in bit order
+    roster = models.BinaryField()
+    # Bit i (little-endian bit order) is the status of the i-th roster entry
+    marks = models.BinaryField()
+    student_count = models.IntegerField(default=0)
+    present_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            # Change feed pages
+            models.Index(fields=['updated_at', 'id'], name='attbitmap_changes_idx'),
+        ]
+
+
+class ArchivedAttendance(models.Model):
+    # Attendance session of an archived Session Year with its marks packed
+    # like an AttendanceBitmap, see attendance_archive.py. attendance_id is
+    # the id the session had in Attendance, which pages still refer to.
+    id = models.AutoField(primary_key=True)
+    attendance_id = models.IntegerField(unique=True)
+    subject_id = models.ForeignKey(Subjects, on_delete=models.DO_NOTHING)
+    attendance_date = models.DateField()
+    session_year_id = models.ForeignKey(SessionYearModel, on_delete=models.CASCADE)
+    roster = models.BinaryField()
+    marks = models.BinaryField()
+    student_count = models.IntegerField(default=0)
+    present_count = models.IntegerField(default=0)
+    # Timestamps of the Attendance row, kept as they were
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    objects = models.Manager()
+
+    class Meta:
+        # Same sessions and indexes as Attendance
+        unique_together = (('subject_id', 'attendance_date', 'session_year_id'),)
+        indexes = [
+            models.Index(fields=['subject_id', 'session_year_id', 'attendance_date'], name='archived_subject_session_idx'),
+            models.Index(fields=['attendance_date'], name='archived_date_idx'),
+            # Change feed pages, by when the sessions were archived
+            models.Index(fields=['archived_at', 'id'], name='archived_changes_idx'),
+        ]
+
+
+class AttendanceSummary(models.Model):
+    # Present/Absent Counters per Student, Subject and Session Year
+    # Kept in step with AttendanceReport so Dashboards don't have to count it
+    id = models.AutoField(primary_key=True)
+    student_id = models.ForeignKey(Students, on_delete=models.CASCADE)
+    subject_id = models.ForeignKey(Subjects, on_delete=models.CASCADE)
+    session_year_id = models.ForeignKey(SessionYearModel, on_delete=models.CASCADE)
+    present_count = models.IntegerField(default=0)
+    absent_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    objects = models.Manager()
+
+    class Meta:
+        unique_together = (('student_id', 'subject_id', 'session_year_id'),)
+
+
+class AttendancePercentage(models.Model):
+    # Attendance percentages per Student, Subject and Session Year over the
+    # last `window_days` days and the whole session, as of `computed_for`
+    # Recomputed by manage.py compute_attendance_percentages, see attendance_analytics.py
+    id = models.AutoField(primary_key=True)
+    student_id = models.ForeignKey(Students, on_delete=models.CASCADE)
+    subject_id = models.ForeignKey(Subjects, on_delete=models.CASCADE)
+    session_year_id = models.ForeignKey(SessionYearModel, on_delete=models.CASCADE)
+    window_days = models.IntegerField()
+    window_present = models.IntegerField(default=0)
+    window_total = models.IntegerField(default=0)
+    window_percentage = models.FloatField(null=True)
+    session_present = models.IntegerField(default=0)
+    session_total = models.IntegerField(default=0)
+    session_percentage = models.FloatField()
+    below_threshold = models.BooleanField(default=False)
+    computed_for = models.DateField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    objects = models.Manager()
+
+    class Meta:
+        unique_together = (('student_id', 'subject_id', 'session_year_id'),)
+        indexes = [
+            # The alert pages list the flagged rows, the staff page per Subject
+            models.Index(fields=['below_threshold', 'subject_id'], name='percentage_flag_subject_idx'),
+        ]
+
+
+class AttendanceSubmission(models.Model):
+    # Attendance saves queued by staff when ATTENDANCE_WRITE_BEHIND is on,
+    # written by the queue worker, see attendance_queue.py
+    PENDING = 0
+    SAVED = 1
+    FAILED = 2
+    PROCESSING = 3
+    status_choices = ((PENDING, "Pending"), (SAVED, "Saved"), (FAILED, "Failed"), (PROCESSING, "Processing"))
+
+    id = models.AutoField(primary_key=True)
+    ticket = models.UUIDField(unique=True)
+    staff_id = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    sessions = models.TextField()
+    status = models.IntegerField(choices=status_choices, default=PENDING)
+    results = models.TextField(blank=True, default="")
+    # The worker that claimed the submission and when, and how many tries
+    # were cut short by database errors
+    claim = models.UUIDField(null=True)
+    claimed_at = models.DateTimeField(null=True)
+    attempts = models.IntegerField(default=0)
+    # A submission put back for a retry isn't claimed again before this
+    not_before = models.DateTimeField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True)
+    objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            # The worker picks up pending submissions in arrival order
+            models.Index(fields=['status', 'id'], name='submission_status_idx'),
+        ]
+
+
+class ImportJob(models.Model):
+    # Student imports uploaded by the HOD, run by the import worker process,
+    # see import_jobs.py
+    QUEUED = 0
+    RUNNING = 1
+    DONE = 2
+    FAILED = 3
+    CANCELLED = 4
+    status_choices = ((QUEUED, "Queued"), (RUNNING, "Running"), (DONE, "Done"), (FAILED, "Failed"), (CANCELLED, "Cancelled"))
+
+    id = models.AutoField(primary_key=True)
+    created_by = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    file_name = models.CharField(max_length=255)
+    status = models.IntegerField(choices=status_choices, default=QUEUED)
+    total_rows = models.IntegerField(null=True)
+    processed_rows = models.IntegerField(default=0)
+    imported_rows = models.IntegerField(default=0)
+    failed_rows = models.IntegerField(default=0)
+    errors = models.TextField(blank=True, default="")
+    error = models.TextField(blank=True, default="")
+    cancel_requested = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    # Written by the worker with every chunk, a job whose heartbeat stopped
+    # lost its worker
+    heartbeat_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+    objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            # The worker picks up queued jobs in arrival order
+            models.Index(fields=['status', 'id'], name='import_job_status_idx'),
+        ]
+
 
 class LeaveReportStudent(models.Model):
     id = models.AutoField(primary_key=True)
@@ -117,6 +323,12 @@ class LeaveReportStudent(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     objects = models.Manager()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['student_id', 'leave_status'], name='leave_student_status_idx'),
+            models.Index(fields=['updated_at', 'id'], name='leave_student_changes_idx'),
+        ]
+
 
 class LeaveReportStaff(models.Model):
     id = models.AutoField(primary_key=True)
@@ -128,6 +340,12 @@ class LeaveReportStaff(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     objects = models.Manager()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['staff_id', 'leave_status'], name='leave_staff_status_idx'),
+            models.Index(fields=['updated_at', 'id'], name='leave_staff_changes_idx'),
+        ]
+
 
 class FeedBackStudent(models.Model):
     id = models.AutoField(primary_key=True)
@@ -178,6 +396,12 @@ class StudentResult(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     objects = models.Manager()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['student_id', 'subject_id'], name='result_student_subject_idx'),
+            models.Index(fields=['updated_at', 'id'], name='result_changes_idx'),
+        ]
+
 
 #Creating Django Signals
 
@@ -205,6 +429,66 @@ def save_user_profile(sender, instance, **kwargs):
         instance.staffs.save()
     if instance.user_type == 3:
         instance.students.save()
-    
 
 
+
+# Dashboard Cache Invalidation
+# Each write bumps only the dashboard scopes it affects, once it commits (see
+# dashboard_cache.py)
+
+def _related(instance, field_name):
+    # Related object, or None if it was already deleted (e.g. during a cascade)
+    try:
+        return getattr(instance, field_name)
+    except ObjectDoesNotExist:
+        return None
+
+
+@receiver([post_save, post_delete], sender=Courses)
+def invalidate_course_dashboards(sender, instance, **kwargs):
+    bump_dashboard_versions_on_commit("hod", "course:%s" % instance.id)
+
+
+@receiver([post_save, post_delete], sender=Staffs)
+def invalidate_staff_dashboards(sender, instance, **kwargs):
+    bump_dashboard_versions_on_commit("hod", "staff:%s" % instance.admin_id)
+
+
+@receiver([post_save, post_delete], sender=Students)
+def invalidate_student_dashboards(sender, instance, **kwargs):
+    bump_dashboard_versions_on_commit("hod", "student:%s" % instance.admin_id, "course:%s" % instance.course_id_id)
+
+
+@receiver([post_save, post_delete], sender=Subjects)
+def invalidate_subject_dashboards(sender, instance, **kwargs):
+    bump_dashboard_versions_on_commit("hod", "staff:%s" % instance.staff_id_id, "course:%s" % instance.course_id_id)
+
+
+@receiver([post_save, post_delete], sender=Attendance)
+def invalidate_attendance_dashboards(sender, instance, **kwargs):
+    subject = _related(instance, 'subject_id')
+    bump_dashboard_versions_on_commit("hod", subject and "course_attendance:%s" % subject.course_id_id)
+
+
+@receiver([post_save, post_delete], sender=AttendanceReport)
+def invalidate_attendance_report_dashboards(sender, instance, **kwargs):
+    student = _related(instance, 'student_id')
+    bump_dashboard_versions_on_commit("hod", student and "student:%s" % student.admin_id, student and "course_attendance:%s" % student.course_id_id)
+
+
+@receiver([post_save, post_delete], sender=StudentResult)
+def invalidate_result_dashboards(sender, instance, **kwargs):
+    student = _related(instance, 'student_id')
+    bump_dashboard_versions_on_commit(student and "student:%s" % student.admin_id)
+
+
+@receiver([post_save, post_delete], sender=LeaveReportStudent)
+def invalidate_student_leave_dashboards(sender, instance, **kwargs):
+    student = _related(instance, 'student_id')
+    bump_dashboard_versions_on_commit("hod", student and "student:%s" % student.admin_id)
+
+
+@receiver([post_save, post_delete], sender=LeaveReportStaff)
+def invalidate_staff_leave_dashboards(sender, instance, **kwargs):
+    staff = _related(instance, 'staff_id')
+    bump_dashboard_versions_on_commit("hod", staff and "staff:%s" % staff.admin_id)
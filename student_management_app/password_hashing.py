@@ -0,0 +1,63 @@
+import functools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher, make_password
+
+
+# Parallel Password Hashing
+# Password hashers are deliberately slow (PBKDF2 runs 260,000 iterations), so
+# when users are created in bulk hashing dominates the run. The passwords are
+# hashed in a pool of worker processes, one per available core by default
+# (PASSWORD_HASHING_WORKERS), before the bulk insert. Each password still gets
+# its own salt and the hashes come back in input order.
+
+
+def password_hashing_workers():
+    workers = getattr(settings, 'PASSWORD_HASHING_WORKERS', None)
+    if workers:
+        return workers
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+class PasswordHashingPool:
+    """
+    Context manager hashing lists of passwords with make_password in worker
+    processes. With one worker, or a single password, it hashes in-process.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or password_hashing_workers()
+        # The hasher is resolved here and pickled to the workers, which then
+        # don't need Django's settings
+        self.encode = functools.partial(make_password, hasher=get_hasher())
+        self.executor = None
+
+    def __enter__(self):
+        if self.workers > 1:
+            # Spawned rather than forked: the web process may have threads
+            # (e.g. the attendance queue worker) and open database connections
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def hash(self, passwords):
+        passwords = list(passwords)
+        if self.executor is None or len(passwords) < 2:
+            return [self.encode(password) for password in passwords]
+        chunksize = max(1, len(passwords) // (self.workers * 4))
+        return list(self.executor.map(self.encode, passwords, chunksize=chunksize))
+
+
+def hash_passwords(passwords, workers=None):
+    # Hashes of `passwords`, in order, computed in a one-off pool
+    with PasswordHashingPool(workers) as pool:
+        return pool.hash(passwords)
@@ -0,0 +1,507 @@
+import csv
+import io
+import re
+from contextlib import contextmanager
+
+import numpy as np
+
+from django.conf import settings
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+
+from .dashboard_cache import bump_dashboard_versions
+from .models import CustomUser, Courses, SessionYearModel, Students
+from .password_hashing import PasswordHashingPool
+
+
+# Bulk Student Import
+# Rows are read in chunks and validated (check_student_chunk, shared with
+# the dry run) against lookups fetched once per import: courses, session
+# years and the usernames and emails already taken. Valid rows go in with one bulk insert per table in a
+# transaction per chunk; bad rows are reported by row number instead of
+# stopping the import. Passwords are hashed in a process pool before each
+# chunk's transaction (see password_hashing.py). Bulk inserts skip the
+# post_save signals, so the Students rows are created here and the dashboards
+# invalidated once at the end.
+
+IMPORT_COLUMNS = ["Roll Number", "Email", "Name", "Gender", "Address", "Course ID", "Session Year ID"]
+# Used for rows without a value in the optional "Password" column
+DEFAULT_PASSWORD = "defaultpassword123"
+
+
+def import_chunk_size():
+    return getattr(settings, 'STUDENT_IMPORT_CHUNK_SIZE', 1000)
+
+
+# Formats
+# Imports come as .xlsx workbooks, CSV or Parquet files, told apart by their
+# first bytes. Each format has a reader yielding (row number, {column: value})
+# one row at a time without loading the file: openpyxl's read-only mode for
+# .xlsx, the csv module for CSV and, for Parquet, pyarrow's record batches of
+# only the import columns. read_import_rows groups the rows into the chunks
+# import_students and the dry run take, so every format goes through the
+# same checks (check_student_chunk) and inserts.
+# Row numbers are those of a spreadsheet (the header is row 1) or, for
+# Parquet, record numbers from 1.
+
+XLSX = "xlsx"
+CSV = "csv"
+PARQUET = "parquet"
+CSV_ENCODING = "utf-8-sig"
+
+
+def import_format(file):
+    # .xlsx files are zip archives and Parquet files start with "PAR1";
+    # anything else is read as CSV
+    if hasattr(file, "read"):
+        file.seek(0)
+        head = file.read(4)
+        file.seek(0)
+    else:
+        with open(file, "rb") as opened:
+            head = opened.read(4)
+    if head == b"PK\x03\x04":
+        return XLSX
+    if head == b"PAR1":
+        return PARQUET
+    return CSV
+
+
+def source(file):
+    # Path or underlying file object of an upload, for the readers that
+    # don't go through Django's File
+    return getattr(file, "file", file)
+
+
+def check_columns(header):
+    missing = [column for column in IMPORT_COLUMNS if column not in header]
+    if missing:
+        raise ValueError("Missing columns: %s" % ", ".join(missing))
+
+
+def import_columns(header):
+    # The columns to read: the required ones and the optional "Password"
+    return [column for column in header if column in IMPORT_COLUMNS or column == "Password"]
+
+
+def is_empty(values):
+    return all(value is None or value == "" for value in values)
+
+
+def workbook_header(file):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        return [cell_text(cell) for cell in next(workbook.worksheets[0].iter_rows(max_row=1, values_only=True), ())]
+    finally:
+        workbook.close()
+
+
+def workbook_rows(file):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [cell_text(cell) for cell in next(rows, ())]
+        check_columns(header)
+        for number, values in enumerate(rows, start=2):
+            if not is_empty(values):
+                yield number, dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+def count_workbook_rows(file):
+    # Taken from the sheet's dimension when the workbook records one, else
+    # counted in one pass
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        if sheet.max_row:
+            return max(sheet.max_row - 1, 0)
+        return sum(1 for values in sheet.iter_rows(min_row=2, values_only=True) if not is_empty(values))
+    finally:
+        workbook.close()
+
+
+@contextmanager
+def open_csv(file):
+    if not hasattr(file, "read"):
+        with open(file, encoding=CSV_ENCODING, newline="") as text:
+            yield text
+        return
+    file.seek(0)
+    text = io.TextIOWrapper(source(file), encoding=CSV_ENCODING, newline="")
+    try:
+        yield text
+    finally:
+        # Leaves the upload open for whoever reads it next
+        text.detach()
+
+
+def csv_header(file):
+    with open_csv(file) as text:
+        return [column.strip() for column in next(csv.reader(text), [])]
+
+
+def csv_rows(file):
+    with open_csv(file) as text:
+        reader = csv.reader(text)
+        header = [column.strip() for column in next(reader, [])]
+        check_columns(header)
+        for values in reader:
+            if not is_empty(values):
+                # line_num counts physical lines, so it matches an editor's
+                yield reader.line_num, dict(zip(header, values))
+
+
+def count_csv_rows(file):
+    with open_csv(file) as text:
+        reader = csv.reader(text)
+        next(reader, None)
+        return sum(1 for values in reader if not is_empty(values))
+
+
+def parquet_file(file):
+    import pyarrow.parquet
+
+    return pyarrow.parquet.ParquetFile(source(file))
+
+
+def parquet_header(file):
+    return [str(column).strip() for column in parquet_file(file).schema_arrow.names]
+
+
+def parquet_rows(file):
+    parquet = parquet_file(file)
+    names = {str(column).strip(): column for column in parquet.schema_arrow.names}
+    check_columns(names)
+    columns = import_columns(names)
+    number = 0
+    # Only the import columns are read, a record batch at a time
+    for batch in parquet.iter_batches(batch_size=import_chunk_size(), columns=[names[column] for column in columns]):
+        for values in zip(*[batch.column(i).to_pylist() for i in range(len(columns))]):
+            number += 1
+            if not is_empty(values):
+                yield number, dict(zip(columns, values))
+
+
+def count_parquet_rows(file):
+    # From the file's metadata, without reading any rows
+    return parquet_file(file).metadata.num_rows
+
+
+# format -> (header, rows, row count) readers
+FORMAT_READERS = {
+    XLSX: (workbook_header, workbook_rows, count_workbook_rows),
+    CSV: (csv_header, csv_rows, count_csv_rows),
+    PARQUET: (parquet_header, parquet_rows, count_parquet_rows),
+}
+
+
+def check_import_columns(file):
+    # Reads only the header, raises ValueError if a column is missing
+    header, rows, count = FORMAT_READERS[import_format(file)]
+    check_columns(header(file))
+
+
+def count_import_rows(file):
+    # Number of rows read_import_rows will yield, at most (a workbook's
+    # dimension may count trailing blank rows)
+    header, rows, count = FORMAT_READERS[import_format(file)]
+    return count(file)
+
+
+def read_import_rows(file, chunk_size=None):
+    """
+    Yields the rows of an .xlsx, CSV or Parquet file in chunks of
+    [(row number, {column: value}), ...], streaming the file instead of
+    loading it. Raises ValueError if a column is missing.
+    """
+    chunk_size = chunk_size or import_chunk_size()
+    header, rows, count = FORMAT_READERS[import_format(file)]
+    chunk = []
+    for row in rows(file):
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def cell_text(value):
+    # Cell value as text; whole numbers (e.g. numeric roll numbers) lose their ".0"
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def parse_id(value):
+    # Integer id of a cell: 3, 3.0, "3" and "3.0" (as CSV and Parquet
+    # files written from a float column have it) are all 3; None otherwise
+    text = cell_text(value)
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        number = float(text)
+    except ValueError:
+        return None
+    return int(number) if number.is_integer() else None
+
+
+def max_length(model, field):
+    return model._meta.get_field(field).max_length
+
+
+# Row Checks
+# A chunk is checked a column at a time: its cells become one numpy array
+# per field (student_columns) and every rule yields the mask of the rows
+# failing it over the whole column (student_checks), instead of running
+# Django's validators row by row. The usernames and emails already taken
+# are fetched once per import into sets (import_lookups). Import and dry
+# run both go through check_student_chunk, so they apply the same rules.
+
+USERNAME_REGEX = re.compile(UnicodeUsernameValidator.regex, UnicodeUsernameValidator.flags)
+
+
+def matches(test, values):
+    # Mask of the values `test` (a regex's match or search) accepts
+    return np.fromiter((test(value) is not None for value in values.tolist()), dtype=bool, count=len(values))
+
+
+def is_member(values, members):
+    # Mask of the values in the set `members`
+    return np.fromiter(map(members.__contains__, values.tolist()), dtype=bool, count=len(values))
+
+
+def valid_emails(emails):
+    # Mask of the addresses validate_email accepts. Its user and domain
+    # regexes are run over the columns; only the addresses they reject
+    # (mostly invalid ones, but also IDN domains or IP literals) go through
+    # the validator itself
+    parts = np.char.rpartition(emails, "@")
+    valid = (parts[:, 1] == "@") & matches(validate_email.user_regex.match, parts[:, 0]) & matches(validate_email.domain_regex.match, parts[:, 2])
+    for i in np.flatnonzero(~valid & (emails != "")):
+        try:
+            validate_email(str(emails[i]))
+            valid[i] = True
+        except ValidationError:
+            pass
+    return valid
+
+
+def first_rows(values, rows):
+    # Mask of the rows, among the masked `rows`, holding the first
+    # occurrence of their value
+    first = np.zeros(len(values), dtype=bool)
+    indexes = np.flatnonzero(rows)
+    unique, positions = np.unique(values[indexes], return_index=True)
+    first[indexes[positions]] = True
+    return first
+
+
+def student_columns(chunk, default_password=DEFAULT_PASSWORD):
+    """
+    Turns a chunk of (row number, row) into the fields of its students, as
+    {field: numpy array with a value per row}. The "*_text" fields keep the
+    course and session year cells as written, for the error messages.
+    """
+    rows = [row for number, row in chunk]
+
+    def column(values, dtype=str):
+        return np.array(list(values), dtype=dtype)
+
+    names = [cell_text(row.get("Name")).split() for row in rows]
+    return {
+        "username": column(cell_text(row.get("Roll Number")) for row in rows),
+        "email": column(cell_text(row.get("Email")) for row in rows),
+        "first_name": column(name[0] if name else "" for name in names),
+        "last_name": column(" ".join(name[1:]) for name in names),
+        "gender": column(cell_text(row.get("Gender")) for row in rows),
+        "address": column(cell_text(row.get("Address")) for row in rows),
+        "course_id": column((parse_id(row.get("Course ID")) for row in rows), object),
+        "course_text": column(cell_text(row.get("Course ID")) for row in rows),
+        "session_year_id": column((parse_id(row.get("Session Year ID")) for row in rows), object),
+        "session_year_text": column(cell_text(row.get("Session Year ID")) for row in rows),
+        "password": column(cell_text(row.get("Password")) or default_password for row in rows),
+    }
+
+
+def student_checks(columns, lookups):
+    """
+    The rules a row's own values must pass, checked the way the user and
+    student forms would (SQLite doesn't enforce max_length) and the course
+    and session year against the prefetched ids. Returns [(failing rows,
+    message, values), ...] in the order a row's problems are listed; the
+    message is formatted with the row's value.
+    """
+    usernames, emails = columns["username"], columns["email"]
+    first_names, last_names = columns["first_name"], columns["last_name"]
+    length = np.char.str_len
+    username_length = max_length(CustomUser, 'username')
+    email_length = max_length(CustomUser, 'email')
+    name_length = max_length(CustomUser, 'first_name')
+    gender_length = max_length(Students, 'gender')
+    return [
+        (usernames == "", "Roll Number is empty", usernames),
+        ((usernames != "") & ~matches(USERNAME_REGEX.search, usernames), "Roll Number {} may only contain letters, digits and @.+-_", usernames),
+        (length(usernames) > username_length, "Roll Number {} is longer than %d characters" % username_length, usernames),
+        (emails == "", "Email is empty", emails),
+        ((emails != "") & ~valid_emails(emails), "Email {} is not a valid address", emails),
+        (length(emails) > email_length, "Email {} is longer than %d characters" % email_length, emails),
+        (first_names == "", "Name is empty", first_names),
+        ((length(first_names) > name_length) | (length(last_names) > max_length(CustomUser, 'last_name')), "Name parts must be at most %d characters" % name_length, first_names),
+        (length(columns["gender"]) > gender_length, "Gender is longer than %d characters" % gender_length, columns["gender"]),
+        (~is_member(columns["course_id"], lookups["course_ids"]), "Course ID {} does not exist", columns["course_text"]),
+        (~is_member(columns["session_year_id"], lookups["session_year_ids"]), "Session Year ID {} does not exist", columns["session_year_text"]),
+    ]
+
+
+def import_lookups():
+    """
+    Fetches what rows are checked against, once per import: the course and
+    session year ids and the usernames and emails already taken, as sets.
+    """
+    users = CustomUser.objects.values_list('username', 'email')
+    return {
+        "course_ids": set(Courses.objects.values_list('id', flat=True)),
+        "session_year_ids": set(SessionYearModel.objects.values_list('id', flat=True)),
+        "usernames": {username for username, email in users},
+        "emails": {email for username, email in users},
+    }
+
+
+def check_student_chunk(chunk, lookups, seen, password=DEFAULT_PASSWORD):
+    """
+    Validates one chunk of (row number, row): every row against
+    student_checks, then the usernames and emails of the valid ones against
+    the existing users and the rows before them. A username or email
+    belongs to the first row passing student_checks that has it; `seen`
+    ({"usernames": set, "emails": set}) carries those from chunk to chunk
+    and is updated here.
+
+    Both the import and the dry run check rows through here, so the dry
+    run reports exactly the rows the import would reject. Returns
+    (accepted [fields, ...], errors [{"row", "error"}, ...], rejected rows).
+    """
+    if not chunk:
+        return [], [], 0
+    numbers = [number for number, row in chunk]
+    columns = student_columns(chunk, password)
+    checks = student_checks(columns, lookups)
+    failed = np.logical_or.reduce([failing for failing, message, values in checks])
+
+    usernames, emails = columns["username"], columns["email"]
+    candidates = ~failed
+    username_taken = candidates & is_member(usernames, lookups["usernames"])
+    email_taken = candidates & is_member(emails, lookups["emails"])
+    checks += [
+        (username_taken, "Roll Number {} already exists", usernames),
+        (candidates & ~username_taken & (is_member(usernames, seen["usernames"]) | ~first_rows(usernames, candidates)), "Roll Number {} appears earlier in the file", usernames),
+        (email_taken, "Email {} already exists", emails),
+        (candidates & ~email_taken & (is_member(emails, seen["emails"]) | ~first_rows(emails, candidates)), "Email {} appears earlier in the file", emails),
+    ]
+    seen["usernames"].update(usernames[candidates].tolist())
+    seen["emails"].update(emails[candidates].tolist())
+
+    # Listed by row, each row's problems in the order of the checks
+    problems = sorted(
+        ((i, message.format(values[i])) for failing, message, values in checks for i in np.flatnonzero(failing)),
+        key=lambda problem: problem[0],
+    )
+    errors = [{"row": numbers[i], "error": error} for i, error in problems]
+    rejected = np.logical_or.reduce([failing for failing, message, values in checks])
+
+    fields = ["username", "email", "first_name", "last_name", "gender", "address", "course_id", "session_year_id", "password"]
+    accepted = [
+        dict(zip(fields, values))
+        for values in zip(*[columns[field][~rejected].tolist() for field in fields])
+    ]
+    return accepted, errors, int(rejected.sum())
+
+
+def import_students(chunks, password=DEFAULT_PASSWORD, workers=None, progress=None):
+    """
+    Imports chunks of (row number, row) as produced by read_import_rows.
+    Students without a "Password" get `password`; passwords are hashed by
+    `workers` processes (default PASSWORD_HASHING_WORKERS or one per core).
+    After each chunk `progress(processed, imported, failed)` is called, if
+    given; the import stops there when it returns False. Returns
+    {"processed": rows, "imported": count, "failed": rows rejected,
+    "errors": [{"row", "error"}, ...], "stopped": bool}.
+    """
+    lookups = import_lookups()
+
+    imported = 0
+    processed = 0
+    failed = 0
+    stopped = False
+    errors = []
+    imported_courses = set()
+    seen = {"usernames": set(), "emails": set()}
+    with PasswordHashingPool(workers) as hashing_pool:
+        for chunk in chunks:
+            accepted, chunk_errors, rejected = check_student_chunk(chunk, lookups, seen, password)
+            errors += chunk_errors
+            failed += rejected
+
+            if accepted:
+                # Hashed before the transaction, so the write lock isn't held meanwhile
+                password_hashes = hashing_pool.hash(student["password"] for student in accepted)
+                with transaction.atomic():
+                    CustomUser.objects.bulk_create([
+                        CustomUser(username=student["username"], email=student["email"], first_name=student["first_name"], last_name=student["last_name"], password=password_hash, user_type=CustomUser.STUDENT)
+                        for student, password_hash in zip(accepted, password_hashes)
+                    ])
+                    # SQLite doesn't return ids from bulk inserts, so they are read back
+                    admin_ids = dict(CustomUser.objects.filter(username__in=[student["username"] for student in accepted]).values_list('username', 'id'))
+                    Students.objects.bulk_create([
+                        Students(admin_id=admin_ids[student["username"]], gender=student["gender"], address=student["address"], profile_pic="", course_id_id=student["course_id"], session_year_id_id=student["session_year_id"])
+                        for student in accepted
+                    ])
+                imported += len(accepted)
+                imported_courses.update(student["course_id"] for student in accepted)
+
+            processed += len(chunk)
+            if progress is not None and progress(processed, imported, failed) is False:
+                stopped = True
+                break
+
+    if imported_courses:
+        bump_dashboard_versions("hod", *["course:%s" % course_id for course_id in imported_courses])
+    return {"processed": processed, "imported": imported, "failed": failed, "errors": sorted(errors, key=lambda error: error["row"]), "stopped": stopped}
+
+
+# Dry Run
+# Runs a file through the import's own checks (check_student_chunk) without
+# writing anything, so the report lists exactly the rows the import would
+# reject, with every problem of each row.
+
+def validate_student_sheet(file):
+    """
+    Checks every row of an import file without writing anything. Returns
+    {"rows": count, "valid": count, "errors": [{"row", "error"}, ...]}, the
+    errors ordered by row. Raises ValueError if a column is missing.
+    """
+    lookups = import_lookups()
+    seen = {"usernames": set(), "emails": set()}
+    rows = 0
+    valid = 0
+    errors = []
+    for chunk in read_import_rows(file):
+        accepted, chunk_errors, rejected = check_student_chunk(chunk, lookups, seen)
+        rows += len(chunk)
+        valid += len(accepted)
+        errors += chunk_errors
+    return {"rows": rows, "valid": valid, "errors": sorted(errors, key=lambda error: error["row"])}
@@ -1,3 +1,1782 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
+import json
+import os
+import tempfile
+import time
+from collections import Counter
+from contextlib import contextmanager
+from importlib.util import find_spec
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import openpyxl
+from django.contrib import messages
+from django.contrib.auth.hashers import check_password
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import OperationalError, connection, transaction
+from django.db.models import F
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+
+from .attendance import save_attendance_session, session_reports
+from .attendance_archive import archive_session_year, restore_session_year
+from .attendance_analytics import attendance_percentages, refresh_attendance_percentages
+from .attendance_queue import claim_attendance_submissions, drain_attendance_queue, enqueue_attendance
+from .import_jobs import claim_next_import_job, import_storage, run_import_job, run_import_jobs
+from .attendance_bitmap import bitmap_statuses, convert_to_bitmaps, convert_to_rows, count_bitmaps, pack_marks, pack_roster, write_bitmap_marks
+from .change_feed import change_page, feed_fields
+from .attendance_summary import apply_attendance_deltas, count_attendance_reports, find_attendance_summary_mismatches, rebuild_attendance_summary, status_delta
+from .management.commands.explain_queries import explain
+from .dashboard_cache import check_shared_dashboard_cache, dashboard_cache_stats, get_dashboard_versions
+from .dashboards import hod_dashboard_context, staff_dashboard_context, student_dashboard_context
+from .metrics import registry
+from .middleware import QueryShapeRecorder, query_shape
+from .password_hashing import hash_passwords
+from .student_import import validate_student_sheet
+from .models import CustomUser, Courses, Subjects, Staffs, Students, SessionYearModel, Attendance, AttendanceReport, AttendanceSummary, AttendanceBitmap, ArchivedAttendance, AttendancePercentage, AttendanceSubmission, ImportJob, LeaveReportStaff, LeaveReportStudent, FeedBackStudent, FeedBackStaffs, StudentResult
+from . import urls
+
+
+def create_course_with_students(course_name, staff_user, session_year, students=3, subjects=2, days=2):
+    # Creates a Course with its Subjects, enrolled Students and some Attendance
+    course = Courses.objects.create(course_name=course_name)
+    subject_list = [
+        Subjects.objects.create(subject_name="%s Subject %d" % (course_name, i), course_id=course, staff_id=staff_user)
+        for i in range(subjects)
+    ]
+    student_list = []
+    for i in range(students):
+        username = "%s_student_%d" % (course_name.lower(), i)
+        user = CustomUser.objects.create_user(username=username, password="password", email=username+"@example.com", first_name=username, last_name="Student", user_type=3)
+        user.students.course_id = course
+        user.students.session_year_id = session_year
+        user.students.save()
+        student_list.append(user.students)
+
+    for subject in subject_list:
+        for day in range(days):
+            attendance = Attendance.objects.create(subject_id=subject, attendance_date=datetime.date(2021, 6, 1+day), session_year_id=session_year)
+            for i, student in enumerate(student_list):
+                AttendanceReport.objects.create(student_id=student, attendance_id=attendance, status=(i+day) % 3 != 0)
+    rebuild_attendance_summary()
+    return course, subject_list, student_list
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class BaseDataTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # Students are created against Course and Session Year 1 by the post_save signal
+        cls.session_year = SessionYearModel.objects.create(id=1, session_start_year="2021-01-01", session_end_year="2021-12-31")
+        Courses.objects.create(id=1, course_name="Default")
+        cls.staff_user = CustomUser.objects.create_user(username="staff", password="password", email="staff@example.com", first_name="Staff", last_name="User", user_type=2)
+
+    def setUp(self):
+        # Cached dashboards would outlive the rolled back test data
+        cache.clear()
+
+
+class HodDashboardTests(BaseDataTestCase):
+
+    def test_context(self):
+        other_staff = CustomUser.objects.create_user(username="other_staff", password="password", email="other_staff@example.com", first_name="Other", user_type=2)
+        physics, physics_subjects, physics_students = create_course_with_students("Physics", self.staff_user, self.session_year, students=3, subjects=2, days=3)
+        chemistry, chemistry_subjects, chemistry_students = create_course_with_students("Chemistry", other_staff, self.session_year, students=1, subjects=1, days=2)
+        LeaveReportStaff.objects.create(staff_id=self.staff_user.staffs, leave_date="2021-06-01", leave_message="Leave", leave_status=1)
+        LeaveReportStudent.objects.create(student_id=physics_students[0], leave_date="2021-06-01", leave_message="Leave", leave_status=1)
+        LeaveReportStudent.objects.create(student_id=physics_students[1], leave_date="2021-06-01", leave_message="Leave", leave_status=0)
+
+        context = hod_dashboard_context()
+
+        self.assertEqual((context["all_student_count"], context["subject_count"], context["course_count"], context["staff_count"]), (4, 3, 3, 2))
+        # Courses, with the empty default course
+        self.assertEqual(context["course_name_list"], ["Default", "Physics", "Chemistry"])
+        self.assertEqual(context["subject_count_list"], [0, 2, 1])
+        self.assertEqual(context["student_count_list_in_course"], [0, 3, 1])
+        # Subjects
+        self.assertEqual(context["subject_list"], [subject.subject_name for subject in physics_subjects + chemistry_subjects])
+        self.assertEqual(context["student_count_list_in_subject"], [3, 3, 1])
+        # Staffs
+        self.assertEqual(context["staff_name_list"], ["Staff", "Other"])
+        self.assertEqual(context["staff_attendance_present_list"], [6, 2])
+        self.assertEqual(context["staff_attendance_leave_list"], [1, 0])
+        # Students
+        students = physics_students + chemistry_students
+        self.assertEqual(context["student_name_list"], [student.admin.first_name for student in students])
+        self.assertEqual(context["student_attendance_present_list"], [AttendanceReport.objects.filter(student_id=student, status=True).count() for student in students])
+        self.assertEqual(
+            context["student_attendance_leave_list"],
+            [AttendanceReport.objects.filter(student_id=student, status=False).count() + (student == physics_students[0]) for student in students]
+        )
+
+
+class StaffDashboardTests(BaseDataTestCase):
+
+    def test_context(self):
+        course, subjects, students = create_course_with_students("Physics", self.staff_user, self.session_year, students=3, subjects=2, days=3)
+        LeaveReportStaff.objects.create(staff_id=self.staff_user.staffs, leave_date="2021-06-01", leave_message="Leave", leave_status=1)
+
+        context = staff_dashboard_context(self.staff_user.id)
+
+        self.assertEqual(context["students_count"], 3)
+        self.assertEqual(context["subject_count"], 2)
+        self.assertEqual(context["attendance_count"], 6)
+        self.assertEqual(context["leave_count"], 1)
+        self.assertEqual(context["subject_list"], [subject.subject_name for subject in subjects])
+        self.assertEqual(context["attendance_list"], [3, 3])
+        self.assertEqual(context["student_list"], [student.admin.first_name+" Student" for student in students])
+        for i, student in enumerate(students):
+            self.assertEqual(context["attendance_present_list"][i], AttendanceReport.objects.filter(student_id=student, status=True).count())
+            self.assertEqual(context["attendance_absent_list"][i], AttendanceReport.objects.filter(student_id=student, status=False).count())
+
+    def test_query_count_does_not_grow_with_data(self):
+        create_course_with_students("Physics", self.staff_user, self.session_year, students=2, subjects=1, days=1)
+        with self.assertNumQueries(5):
+            staff_dashboard_context(self.staff_user.id)
+
+        create_course_with_students("Chemistry", self.staff_user, self.session_year, students=10, subjects=4, days=5)
+        with self.assertNumQueries(5):
+            context = staff_dashboard_context(self.staff_user.id)
+        self.assertEqual(context["students_count"], 12)
+        self.assertEqual(context["subject_count"], 5)
+
+
+class StudentDashboardTests(BaseDataTestCase):
+
+    def test_context(self):
+        course, subjects, students = create_course_with_students("Physics", self.staff_user, self.session_year, students=3, subjects=2, days=3)
+        student = students[0]
+
+        with self.assertNumQueries(2):
+            context = student_dashboard_context(student.id, course.id)
+
+        present = AttendanceReport.objects.filter(student_id=student, status=True).count()
+        absent = AttendanceReport.objects.filter(student_id=student, status=False).count()
+        self.assertEqual(context["total_attendance"], present + absent)
+        self.assertEqual(context["attendance_present"], present)
+        self.assertEqual(context["attendance_absent"], absent)
+        self.assertEqual(context["total_subjects"], 2)
+        self.assertEqual(context["subject_name"], [subject.subject_name for subject in subjects])
+        self.assertEqual(context["data_present"], [
+            AttendanceReport.objects.filter(student_id=student, attendance_id__subject_id=subject, status=True).count()
+            for subject in subjects
+        ])
+
+    def test_home_uses_logged_in_student(self):
+        course, subjects, students = create_course_with_students("Physics", self.staff_user, self.session_year, students=2, subjects=1, days=2)
+        self.client.force_login(students[1].admin)
+
+        response = self.client.get("/student_home/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["attendance_present"], AttendanceReport.objects.filter(student_id=students[1], status=True).count())
+        self.assertEqual(response.context["total_subjects"], 1)
+
+
+class DashboardCacheTests(BaseDataTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.course, self.subjects, self.students = create_course_with_students("Physics", self.staff_user, self.session_year, students=2, subjects=1, days=1)
+        self.other_staff = CustomUser.objects.create_user(username="other", password="password", email="other@example.com", user_type=2)
+        self.other_course, other_subjects, self.other_students = create_course_with_students("Chemistry", self.other_staff, self.session_year, students=1, subjects=1, days=1)
+        self.hod_user = CustomUser.objects.create_user(username="hod", password="password", email="hod@example.com", user_type=1)
+        self.scopes = ["hod"] + [
+            "%s:%s" % (scope, value)
+            for scope, values in (
+                ("staff", [self.staff_user.id, self.other_staff.id]),
+                ("student", [self.students[0].admin_id, self.students[1].admin_id, self.other_students[0].admin_id]),
+                ("course", [self.course.id, self.other_course.id]),
+                ("course_attendance", [self.course.id, self.other_course.id]),
+            )
+            for value in values
+        ]
+
+    def bumped(self, write):
+        # The scopes whose version changed once `write` committed
+        before = get_dashboard_versions(self.scopes)
+        with self.captureOnCommitCallbacks(execute=True):
+            write()
+        after = get_dashboard_versions(self.scopes)
+        return {scope for scope, old, new in zip(self.scopes, before, after) if old != new}
+
+    def test_writes_bump_only_their_scopes(self):
+        student = self.students[0]
+        staff = "staff:%s" % self.staff_user.id
+        course = "course:%s" % self.course.id
+        course_attendance = "course_attendance:%s" % self.course.id
+        writes = [
+            ("course", lambda: self.course.save(), {"hod", course}),
+            ("new course", lambda: Courses.objects.create(course_name="Biology").delete(), {"hod"}),
+            ("staff", lambda: self.staff_user.staffs.save(), {"hod", staff}),
+            ("subject", lambda: self.subjects[0].save(), {"hod", staff, course}),
+            ("student", lambda: student.save(), {"hod", "student:%s" % student.admin_id, course}),
+            ("attendance", lambda: Attendance.objects.create(subject_id=self.subjects[0], attendance_date="2021-07-01", session_year_id=self.session_year), {"hod", course_attendance}),
+            ("attendance report", lambda: AttendanceReport.objects.filter(student_id=student).first().save(), {"hod", "student:%s" % student.admin_id, course_attendance}),
+            ("result", lambda: StudentResult.objects.create(student_id=student, subject_id=self.subjects[0]), {"student:%s" % student.admin_id}),
+            ("student leave", lambda: LeaveReportStudent.objects.create(student_id=student, leave_date="2021-06-01", leave_message="Leave", leave_status=0), {"hod", "student:%s" % student.admin_id}),
+            ("staff leave", lambda: LeaveReportStaff.objects.create(staff_id=self.staff_user.staffs, leave_date="2021-06-01", leave_message="Leave", leave_status=0), {"hod", staff}),
+        ]
+        for name, write, scopes in writes:
+            with self.subTest(write=name):
+                self.assertEqual(self.bumped(write), scopes)
+
+    def test_bumps_wait_for_commit(self):
+        before = get_dashboard_versions(self.scopes)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.save()
+            self.assertEqual(get_dashboard_versions(self.scopes), before)
+        self.assertNotEqual(get_dashboard_versions(["hod"]), before[:1])
+
+    def test_hits_and_misses(self):
+        self.client.force_login(self.hod_user)
+        for response in (self.client.get(reverse("admin_home")), self.client.get(reverse("admin_home"))):
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(dashboard_cache_stats(), {"hits": 1, "misses": 1})
+
+        # A result only shows on the student's dashboard
+        with self.captureOnCommitCallbacks(execute=True):
+            StudentResult.objects.create(student_id=self.students[0], subject_id=self.subjects[0])
+        self.client.get(reverse("admin_home"))
+        self.assertEqual(dashboard_cache_stats(), {"hits": 2, "misses": 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Courses.objects.create(course_name="Biology")
+        response = self.client.get(reverse("admin_home"))
+        self.assertEqual(dashboard_cache_stats(), {"hits": 2, "misses": 2})
+        self.assertIn("Biology", response.context["course_name_list"])
+
+    def test_check_warns_about_per_process_cache(self):
+        # The shipped settings share the cache between processes
+        self.assertEqual(check_shared_dashboard_cache(None), [])
+        locmem = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+        with override_settings(CACHES=locmem, IMPORT_JOB_AUTOSTART=True):
+            self.assertEqual([warning.id for warning in check_shared_dashboard_cache(None)], ["student_management_app.W001"])
+        with override_settings(CACHES=locmem, IMPORT_JOB_AUTOSTART=False, ATTENDANCE_WRITE_BEHIND=False):
+            self.assertEqual(check_shared_dashboard_cache(None), [])
+        with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.db.DatabaseCache", "LOCATION": "dashboard_cache"}}, IMPORT_JOB_AUTOSTART=True):
+            self.assertEqual(check_shared_dashboard_cache(None), [])
+
+
+class AttendanceWriteTests(BaseDataTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.course, self.subjects, self.students = create_course_with_students("Physics", self.staff_user, self.session_year, students=4, subjects=1, days=1)
+        self.client.force_login(self.staff_user)
+
+    def save(self, marks):
+        return self.client.post(reverse("save_attendance_data"), {"student_ids": json.dumps(marks), "subject_id": self.subjects[0].id, "attendance_date": "2021-07-01", "session_year_id": self.session_year.id})
+
+    def test_save_rejects_unknown_students(self):
+        other_course, other_subjects, other_students = create_course_with_students("Chemistry", self.staff_user, self.session_year, students=1, subjects=1, days=0)
+        marks = [{"id": student.admin_id, "status": i % 2} for i, student in enumerate(self.students)]
+        marks += [{"id": other_students[0].admin_id, "status": 1}, {"id": 999999, "status": 1}, {"id": "x", "status": 1}]
+
+        response = self.save(marks)
+
+        self.assertEqual(response.json(), {"status": "OK", "created": True, "saved": 4, "changed": 0, "rejected": ["x", other_students[0].admin_id, 999999]})
+        attendance = Attendance.objects.get(subject_id=self.subjects[0], attendance_date="2021-07-01")
+        self.assertEqual(
+            dict(AttendanceReport.objects.filter(attendance_id=attendance).values_list('student_id', 'status')),
+            {student.id: bool(i % 2) for i, student in enumerate(self.students)}
+        )
+        self.assertEqual(find_attendance_summary_mismatches(), [])
+
+    def test_save_query_count_does_not_grow_with_class_size(self):
+        marks = [{"id": student.admin_id, "status": 1} for student in self.students]
+        with CaptureQueriesContext(connection) as small:
+            self.save(marks[:1])
+        Attendance.objects.filter(attendance_date="2021-07-01").delete()
+        with CaptureQueriesContext(connection) as large:
+            self.save(marks)
+        self.assertEqual(len(small), len(large))
+
+    def test_save_without_students_is_an_error(self):
+        response = self.save([{"id": 999999, "status": 1}])
+
+        self.assertEqual(response.json(), {"status": "Error", "created": False, "saved": 0, "changed": 0, "rejected": [999999]})
+        self.assertFalse(Attendance.objects.filter(attendance_date="2021-07-01").exists())
+
+    def test_save_rejects_other_staffs_subject(self):
+        other_staff = CustomUser.objects.create_user(username="other_staff", password="password", email="other_staff@example.com", user_type=2)
+        other_subject = Subjects.objects.create(subject_name="Other", course_id=self.course, staff_id=other_staff)
+        marks = [{"id": student.admin_id, "status": 1} for student in self.students]
+
+        for subject_id in [other_subject.id, 999999, "x"]:
+            response = self.client.post(reverse("save_attendance_data"), {"student_ids": json.dumps(marks), "subject_id": subject_id, "attendance_date": "2021-07-01", "session_year_id": self.session_year.id})
+            self.assertEqual(response.json(), {"status": "Error", "error": "Unknown subject", "created": False, "saved": 0, "changed": 0, "rejected": []})
+        self.assertFalse(Attendance.objects.filter(attendance_date="2021-07-01").exists())
+
+
+    def test_retried_save_merges_into_the_session(self):
+        marks = [{"id": student.admin_id, "status": 1} for student in self.students]
+        self.save(marks[:2])
+        marks[0]["status"] = 0
+
+        response = self.save(marks)
+
+        self.assertEqual(response.json(), {"status": "OK", "created": False, "saved": 2, "changed": 1, "rejected": []})
+        attendance = Attendance.objects.get(subject_id=self.subjects[0], attendance_date="2021-07-01")
+        self.assertEqual(
+            dict(AttendanceReport.objects.filter(attendance_id=attendance).values_list('student_id', 'status')),
+            {student.id: i != 0 for i, student in enumerate(self.students)}
+        )
+        self.assertEqual(find_attendance_summary_mismatches(), [])
+
+    def test_save_merges_into_reports_saved_concurrently(self):
+        marks = [{"id": student.admin_id, "status": 1} for student in self.students]
+        self.save(marks[:1])
+        saved = {}
+
+        def read_then_concurrent_save(attendance, admin_ids):
+            reports = session_reports(attendance, admin_ids)
+            # The same session is saved again between this save's read and its insert
+            if not saved:
+                saved["result"] = None
+                saved["result"] = save_attendance_session(self.subjects[0], self.session_year, "2021-07-01", {self.students[1].admin_id: False})
+            return reports
+
+        with mock.patch("student_management_app.attendance.session_reports", side_effect=read_then_concurrent_save):
+            response = self.save(marks)
+
+        self.assertEqual(saved["result"]["saved"], 1)
+        self.assertEqual(response.json(), {"status": "OK", "created": False, "saved": 2, "changed": 1, "rejected": []})
+        attendance = Attendance.objects.get(subject_id=self.subjects[0], attendance_date="2021-07-01")
+        self.assertEqual(
+            dict(AttendanceReport.objects.filter(attendance_id=attendance).values_list('student_id', 'status')),
+            {student.id: True for student in self.students}
+        )
+        self.assertEqual(find_attendance_summary_mismatches(), [])
+
+    def test_update_only_writes_changed_reports(self):
+        attendance = Attendance.objects.get(subject_id=self.subjects[0])
+        reports = dict(AttendanceReport.objects.filter(attendance_id=attendance).values_list('student_id', 'status'))
+        marks = [{"id": student.admin_id, "status": int(reports[student.id])} for student in self.students]
+        marks[0]["status"] = 1 - marks[0]["status"]
+        marks.append({"id": 999999, "status": 1})
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse("update_attendance_data"), {"student_ids": json.dumps(marks), "attendance_date": attendance.id})
+
+        self.assertEqual(response.json(), {"status": "OK", "changed": 1, "rejected": [999999]})
+        self.assertEqual(AttendanceReport.objects.get(attendance_id=attendance, student_id=self.students[0]).status, bool(marks[0]["status"]))
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE "student_management_app_attendancereport"')]), 1)
+        self.assertEqual(find_attendance_summary_mismatches(), [])
+
+    def save_batch(self, sessions):
+        return self.client.post(reverse("save_attendance_batch_data"), json.dumps({"sessions": sessions}), content_type="application/json")
+
+    def batch_session(self, date, marks, subject=None):
+        return {"subject_id": (subject or self.subjects[0]).id, "attendance_date": date, "session_year_id": self.session_year.id, "student_ids": marks}
+
+    def test_batch_saves_every_valid_session(self):
+        marks = [{"id": student.admin_id, "status": i % 2} for i, student in enumerate(self.students)]
+        other_staff = CustomUser.objects.create_user(username="other_staff", password="password", email="other_staff@example.com", user_type=2)
+        other_subject = Subjects.objects.create(subject_name="Other", course_id=self.course, staff_id=other_staff)
+        self.save(marks[:2])
+        marks[0]["status"] = 1
+
+        response = self.save_batch([
+            self.batch_session("2021-07-01", marks),
+            self.batch_session("2021-07-02", marks + [{"id": 999999, "status": 1}]),
+            self.batch_session("2021-07-02", marks),
+            self.batch_session("2021-13-01", marks),
+            self.batch_session("2021-07-03", marks, subject=other_subject),
+        ])
+
+        attendance = dict(Attendance.objects.filter(subject_id=self.subjects[0], attendance_date__gte="2021-07-01").values_list('attendance_date', 'id'))
+        self.assertEqual(response.json(), {"status": "OK", "sessions": [
+            {"status": "OK", "attendance_id": attendance[datetime.date(2021, 7, 1)], "created": False, "saved": 2, "changed": 1, "rejected": []},
+            {"status": "OK", "attendance_id": attendance[datetime.date(2021, 7, 2)], "created": True, "saved": 4, "changed": 0, "rejected": [999999]},
+            {"status": "Error", "error": "Session appears twice in the batch"},
+            {"status": "Error", "error": "Invalid attendance date"},
+            {"status": "Error", "error": "Unknown subject"},
+        ]})
+        for attendance_id in attendance.values():
+            self.assertEqual(
+                dict(AttendanceReport.objects.filter(attendance_id=attendance_id).values_list('student_id', 'status')),
+                {student.id: bool(mark["status"]) for student, mark in zip(self.students, marks)}
+            )
+        self.assertFalse(Attendance.objects.filter(subject_id=other_subject).exists())
+        self.assertEqual(find_attendance_summary_mismatches(), [])
+
+    @override_settings(ATTENDANCE_STORAGE="bitmap")
+    def test_batch_merges_into_sessions_saved_concurrently(self):
+        marks = [{"id": student.admin_id, "status": 1} for student in self.students]
+        bulk_create = Attendance.objects.bulk_create
+
+        def concurrent_save_then_insert(*args, **kwargs):
+            # The first session is saved as rows between the batch's read and its insert
+            with override_settings(ATTENDANCE_STORAGE="rows"):
+                save_attendance_session(self.subjects[0], self.session_year, "2021-07-01", {self.students[0].admin_id: False})
+            return bulk_create(*args, **kwargs)
+
+        with mock.patch.object(Attendance.objects, "bulk_create", side_effect=concurrent_save_then_insert):
+            response = self.save_batch([self.batch_session("2021-07-01", marks), self.batch_session("2021-07-02", marks)])
+
+        sessions = response.json()["sessions"]
+        self.assertEqual([(session["created"], session["saved"], session["changed"]) for session in sessions], [(False, 3, 1), (True, 4, 0)])
+        self.assertFalse(AttendanceBitmap.objects.filter(attendance_id=sessions[0]["attendance_id"]).exists())
+        self.assertEqual(AttendanceReport.objects.filter(attendance_id=sessions[0]["attendance_id"], status=True).count(), 4)
+        self.assertTrue(AttendanceBitmap.objects.filter(attendance_id=sessions[1]["attendance_id"]).exists())
+        self.assertEqual(find_attendance_summary_mismatches(), [])
+
+    def test_batch_query_count_does_not_grow_with_sessions(self):
+        marks = [{"id": student.admin_id, "status": 1} for student in self.students]
+        self.save(marks)
+        with CaptureQueriesContext(connection) as small:
+            self.save_batch([self.batch_session("2021-07-01", marks), self.batch_session("2021-07-02", marks)])
+        with CaptureQueriesContext(connection) as large:
+            response = self.save_batch([self.batch_session("2021-07-01", marks)] + [self.batch_session("2021-07-%02d" % day, marks) for day in range(3, 13)])
+        self.assertEqual([session["created"] for session in response.json()["sessions"]], [False] + [True] * 10)
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(find_attendance_summary_mismatches(), [])
+
+    @override_settings(ATTENDANCE_STORAGE="bitmap")
+    def test_batch_packs_new_sessions_with_bitmap_storage(self):
+        marks = [{"id": student.admin_id, "status": i % 2} for i, student in enumerate(self.students)]
+        self.save(marks[:2])
+
+        response = self.save_batch([self.batch_session("2021-07-01", marks), self.batch_session("2021-07-02", marks)])
+
+        self.assertEqual([session["saved"] for session in response.json()["sessions"]], [2, 4])
+        bitmap = AttendanceBitmap.objects.get(attendance_id__attendance_date="2021-07-02")
+        self.assertEqual(bitmap.present_count, 2)
+        self.assertEqual(find_attendance_summary_mismatches(), [])
+
+    def test_batch_rejects_malformed_payload(self):
+        response = self.client.post(reverse("save_attendance_batch_data"), {"sessions": "{}"})
+        self.assertEqual(response.json(), {"status": "Error", "sessions": []})
+
+
+class AttendanceSummaryTests(BaseDataTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.course, self.subjects, self.students = create_course_with_students("Physics", self.staff_user, self.session_year, students=3, subjects=2, days=2)
+        self.client.force_login(self.staff_user)
+
+    def summary(self, subject):
+        return {
+            student_id: (present, absent)
+            for student_id, present, absent in AttendanceSummary.objects.filter(subject_id=subject, session_year_id=self.session_year).values_list('student_id', 'present_count', 'absent_count')
+        }
+
+    def save(self, date, statuses, subject=None):
+        marks = [{"id": student.admin_id, "status": status} for student, status in zip(self.students, statuses)]
+        return self.client.post(reverse("save_attendance_data"), {"student_ids": json.dumps(marks), "subject_id": (subject or self.subjects[0]).id, "attendance_date": date, "session_year_id": self.session_year.id})
+
+    def test_deltas_follow_create_flip_and_delete(self):
+        subject = self.subjects[0]
+        before = self.summary(subject)
+        first, second, third = [student.id for student in self.students]
+
+        # Create
+        self.save("2021-07-01", [1, 0, 1])
+        self.assertEqual(self.summary(subject), {
+            first: (before[first][0] + 1, before[first][1]),
+            second: (before[second][0], before[second][1] + 1),
+            third: (before[third][0] + 1, before[third][1]),
+        })
+
+        # Status flip
+        attendance = Attendance.objects.get(subject_id=subject, attendance_date="2021-07-01")
+        marks = [{"id": student.admin_id, "status": status} for student, status in zip(self.students, [0, 0, 1])]
+        self.client.post(reverse("update_attendance_data"), {"student_ids": json.dumps(marks), "attendance_date": attendance.id})
+        self.assertEqual(self.summary(subject)[first], (before[first][0], before[first][1] + 1))
+
+        # Delete: no page removes a report, writers that do apply the negated delta
+        AttendanceReport.objects.filter(attendance_id=attendance, student_id=third).delete()
+        present, absent = status_delta(True)
+        apply_attendance_deltas(subject.id, self.session_year.id, {third: (-present, -absent)})
+        self.assertEqual(self.summary(subject)[third], before[third])
+        self.assertEqual(find_attendance_summary_mismatches(), [])
+
+    def test_counters_match_a_recount_after_mixed_writes(self):
+        self.save("2021-07-01", [1, 1, 0])
+        self.save("2021-07-01", [0, 1, 0])
+        self.save("2021-07-02", [1, 0, 1], subject=self.subjects[1])
+        attendance = Attendance.objects.get(subject_id=self.subjects[0], attendance_date="2021-06-01")
+        marks = [{"id": student.admin_id, "status": 1} for student in self.students]
+        self.client.post(reverse("update_attendance_data"), {"student_ids": json.dumps(marks), "attendance_date": attendance.id})
+        self.client.post(reverse("save_attendance_batch_data"), json.dumps({"sessions": [
+            {"subject_id": subject.id, "attendance_date": "2021-07-03", "session_year_id": self.session_year.id, "student_ids": marks[:2]}
+            for subject in self.subjects
+        ]}), content_type="application/json")
+
+        counters = {
+            (student_id, subject_id, session_year_id): (present, absent)
+            for student_id, subject_id, session_year_id, present, absent in AttendanceSummary.objects.values_list('student_id', 'subject_id', 'session_year_id', 'present_count', 'absent_count')
+        }
+        self.assertEqual(counters, count_attendance_reports())
+        self.assertEqual(counters[(self.students[0].id, self.subjects[0].id, self.session_year.id)], (3, 1))
+
+    def test_rebuild_refreshes_dashboards(self):
+        scopes = ["hod", "course:%s" % self.course.id, "course_attendance:%s" % self.course.id, "course:1"]
+        before = get_dashboard_versions(scopes)
+        with self.captureOnCommitCallbacks(execute=True):
+            rebuild_attendance_summary()
+        self.assertTrue(all(old != new for old, new in zip(before, get_dashboard_versions(scopes))))
+
+    def test_check_reports_tampered_rows(self):
+        call_command("rebuild_attendance_summary", check=True, stdout=io.StringIO())
+        AttendanceSummary.objects.filter(student_id=self.students[0], subject_id=self.subjects[0]).update(present_count=F('present_count') + 5)
+
+        stderr = io.StringIO()
+        with self.assertRaisesMessage(CommandError, "1 summary rows don't match AttendanceReport."):
+            call_command("rebuild_attendance_summary", check=True, stdout=io.StringIO(), stderr=stderr)
+        self.assertIn("student=%s subject=%s session_year=%s" % (self.students[0].id, self.subjects[0].id, self.session_year.id), stderr.getvalue())
+
+        call_command("rebuild_attendance_summary", stdout=io.StringIO())
+        self.assertEqual(find_attendance_summary_mismatches(), [])
+
+
+@override_settings(ATTENDANCE_WRITE_BEHIND=True, ATTENDANCE_QUEUE_THREAD=False)
+class AttendanceQueueTests(BaseDataTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.course, self.subjects, self.students = create_course_with_students("Physics", self.staff_user, self.session_year, students=4, subjects=1, days=0)
+        self.marks = [{"id": student.admin_id, "status": i % 2} for i, student in enumerate(self.students)]
+        self.client.force_login(self.staff_user)
+
+    def status(self, ticket):
+        return self.client.post(reverse("attendance_submission_status"), {"ticket": ticket})
+
+    def test_save_is_queued_until_drained(self):
+        response = self.client.post(reverse("save_attendance_data"), {"student_ids": json.dumps(self.marks + [{"id": 999999, "status": 1}]), "subject_id": self.subjects[0].id, "attendance_date": "2021-07-01", "session_year_id": self.session_year.id})
+        ticket = response.json()["ticket"]
+        self.assertEqual(response.json()["status"], "Queued")
+        self.assertEqual(self.status(ticket).json(), {"ticket": ticket, "status": "Pending", "sessions": []})
+        self.assertFalse(Attendance.objects.exists())
+
+        self.assertEqual(drain_attendance_queue(), 1)
+
+        attendance = Attendance.objects.get(subject_id=self.subjects[0], attendance_date="2021-07-01")
+        self.assertEqual(self.status(ticket).json(), {"ticket": ticket, "status": "Saved", "sessions": [
+            {"status": "OK", "attendance_id": attendance.id, "created": True, "saved": 4, "changed": 0, "rejected": [999999]}
+        ]})
+        self.assertEqual(AttendanceReport.objects.filter(attendance_id=attendance).count(), 4)
+        self.assertEqual(find_attendance_summary_mismatches(), [])
+        self.assertEqual(drain_attendance_queue(), 0)
+
+    def test_drains_in_batches_oldest_first(self):
+        tickets = [
+            enqueue_attendance(self.staff_user.id, [{"subject_id": self.subjects[0].id, "attendance_date": "2021-07-01", "session_year_id": self.session_year.id, "student_ids": self.marks}])
+            for status in (0, 1, 0)
+        ]
+        for mark in self.marks:
+            mark["status"] = 1
+        enqueue_attendance(self.staff_user.id, [{"subject_id": self.subjects[0].id, "attendance_date": "2021-07-01", "session_year_id": self.session_year.id, "student_ids": self.marks}])
+
+        self.assertEqual(drain_attendance_queue(batch_size=3), 3)
+        self.assertEqual(AttendanceSubmission.objects.filter(status=AttendanceSubmission.PENDING).count(), 1)
+        self.assertEqual(drain_attendance_queue(batch_size=3), 1)
+
+        self.assertEqual([self.status(ticket).json()["sessions"][0]["created"] for ticket in tickets], [True, False, False])
+        self.assertEqual(set(AttendanceReport.objects.values_list('status', flat=True)), {True})
+        self.assertEqual(find_attendance_summary_mismatches(), [])
+
+    def enqueue(self):
+        return enqueue_attendance(self.staff_user.id, [{"subject_id": self.subjects[0].id, "attendance_date": "2021-07-01", "session_year_id": self.session_year.id, "student_ids": self.marks}])
+
+    def test_claimed_submissions_are_left_to_their_worker(self):
+        first, second = self.enqueue(), self.enqueue()
+        # Another worker claimed the first submission
+        self.assertEqual([submission.ticket for submission in claim_attendance_submissions(1)], [first])
+
+        self.assertEqual(drain_attendance_queue(), 1)
+        self.assertEqual(self.status(first).json()["status"], "Processing")
+        self.assertEqual(self.status(second).json()["status"], "Saved")
+        self.assertEqual(drain_attendance_queue(), 0)
+
+        # ... and died: its claim is taken over once it times out
+        AttendanceSubmission.objects.filter(ticket=first).update(claimed_at=timezone.now() - datetime.timedelta(seconds=301))
+        self.assertEqual(drain_attendance_queue(), 1)
+        self.assertEqual(self.status(first).json()["status"], "Saved")
+
+    def test_database_errors_are_retried(self):
+        ticket = self.enqueue()
+        with mock.patch("student_management_app.attendance_queue.save_attendance_batch", side_effect=OperationalError("database is locked")):
+            self.assertEqual(drain_attendance_queue(), 1)
+        self.assertEqual(AttendanceSubmission.objects.filter(ticket=ticket).values_list('status', 'attempts').get(), (AttendanceSubmission.PENDING, 1))
+        self.assertEqual(self.status(ticket).json()["sessions"], [])
+
+        # Left alone until its retry delay is over
+        self.assertEqual(drain_attendance_queue(), 0)
+        AttendanceSubmission.objects.filter(ticket=ticket).update(not_before=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertEqual(drain_attendance_queue(), 1)
+        self.assertEqual(self.status(ticket).json()["status"], "Saved")
+        self.assertEqual(AttendanceReport.objects.count(), 4)
+
+    def test_batch_rolled_back_waits_before_its_retry(self):
+        ticket = self.enqueue()
+        with mock.patch.object(AttendanceSubmission.objects, "bulk_update", side_effect=OperationalError("database is locked")):
+            with self.assertRaises(OperationalError):
+                drain_attendance_queue()
+        self.assertEqual(AttendanceSubmission.objects.filter(ticket=ticket).values_list('status', 'attempts').get(), (AttendanceSubmission.PENDING, 1))
+        self.assertEqual(drain_attendance_queue(), 0)
+
+        AttendanceSubmission.objects.filter(ticket=ticket).update(not_before=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertEqual(drain_attendance_queue(), 1)
+        self.assertEqual(self.status(ticket).json()["status"], "Saved")
+
+    @override_settings(ATTENDANCE_QUEUE_MAX_ATTEMPTS=2, ATTENDANCE_QUEUE_RETRY_DELAY=0)
+    def test_submissions_fail_on_other_errors_or_too_many_retries(self):
+        locked, invalid = self.enqueue(), self.enqueue()
+        # Submissions are saved oldest first
+        with mock.patch("student_management_app.attendance_queue.save_attendance_batch", side_effect=[OperationalError("database is locked"), ValueError("invalid session")]):
+            self.assertEqual(drain_attendance_queue(), 2)
+        self.assertEqual(self.status(locked).json()["status"], "Pending")
+        self.assertEqual(self.status(invalid).json(), {"ticket": str(invalid), "status": "Failed", "sessions": [{"status": "Error", "error": "invalid session"}]})
+
+        with mock.patch("student_management_app.attendance_queue.save_attendance_batch", side_effect=OperationalError("database is locked")):
+            self.assertEqual(drain_attendance_queue(), 1)
+        self.assertEqual(self.status(locked).json(), {"ticket": str(locked), "status": "Failed", "sessions": [{"status": "Error", "error": "database is locked"}]})
+        self.assertFalse(Attendance.objects.exists())
+
+    def test_tickets_are_private_to_their_staff(self):
+        other_staff = CustomUser.objects.create_user(username="other_staff", password="password", email="other_staff@example.com", user_type=2)
+        ticket = enqueue_attendance(other_staff.id, [])
+        self.assertEqual(self.status(ticket).status_code, 404)
+        self.assertEqual(self.status("not-a-ticket").status_code, 404)
+
+
+class AttendanceJsonTests(BaseDataTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.course, self.subjects, self.students = create_course_with_students("Physics", self.staff_user, self.session_year, students=3, subjects=1, days=2)
+        self.client.force_login(self.staff_user)
+
+    def test_roster(self):
+        data = {"subject": self.subjects[0].id, "session_year": self.session_year.id}
+        response = self.client.post(reverse("get_students"), data)
+        self.assertEqual(response.json(), [{"id": student.admin_id, "name": student.admin.first_name+" Student"} for student in self.students])
+
+        response = self.client.post(reverse("get_students"), dict(data, format="compact"))
+        self.assertEqual(response.json(), {"fields": ["id", "name"], "rows": [[student.admin_id, student.admin.first_name+" Student"] for student in self.students]})
+
+    def test_roster_query_count_does_not_grow_with_class_size(self):
+        create_course_with_students("Chemistry", self.staff_user, self.session_year, students=10, subjects=1, days=0)
+        chemistry = Subjects.objects.get(subject_name="Chemistry Subject 0")
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(reverse("get_students"), {"subject": self.subjects[0].id, "session_year": self.session_year.id})
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.post(reverse("get_students"), {"subject": chemistry.id, "session_year": self.session_year.id})
+        self.assertEqual(len(response.json()), 10)
+        self.assertEqual(len(small), len(large))
+
+    def test_attendance_dates_and_reports(self):
+        attendance = Attendance.objects.filter(subject_id=self.subjects[0]).order_by('attendance_date')
+        response = self.client.post(reverse("get_attendance_dates"), {"subject": self.subjects[0].id, "session_year_id": self.session_year.id})
+        self.assertEqual(response.json(), [{"id": a.id, "attendance_date": str(a.attendance_date), "session_year_id": self.session_year.id} for a in attendance])
+
+        response = self.client.post(reverse("get_attendance_student"), {"attendance_date": attendance[0].id, "format": "compact"})
+        reports = AttendanceReport.objects.filter(attendance_id=attendance[0]).order_by('id')
+        self.assertEqual(response.json()["rows"], [[r.student_id.admin_id, r.student_id.admin.first_name+" Student", r.status] for r in reports])
+
+
+class AttendanceBitmapTests(BaseDataTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.course, self.subjects, self.students = create_course_with_students("Physics", self.staff_user, self.session_year, students=11, subjects=1, days=2)
+        self.client.force_login(self.staff_user)
+
+    def session_rows(self, attendance):
+        return self.client.post(reverse("get_attendance_student"), {"attendance_date": attendance.id}).json()
+
+    def test_count_bitmaps(self):
+        bitmaps = [
+            (pack_roster([3, 1, 2]), pack_marks([True, False, True]), 3),
+            (pack_roster([1, 2, 9]), pack_marks([True, False, False]), 3),
+        ]
+        self.assertEqual(count_bitmaps(bitmaps), {1: (1, 1), 2: (1, 1), 3: (1, 0), 9: (0, 1)})
+
+    def test_conversion_round_trip(self):
+        attendance_ids = list(Attendance.objects.values_list('id', flat=True))
+        before = {attendance_id: self.session_rows(Attendance(id=attendance_id)) for attendance_id in attendance_ids}
+
+        self.assertEqual(convert_to_bitmaps(attendance_ids), 2)
+        self.assertFalse(AttendanceReport.objects.exists())
+        self.assertEqual({attendance_id: self.session_rows(Attendance(id=attendance_id)) for attendance_id in attendance_ids}, before)
+        self.assertEqual(find_attendance_summary_mismatches(), [])
+
+        self.assertEqual(convert_to_rows(attendance_ids), 2)
+        self.assertFalse(AttendanceBitmap.objects.exists())
+        self.assertEqual({attendance_id: self.session_rows(Attendance(id=attendance_id)) for attendance_id in attendance_ids}, before)
+        self.assertEqual(find_attendance_summary_mismatches(), [])
+
+    def test_conversion_merges_sessions_holding_both_storages(self):
+        attendance = Attendance.objects.filter(subject_id=self.subjects[0]).first()
+        reports = dict(AttendanceReport.objects.filter(attendance_id=attendance).values_list('student_id', 'status'))
+        # A bitmap holding three of the row students (one with the other status) and a student without a row
+        AttendanceReport.objects.filter(attendance_id=attendance, student_id=self.students[-1]).delete()
+        apply_attendance_deltas(self.subjects[0].id, self.session_year.id, {self.students[-1].id: tuple(-count for count in status_delta(reports[self.students[-1].id]))})
+        marks = {student.id: reports[student.id] for student in self.students[:3]}
+        marks[self.students[0].id] = not marks[self.students[0].id]
+        marks[self.students[-1].id] = True
+        write_bitmap_marks(AttendanceBitmap(attendance_id=attendance), marks)
+        apply_attendance_deltas(self.subjects[0].id, self.session_year.id, {student_id: status_delta(status) for student_id, status in marks.items()})
+        self.assertEqual(find_attendance_summary_mismatches(), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            convert_to_bitmaps([attendance.id])
+        self.assertEqual(bitmap_statuses(AttendanceBitmap.objects.get(attendance_id=attendance)), {**reports, self.students[-1].id: True})
+        self.assertEqual(find_attendance_summary_mismatches(), [])
+
+        AttendanceReport.objects.create(attendance_id=attendance, student_id=self.students[1], status=not reports[self.students[1].id])
+        apply_attendance_deltas(self.subjects[0].id, self.session_year.id, {self.students[1].id: status_delta(not reports[self.students[1].id])})
+        with self.captureOnCommitCallbacks(execute=True):
+            convert_to_rows([attendance.id])
+        self.assertEqual(AttendanceReport.objects.get(attendance_id=attendance, student_id=self.students[1]).status, not reports[self.students[1].id])
+        self.assertEqual(find_attendance_summary_mismatches(), [])
+
+    def test_conversion_to_rows_skips_deleted_students(self):
+        attendance_ids = list(Attendance.objects.values_list('id', flat=True))
+        convert_to_bitmaps(attendance_ids)
+        self.students[0].admin.delete()
+
+        self.assertEqual(convert_to_rows(attendance_ids), 2)
+        self.assertEqual(AttendanceReport.objects.count(), 2 * (len(self.students) - 1))
+        self.assertFalse(AttendanceReport.objects.filter(student_id=self.students[0].id).exists())
+
+    @override_settings(ATTENDANCE_STORAGE="bitmap")
+    def test_bitmap_sessions_behave_like_rows(self):
+        marks = [{"id": student.admin_id, "status": i % 3 != 0} for i, student in enumerate(self.students)]
+        data = {"subject_id": self.subjects[0].id, "attendance_date": "2021-07-01", "session_year_id": self.session_year.id}
+        self.client.post(reverse("save_attendance_data"), dict(data, student_ids=json.dumps(marks[:5])))
+        response = self.client.post(reverse("save_attendance_data"), dict(data, student_ids=json.dumps(marks)))
+        self.assertEqual(response.json(), {"status": "OK", "created": False, "saved": 6, "changed": 0, "rejected": []})
+
+        attendance = Attendance.objects.get(attendance_date="2021-07-01")
+        self.assertFalse(AttendanceReport.objects.filter(attendance_id=attendance).exists())
+        self.assertEqual(self.session_rows(attendance), [{"id": student.admin_id, "name": student.admin.first_name+" Student", "status": i % 3 != 0} for i, student in enumerate(self.students)])
+
+        marks[1]["status"] = False
+        response = self.client.post(reverse("update_attendance_data"), {"student_ids": json.dumps(marks[:2] + [{"id": 999999, "status": 1}]), "attendance_date": attendance.id})
+        self.assertEqual(response.json(), {"status": "OK", "changed": 1, "rejected": [999999]})
+        self.assertEqual(find_attendance_summary_mismatches(), [])
+
+        self.client.force_login(self.students[1].admin)
+        response = self.client.post(reverse("student_view_attendance_post"), {"subject": self.subjects[0].id, "start_date": "2021-06-01", "end_date": "2021-07-31"})
+        self.assertEqual([row["status"] for row in response.context["attendance_reports"]], [
+            AttendanceReport.objects.get(student_id=self.students[1], attendance_id__attendance_date="2021-06-01").status,
+            AttendanceReport.objects.get(student_id=self.students[1], attendance_id__attendance_date="2021-06-02").status,
+            False,
+        ])
+
+
+class AttendanceExportTests(BaseDataTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.course, self.subjects, self.students = create_course_with_students("Physics", self.staff_user, self.session_year, students=3, subjects=2, days=3)
+        other_staff = CustomUser.objects.create_user(username="other", password="password", email="other@example.com", user_type=2)
+        create_course_with_students("Chemistry", other_staff, self.session_year, students=2, subjects=1, days=3)
+        self.range = {"start_date": "2021-06-01", "end_date": "2021-06-02"}
+
+    def expected_rows(self, subjects, students):
+        reports = AttendanceReport.objects.filter(
+            attendance_id__subject_id__in=subjects, student_id__in=students, attendance_id__attendance_date__lte="2021-06-02"
+        ).order_by('attendance_id__attendance_date', 'attendance_id__subject_id', 'student_id')
+        return [
+            [str(r.attendance_id.attendance_date), str(r.attendance_id.subject_id_id), r.attendance_id.subject_id.subject_name, str(r.student_id.admin_id), r.student_id.admin.first_name+" Student", str(r.status)]
+            for r in reports
+        ]
+
+    def test_staff_csv_only_has_own_subjects(self):
+        self.client.force_login(self.staff_user)
+        response = self.client.post(reverse("staff_attendance_export"), dict(self.range, subject="all", format="csv"))
+
+        self.assertTrue(response.streaming)
+        rows = list(csv.reader(b"".join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0], ["date", "subject_id", "subject", "student_id", "student", "status"])
+        self.assertEqual(rows[1:], self.expected_rows(self.subjects, self.students))
+
+    def test_student_xlsx_merges_both_storages(self):
+        expected = self.expected_rows(self.subjects, [self.students[0]])
+        convert_to_bitmaps(Attendance.objects.filter(subject_id=self.subjects[1]).values_list('id', flat=True))
+        self.client.force_login(self.students[0].admin)
+        response = self.client.post(reverse("student_attendance_export"), dict(self.range, subject="all", format="xlsx"))
+
+        sheet = openpyxl.load_workbook(io.BytesIO(b"".join(response.streaming_content))).active
+        rows = [[str(row[0].date())] + [str(value) for value in row[1:]] for row in sheet.iter_rows(min_row=2, values_only=True)]
+        self.assertEqual(rows, expected)
+
+    def test_student_view_all_subjects(self):
+        self.client.force_login(self.students[0].admin)
+        response = self.client.post(reverse("student_view_attendance_post"), dict(self.range, subject="all"))
+
+        self.assertIsNone(response.context["subject_obj"])
+        self.assertEqual(
+            [(row["attendance_date"], row["subject_name"]) for row in response.context["attendance_reports"]],
+            [(datetime.date(2021, 6, day), subject.subject_name) for day in (1, 2) for subject in self.subjects]
+        )
+
+    def test_student_view_rejects_other_subjects(self):
+        self.client.force_login(self.students[0].admin)
+        response = self.client.post(reverse("student_view_attendance_post"), dict(self.range, subject=self.subjects[1].id))
+        self.assertEqual(response.context["subject_obj"], self.subjects[1])
+        self.assertEqual({row["subject_name"] for row in response.context["attendance_reports"]}, {self.subjects[1].subject_name})
+
+        chemistry = Subjects.objects.get(subject_name="Chemistry Subject 0")
+        for subject in ("", "abc", chemistry.id, 999999):
+            response = self.client.post(reverse("student_view_attendance_post"), dict(self.range, subject=subject))
+            self.assertRedirects(response, reverse("student_view_attendance"), fetch_redirect_response=False)
+            # Messages pile up until a page shows them
+            self.assertEqual(str(list(get_messages(response.wsgi_request))[-1]), "Invalid Subject")
+
+    def test_bad_dates_redirect(self):
+        self.client.force_login(self.staff_user)
+        response = self.client.post(reverse("staff_attendance_export"), {"subject": "all", "start_date": "", "end_date": "2021-06-02"})
+        self.assertRedirects(response, reverse("staff_update_attendance"), fetch_redirect_response=False)
+        self.assertEqual([str(message) for message in get_messages(response.wsgi_request)], ["Invalid Date Range"])
+
+    def test_result_exports(self):
+        for i, student in enumerate(self.students):
+            StudentResult.objects.create(student_id=student, subject_id=self.subjects[0], subject_exam_marks=30+i*10, subject_assignment_marks=15)
+        chemistry = Subjects.objects.get(subject_name="Chemistry Subject 0")
+        StudentResult.objects.create(student_id=self.students[0], subject_id=chemistry, subject_exam_marks=50, subject_assignment_marks=20)
+
+        self.client.force_login(self.staff_user)
+        response = self.client.post(reverse("staff_result_export"), {"subject": "all", "format": "csv"})
+        rows = list(csv.reader(b"".join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0], ["subject_id", "subject", "student_id", "student", "assignment_marks", "exam_marks", "status"])
+        self.assertEqual([(row[3], row[5], row[6]) for row in rows[1:]], [
+            (student.admin.first_name+" Student", str(30.0+i*10), "Fail" if i == 0 else "Pass") for i, student in enumerate(self.students)
+        ])
+        response = self.client.post(reverse("staff_result_export"), {"subject": self.subjects[0].id, "format": "csv"})
+        self.assertEqual(len(list(csv.reader(b"".join(response.streaming_content).decode().splitlines()))), len(self.students) + 1)
+        for subject in ("", "abc", "1.5"):
+            self.assertEqual(self.client.post(reverse("staff_result_export"), {"subject": subject, "format": "csv"}).status_code, 400)
+
+        self.client.force_login(self.students[0].admin)
+        response = self.client.post(reverse("student_result_export"), {"format": "xlsx"})
+        sheet = openpyxl.load_workbook(io.BytesIO(b"".join(response.streaming_content))).active
+        self.assertEqual([row[1] for row in sheet.iter_rows(min_row=2, values_only=True)], ["Chemistry Subject 0", self.subjects[0].subject_name])
+
+    @skipUnless(find_spec("pyarrow"), "pyarrow is not installed")
+    def test_parquet_export(self):
+        import pyarrow.parquet
+
+        self.client.force_login(self.staff_user)
+        response = self.client.post(reverse("staff_attendance_export"), dict(self.range, subject="all", format="parquet"))
+        table = pyarrow.parquet.read_table(io.BytesIO(b"".join(response.streaming_content)))
+        self.assertEqual(table.column_names, ["date", "subject_id", "subject", "student_id", "student", "status"])
+        rows = [[str(value) for value in row.values()] for row in table.to_pylist()]
+        self.assertEqual(rows, self.expected_rows(self.subjects, self.students))
+
+
+class AttendanceArchiveTests(BaseDataTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.course, self.subjects, self.students = create_course_with_students("Physics", self.staff_user, self.session_year, students=5, subjects=2, days=3)
+        # Mixed storage: the second subject's sessions are packed
+        convert_to_bitmaps(Attendance.objects.filter(subject_id=self.subjects[1]).values_list('id', flat=True))
+        self.open_year = SessionYearModel.objects.create(session_start_year="2022-01-01", session_end_year="2022-12-31")
+        self.open_session = Attendance.objects.create(subject_id=self.subjects[0], attendance_date="2022-03-01", session_year_id=self.open_year)
+        AttendanceReport.objects.create(student_id=self.students[0], attendance_id=self.open_session, status=True)
+        rebuild_attendance_summary()
+        self.hod_user = CustomUser.objects.create_user(username="hod", password="password", email="hod@example.com", user_type=1)
+
+    def history(self):
+        # What the HOD, staff and student pages and the summaries show
+        self.client.force_login(self.hod_user)
+        dates = {
+            subject.id: self.client.post(reverse("admin_get_attendance_dates"), {"subject": subject.id, "session_year_id": self.session_year.id}).json()
+            for subject in self.subjects
+        }
+        sessions = {
+            row["id"]: self.client.post(reverse("admin_get_attendance_student"), {"attendance_date": row["id"]}).json()
+            for rows in dates.values() for row in rows
+        }
+        export = self.client.post(reverse("admin_attendance_export"), {"subject": "all", "start_date": "2021-06-01", "end_date": "2022-03-01", "format": "csv"})
+        self.client.force_login(self.students[1].admin)
+        student = self.client.post(reverse("student_view_attendance_post"), {"subject": "all", "start_date": "2021-06-01", "end_date": "2021-06-30"})
+        percentages = {(row.student_id_id, row.subject_id_id): (row.session_present, row.session_total) for row in attendance_percentages(self.session_year, as_of=datetime.date(2021, 12, 31))}
+        return {
+            "dates": dates,
+            "sessions": sessions,
+            "export": b"".join(export.streaming_content).decode(),
+            "student": student.context["attendance_reports"],
+            "staff_dashboard": staff_dashboard_context(self.staff_user.id),
+            "percentages": percentages,
+        }
+
+    def test_archive_keeps_history_readable(self):
+        before = self.history()
+        call_command("archive_session_years", date="2022-01-01", stdout=io.StringIO())
+
+        # Only the open year is left in the live tables
+        self.assertEqual(list(Attendance.objects.values_list('id', flat=True)), [self.open_session.id])
+        self.assertEqual(AttendanceReport.objects.count(), 1)
+        self.assertFalse(AttendanceBitmap.objects.exists())
+        self.assertEqual(ArchivedAttendance.objects.count(), 6)
+        self.assertIsNotNone(SessionYearModel.objects.get(id=self.session_year.id).archived_at)
+        self.assertIsNone(SessionYearModel.objects.get(id=self.open_year.id).archived_at)
+
+        self.assertEqual(self.history(), before)
+        self.assertEqual(find_attendance_summary_mismatches(), [])
+        rebuild_attendance_summary()
+        self.assertEqual(find_attendance_summary_mismatches(), [])
+
+    def test_archived_year_is_read_only(self):
+        archive_session_year(self.session_year)
+        self.client.force_login(self.staff_user)
+        data = {"subject_id": self.subjects[0].id, "attendance_date": "2021-07-01", "session_year_id": self.session_year.id, "student_ids": json.dumps([{"id": self.students[0].admin_id, "status": 1}])}
+        self.assertEqual(self.client.post(reverse("save_attendance_data"), data).json()["status"], "Error")
+        response = self.client.post(reverse("save_attendance_batch_data"), {"sessions": json.dumps([dict(data, student_ids=json.loads(data["student_ids"]))])})
+        self.assertEqual(response.json()["sessions"], [{"status": "Error", "error": "Session year is archived"}])
+        self.assertFalse(Attendance.objects.filter(session_year_id=self.session_year).exists())
+
+    def test_restore_round_trip(self):
+        before = self.history()
+        self.assertEqual(archive_session_year(self.session_year), 6)
+        self.assertEqual(restore_session_year(self.session_year), 6)
+
+        self.assertFalse(ArchivedAttendance.objects.exists())
+        self.assertIsNone(self.session_year.archived_at)
+        self.assertEqual(self.history(), before)
+        self.assertEqual(find_attendance_summary_mismatches(), [])
+
+
+class QueryBudgetMixin:
+
+    @contextmanager
+    def assertMaxQueries(self, budget, label=""):
+        """
+        Fails if the block runs more than `budget` queries, listing the most
+        repeated query shapes to point at the N+1.
+        """
+        with CaptureQueriesContext(connection) as context:
+            yield context
+        if len(context) > budget:
+            shapes = Counter(query_shape(query['sql']) for query in context.captured_queries)
+            repeated = "\n".join("  %d x %s" % (count, shape[:200]) for shape, count in shapes.most_common(5))
+            self.fail("%s ran %d queries, budget is %d. Most repeated:\n%s" % (label, len(context), budget, repeated))
+
+
+class AttendanceAnalyticsTests(BaseDataTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.course, self.subjects, self.students = create_course_with_students("Physics", self.staff_user, self.session_year, students=4, subjects=2, days=6)
+        AttendanceReport.objects.filter(student_id=self.students[0]).update(status=True)
+        # Taken after the day the percentages are computed for
+        later = Attendance.objects.create(subject_id=self.subjects[0], attendance_date="2021-06-20", session_year_id=self.session_year)
+        AttendanceReport.objects.bulk_create([AttendanceReport(attendance_id=later, student_id=student, status=False) for student in self.students])
+        # Some sessions are packed
+        convert_to_bitmaps(Attendance.objects.filter(attendance_date__in=["2021-06-02", "2021-06-05"]).values_list('id', flat=True))
+
+    def expected(self, as_of, window_days):
+        # Counts every (student, subject) the slow way
+        window_start = as_of - datetime.timedelta(days=window_days)
+        counts = {}
+        for attendance in Attendance.objects.filter(attendance_date__lte=as_of):
+            bitmap = AttendanceBitmap.objects.filter(attendance_id=attendance).first()
+            if bitmap:
+                statuses = bitmap_statuses(bitmap)
+            else:
+                statuses = dict(AttendanceReport.objects.filter(attendance_id=attendance).values_list('student_id', 'status'))
+            for student_id, status in statuses.items():
+                count = counts.setdefault((student_id, attendance.subject_id_id), [0, 0, 0, 0])
+                count[2] += status
+                count[3] += 1
+                if attendance.attendance_date > window_start:
+                    count[0] += status
+                    count[1] += 1
+        return counts
+
+    def test_percentages_match_counts(self):
+        as_of = datetime.date(2021, 6, 6)
+        rows = attendance_percentages(self.session_year, as_of=as_of, window_days=3, threshold=75)
+
+        self.assertEqual(
+            {(row.student_id_id, row.subject_id_id): [row.window_present, row.window_total, row.session_present, row.session_total] for row in rows},
+            self.expected(as_of, 3)
+        )
+        for row in rows:
+            self.assertAlmostEqual(row.session_percentage, 100.0 * row.session_present / row.session_total, places=2)
+            self.assertEqual(row.below_threshold, row.session_percentage < 75 or row.window_percentage < 75)
+        self.assertEqual({row.student_id_id for row in rows if not row.below_threshold}, {self.students[0].id})
+
+    def test_window_without_sessions(self):
+        rows = attendance_percentages(self.session_year, as_of=datetime.date(2021, 6, 15), window_days=3, threshold=60)
+        self.assertEqual({row.window_percentage for row in rows}, {None})
+        self.assertEqual({row.window_total for row in rows}, {0})
+
+    def test_refresh_replaces_stored_rows_and_feeds_alert_pages(self):
+        self.assertEqual(refresh_attendance_percentages(self.session_year, as_of=datetime.date(2021, 6, 30)), (8, 6))
+        self.assertEqual(refresh_attendance_percentages(self.session_year, as_of=datetime.date(2021, 6, 6), window_days=3), (8, 6))
+        self.assertEqual(AttendancePercentage.objects.count(), 8)
+        self.assertEqual(set(AttendancePercentage.objects.values_list('computed_for', flat=True)), {datetime.date(2021, 6, 6)})
+
+        self.client.force_login(self.staff_user)
+        response = self.client.get(reverse("staff_attendance_alerts"))
+        self.assertEqual(len(response.context["alerts"]), 6)
+        self.assertNotIn(self.students[0].admin.first_name, response.content.decode())
+        self.assertIn(self.students[1].admin.first_name, response.content.decode())
+
+
+class PasswordHashingTests(TestCase):
+
+    @override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+    def test_pool_keeps_order_and_salts_each_password(self):
+        passwords = ["password%d" % (i % 3) for i in range(9)]
+        hashes = hash_passwords(passwords, workers=2)
+
+        self.assertEqual(len(set(hashes)), 9)
+        for password, encoded in zip(passwords, hashes):
+            self.assertTrue(encoded.startswith("md5$"))
+            self.assertTrue(check_password(password, encoded))
+
+
+@override_settings(PASSWORD_HASHING_WORKERS=1, IMPORT_JOB_AUTOSTART=False)
+class StudentImportTests(BaseDataTestCase):
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        # Uploads are saved to MEDIA_ROOT
+        media_settings = override_settings(MEDIA_ROOT=media.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.hod_user = CustomUser.objects.create_user(username="hod", password="password", email="hod@example.com", user_type=1)
+        self.client.force_login(self.hod_user)
+
+    def upload(self, rows, header=("Roll Number", "Email", "Name", "Gender", "Address", "Course ID", "Session Year ID"), dry_run=False, file_format="xlsx"):
+        if file_format == "csv":
+            output = io.StringIO()
+            writer = csv.writer(output)
+            writer.writerow(header)
+            writer.writerows([["" if value is None else value for value in row] for row in rows])
+            content = output.getvalue().encode()
+        elif file_format == "parquet":
+            import pyarrow
+            import pyarrow.parquet
+
+            output = io.BytesIO()
+            columns = zip(*rows) if rows else [[] for column in header]
+            pyarrow.parquet.write_table(pyarrow.table({name: [None if value is None else str(value) for value in column] for name, column in zip(header, columns)}), output)
+            content = output.getvalue()
+        else:
+            workbook = openpyxl.Workbook()
+            workbook.active.append(header)
+            for row in rows:
+                workbook.active.append(row)
+            output = io.BytesIO()
+            workbook.save(output)
+            content = output.getvalue()
+        upload = SimpleUploadedFile("students." + file_format, content)
+        data = {"file": upload, "dry_run": "1"} if dry_run else {"file": upload}
+        return self.client.post(reverse("upload_students_excel"), data)
+
+    def import_sheet(self, rows, **kwargs):
+        # Uploads the rows and runs the queued job, returns the job's status
+        response = self.upload(rows, **kwargs)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(run_import_jobs(), 1)
+        return self.client.get(reverse("import_job_status"), {"job_id": response.json()["job_id"]}).json()
+
+    def student_row(self, i, **fields):
+        row = dict(roll=1000+i, email="import%d@example.com" % i, name="Import Student %d" % i, gender="Male", address="Address", course=1, session_year=self.session_year.id)
+        row.update(fields)
+        return (row["roll"], row["email"], row["name"], row["gender"], row["address"], row["course"], row["session_year"])
+
+    def test_imports_valid_rows_and_reports_bad_ones(self):
+        rows = [self.student_row(i) for i in range(5)]
+        rows[1] = self.student_row(1, course=999)
+        rows[2] = self.student_row(2, email="staff@example.com")
+        rows[3] = self.student_row(3, roll=1000)
+        rows.append(self.student_row(5, name=None))
+
+        job = self.import_sheet(rows)
+
+        self.assertEqual((job["status"], job["total"], job["processed"], job["remaining"]), ("Done", 6, 6, 0))
+        self.assertEqual((job["imported"], job["failed"]), (2, 4))
+        self.assertEqual(job["errors"], [
+            {"row": 3, "error": "Course ID 999 does not exist"},
+            {"row": 4, "error": "Email staff@example.com already exists"},
+            {"row": 5, "error": "Roll Number 1000 appears earlier in the file"},
+            {"row": 7, "error": "Name is empty"},
+        ])
+        student = Students.objects.select_related('admin').get(admin__username="1004")
+        self.assertEqual((student.admin.first_name, student.admin.last_name, student.admin.user_type), ("Import", "Student 4", CustomUser.STUDENT))
+        self.assertEqual((student.course_id_id, student.session_year_id_id, student.gender), (1, self.session_year.id, "Male"))
+        self.assertTrue(student.admin.check_password("defaultpassword123"))
+        self.assertEqual(Students.objects.filter(admin__username__startswith="100").count(), 2)
+
+    def test_optional_password_column(self):
+        header = ("Roll Number", "Email", "Name", "Gender", "Address", "Course ID", "Session Year ID", "Password")
+        job = self.import_sheet([self.student_row(0) + ("secret0",), self.student_row(1) + (None,)], header=header)
+
+        self.assertEqual(job["imported"], 2)
+        users = {user.username: user for user in CustomUser.objects.filter(username__in=["1000", "1001"])}
+        self.assertTrue(users["1000"].check_password("secret0"))
+        self.assertTrue(users["1001"].check_password("defaultpassword123"))
+
+    def test_dry_run_reports_every_bad_row_without_writing(self):
+        rows = [self.student_row(i) for i in range(8)]
+        rows[1] = self.student_row(1, course=999, session_year="x")
+        rows[2] = self.student_row(2, email="staff@example.com")
+        rows[3] = self.student_row(3, roll=1000)
+        rows[4] = self.student_row(4, roll="bad roll", email="not-an-email")
+        rows[5] = self.student_row(5, name="  ")
+        rows[6] = self.student_row(6, roll="staff")
+        rows.append((None,) * 7)
+        users = CustomUser.objects.count()
+
+        # Courses, session years and the usernames and emails taken
+        with self.assertNumQueries(3):
+            response = self.upload(rows, dry_run=True)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"rows": 8, "valid": 2, "message": "2 of 8 rows are valid", "errors": [
+            {"row": 3, "error": "Course ID 999 does not exist"},
+            {"row": 3, "error": "Session Year ID x does not exist"},
+            {"row": 4, "error": "Email staff@example.com already exists"},
+            {"row": 5, "error": "Roll Number 1000 appears earlier in the file"},
+            {"row": 6, "error": "Roll Number bad roll may only contain letters, digits and @.+-_"},
+            {"row": 6, "error": "Email not-an-email is not a valid address"},
+            {"row": 7, "error": "Name is empty"},
+            {"row": 8, "error": "Roll Number staff already exists"},
+        ]})
+        self.assertEqual(CustomUser.objects.count(), users)
+
+    def test_dry_run_predicts_import(self):
+        # The same file through both paths reports the same rows, in every format
+        rows = [self.student_row(i) for i in range(8)]
+        rows[0] = self.student_row(0, roll="bad roll", email="not-an-email")
+        rows[1] = self.student_row(1, course="1.0", session_year="%s.0" % self.session_year.id)
+        rows[2] = self.student_row(2, name="x" * 151)
+        rows[3] = self.student_row(3, session_year="1.5")
+        rows[4] = self.student_row(4, email="import1@example.com")
+        rows[5] = self.student_row(5, gender="g" * 51)
+        rows[6] = self.student_row(6, roll="r" * 151)
+
+        formats = ["xlsx", "csv"] + (["parquet"] if find_spec("pyarrow") else [])
+        for file_format in formats:
+            with self.subTest(file_format=file_format), transaction.atomic():
+                report = self.upload(rows, dry_run=True, file_format=file_format).json()
+                job = self.import_sheet(rows, file_format=file_format)
+
+                self.assertEqual(report["errors"], job["errors"])
+                self.assertEqual((report["valid"], report["rows"] - report["valid"]), (job["imported"], job["failed"]))
+                # Parquet numbers records from 1, the others count the header
+                offset = 1 if file_format == "parquet" else 2
+                self.assertEqual(sorted({error["row"] - offset for error in job["errors"]}), [0, 2, 3, 4, 5, 6])
+                self.assertEqual(Students.objects.get(admin__username="1001").course_id_id, 1)
+                self.assertTrue(CustomUser.objects.filter(username="1007").exists())
+                # Each format starts from the same users
+                transaction.set_rollback(True)
+
+    def test_csv_import_and_dry_run(self):
+        rows = [self.student_row(i) for i in range(4)]
+        rows[1] = self.student_row(1, course=999)
+        rows[2] = (None,) * 7
+        rows[3] = self.student_row(3, name="  ")
+        rows.append(self.student_row(4, name="NA Student"))
+
+        report = self.upload(rows, dry_run=True, file_format="csv").json()
+        self.assertEqual((report["rows"], report["valid"]), (4, 2))
+        self.assertEqual(report["errors"], [{"row": 3, "error": "Course ID 999 does not exist"}, {"row": 5, "error": "Name is empty"}])
+
+        job = self.import_sheet(rows, file_format="csv")
+        self.assertEqual((job["status"], job["total"], job["imported"]), ("Done", 4, 2))
+        self.assertEqual(job["errors"], [{"row": 3, "error": "Course ID 999 does not exist"}, {"row": 5, "error": "Name is empty"}])
+        self.assertEqual(CustomUser.objects.get(username="1004").first_name, "NA")
+
+    @skipUnless(find_spec("pyarrow"), "pyarrow is not installed")
+    def test_parquet_import_and_dry_run(self):
+        header = ("Roll Number", "Email", "Name", "Gender", "Address", "Course ID", "Session Year ID", "Unused")
+        rows = [self.student_row(i) + ("x",) for i in range(3)]
+        rows[1] = self.student_row(1, email="staff@example.com") + ("x",)
+
+        report = self.upload(rows, header=header, dry_run=True, file_format="parquet").json()
+        self.assertEqual((report["rows"], report["valid"]), (3, 2))
+        self.assertEqual(report["errors"], [{"row": 2, "error": "Email staff@example.com already exists"}])
+
+        job = self.import_sheet(rows, header=header, file_format="parquet")
+        self.assertEqual((job["status"], job["total"], job["imported"]), ("Done", 3, 2))
+        self.assertEqual(job["errors"], [{"row": 2, "error": "Email staff@example.com already exists"}])
+
+    def test_missing_column(self):
+        response = self.upload([], header=("Roll Number", "Email"))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["error"], "Missing columns: Name, Gender, Address, Course ID, Session Year ID")
+        self.assertFalse(ImportJob.objects.exists())
+
+    def test_dry_run_of_10k_rows_takes_under_a_second(self):
+        rows = [self.student_row(i) for i in range(10000)]
+        rows[10] = self.student_row(10, email="not-an-email")
+        rows[5000] = self.student_row(5000, roll=1000)
+        rows[9999] = self.student_row(9999, email="staff@example.com")
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(("Roll Number", "Email", "Name", "Gender", "Address", "Course ID", "Session Year ID"))
+        writer.writerows(rows)
+        upload = SimpleUploadedFile("students.csv", output.getvalue().encode())
+
+        start = time.perf_counter()
+        report = validate_student_sheet(upload)
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual((report["rows"], report["valid"]), (10000, 9997))
+        self.assertEqual(report["errors"], [
+            {"row": 12, "error": "Email not-an-email is not a valid address"},
+            {"row": 5002, "error": "Roll Number 1000 appears earlier in the file"},
+            {"row": 10001, "error": "Email staff@example.com already exists"},
+        ])
+        self.assertLess(elapsed, 1)
+
+    @override_settings(STUDENT_IMPORT_CHUNK_SIZE=10)
+    def test_query_count_grows_per_chunk_not_per_row(self):
+        with CaptureQueriesContext(connection) as small:
+            self.import_sheet([self.student_row(i) for i in range(2)])
+        with CaptureQueriesContext(connection) as large:
+            job = self.import_sheet([self.student_row(i) for i in range(100, 110)])
+        self.assertEqual(job["imported"], 10)
+        self.assertEqual(len(small), len(large))
+
+    @override_settings(STUDENT_IMPORT_CHUNK_SIZE=2)
+    def test_cancel_stops_running_job_after_current_chunk(self):
+        job_id = self.upload([self.student_row(i) for i in range(6)]).json()["job_id"]
+        job = claim_next_import_job()
+        self.assertEqual(job.id, job_id)
+
+        response = self.client.post(reverse("cancel_import_job"), {"job_id": job_id})
+        self.assertEqual((response.json()["status"], response.json()["cancel_requested"]), ("Running", True))
+        run_import_job(job)
+
+        status = self.client.get(reverse("import_job_status"), {"job_id": job_id}).json()
+        self.assertEqual((status["status"], status["total"], status["processed"], status["remaining"], status["imported"]), ("Cancelled", 6, 2, 4, 2))
+        self.assertEqual(Students.objects.filter(admin__username__startswith="100").count(), 2)
+        # Finished jobs can't be cancelled
+        self.assertEqual(self.client.post(reverse("cancel_import_job"), {"job_id": job_id}).status_code, 409)
+
+    def test_jobs_whose_worker_died_fail(self):
+        job_id = self.upload([self.student_row(i) for i in range(2)]).json()["job_id"]
+        job = claim_next_import_job()
+        self.assertEqual(self.client.get(reverse("import_job_status"), {"job_id": job_id}).json()["status"], "Running")
+
+        # The worker was killed before writing any progress
+        ImportJob.objects.filter(id=job_id).update(heartbeat_at=timezone.now() - datetime.timedelta(seconds=601))
+        status = self.client.get(reverse("import_job_status"), {"job_id": job_id}).json()
+        self.assertEqual((status["status"], status["error"]), ("Failed", "The import worker stopped responding"))
+        self.assertEqual(os.listdir(import_storage().location), [])
+        # Should it come back, it can't overwrite the outcome
+        run_import_job(job)
+        self.assertEqual(ImportJob.objects.get(id=job_id).status, ImportJob.FAILED)
+
+    def test_workers_fail_stale_jobs_before_claiming(self):
+        stale_id = self.upload([self.student_row(0)]).json()["job_id"]
+        claim_next_import_job()
+        ImportJob.objects.filter(id=stale_id).update(heartbeat_at=timezone.now() - datetime.timedelta(seconds=601))
+        job_id = self.upload([self.student_row(1)]).json()["job_id"]
+
+        self.assertEqual(run_import_jobs(), 1)
+        self.assertEqual(dict(ImportJob.objects.values_list('id', 'status')), {stale_id: ImportJob.FAILED, job_id: ImportJob.DONE})
+        self.assertIsNotNone(ImportJob.objects.get(id=job_id).heartbeat_at)
+
+    def test_cancel_queued_job_and_other_users_jobs(self):
+        job_id = self.upload([self.student_row(0)]).json()["job_id"]
+        other_hod = CustomUser.objects.create_user(username="hod2", password="password", email="hod2@example.com", user_type=1)
+        other_client = Client()
+        other_client.force_login(other_hod)
+        self.assertEqual(other_client.get(reverse("import_job_status"), {"job_id": job_id}).status_code, 404)
+        self.assertEqual(other_client.post(reverse("cancel_import_job"), {"job_id": job_id}).status_code, 409)
+
+        response = self.client.post(reverse("cancel_import_job"), {"job_id": job_id})
+        self.assertEqual(response.json()["status"], "Cancelled")
+        self.assertEqual(run_import_jobs(), 0)
+        self.assertFalse(CustomUser.objects.filter(username="1000").exists())
+        self.assertEqual(os.listdir(import_storage().location), [])
+
+
+@override_settings(CHANGE_FEED_SETTLE_SECONDS=0, CHANGE_FEED_TOKEN="feed-token")
+class ChangeFeedTests(BaseDataTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.course, self.subjects, self.students = create_course_with_students("Physics", self.staff_user, self.session_year, students=3, subjects=2, days=2)
+        # Ties on updated_at, which the cursor breaks by id
+        stamp = timezone.now() - datetime.timedelta(days=1)
+        AttendanceReport.objects.filter(id__in=AttendanceReport.objects.order_by('id').values('id')[:5]).update(updated_at=stamp)
+        self.hod_user = CustomUser.objects.create_user(username="hod", password="password", email="hod@example.com", user_type=1)
+        self.client.force_login(self.hod_user)
+
+    def pages(self, feed, cursor=None, limit=3):
+        rows = []
+        while True:
+            page = self.client.get(reverse("change_feed", kwargs={"feed": feed}), {"cursor": cursor or "", "limit": limit}).json()
+            rows += page["rows"]
+            cursor = page["next_cursor"]
+            if not page["has_more"]:
+                return rows, cursor
+
+    def test_pages_cover_every_row_once_in_keyset_order(self):
+        rows, cursor = self.pages("attendance_reports")
+        expected = list(AttendanceReport.objects.order_by('updated_at', 'id').values_list('id', flat=True))
+        self.assertEqual([row["id"] for row in rows], expected)
+        self.assertEqual(set(rows[0]), {"id", "student_id", "attendance_id", "status", "created_at", "updated_at"})
+
+        # Nothing new, then only the corrected report
+        self.assertEqual(self.pages("attendance_reports", cursor)[0], [])
+        report = AttendanceReport.objects.order_by('id').first()
+        report.status = not report.status
+        report.save()
+        changed, cursor = self.pages("attendance_reports", cursor)
+        self.assertEqual([(row["id"], row["status"]) for row in changed], [(report.id, report.status)])
+
+    def test_since_and_settling_rows(self):
+        since = (timezone.now() - datetime.timedelta(hours=1)).isoformat()
+        response = self.client.get(reverse("change_feed", kwargs={"feed": "attendance_reports"}), {"since": since, "limit": 100})
+        self.assertEqual(len(response.json()["rows"]), AttendanceReport.objects.count() - 5)
+
+        with override_settings(CHANGE_FEED_SETTLE_SECONDS=3600):
+            self.assertEqual(len(change_page("attendance_reports", limit=100)["rows"]), 5)
+
+    def test_pages_are_index_seeks(self):
+        # Within the 5 rows sharing a timestamp one query fills the page,
+        # past them a second one reads the later rows
+        cursor = change_page("attendance_reports", limit=2)["next_cursor"]
+        with CaptureQueriesContext(connection) as within:
+            cursor = change_page("attendance_reports", cursor, limit=2)["next_cursor"]
+        with CaptureQueriesContext(connection) as past:
+            page = change_page("attendance_reports", cursor, limit=2)
+        self.assertEqual((len(within), len(past)), (1, 2))
+        self.assertEqual(len(page["rows"]), 2)
+        for query in within.captured_queries + past.captured_queries:
+            plan, scans = explain(query["sql"], ())
+            self.assertEqual(scans, [])
+            self.assertTrue(any("attreport_changes_idx" in line for line in plan), plan)
+
+    def test_access_and_errors(self):
+        url = reverse("change_feed", kwargs={"feed": "results"})
+        self.assertEqual(Client().get(url).status_code, 403)
+        staff_client = Client()
+        staff_client.force_login(self.staff_user)
+        self.assertEqual(staff_client.get(url).status_code, 403)
+        self.assertEqual(Client().get(url, HTTP_AUTHORIZATION="Bearer feed-token").status_code, 200)
+        self.assertEqual(Client().get(url, HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+        self.assertEqual(self.client.get(reverse("change_feed", kwargs={"feed": "users"})).status_code, 404)
+        self.assertEqual(self.client.get(url, {"cursor": "not-a-cursor"}).status_code, 400)
+
+    def test_bulk_moves_show_up_in_the_packed_feeds(self):
+        rows = self.pages("attendance_reports")[0]
+        attendance = Attendance.objects.filter(subject_id=self.subjects[0]).order_by('id').first()
+        marks = sorted(({"student_id": row["student_id"], "status": row["status"]} for row in rows if row["attendance_id"] == attendance.id), key=lambda mark: mark["student_id"])
+
+        convert_to_bitmaps([attendance.id])
+        bitmaps = self.pages("attendance_bitmaps")[0]
+        self.assertEqual([(row["attendance_id"], row["marks"]) for row in bitmaps], [(attendance.id, marks)])
+        self.assertNotIn("roster", bitmaps[0])
+
+        archive_session_year(self.session_year)
+        archived, cursor = self.pages("archived_attendance")
+        self.assertEqual(len(archived), 4)
+        self.assertEqual([row["marks"] for row in archived if row["attendance_id"] == attendance.id], [marks])
+        self.assertEqual(self.pages("archived_attendance", cursor)[0], [])
+
+    def test_export_command_resumes_from_state(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        state, output = os.path.join(directory.name, "state.json"), os.path.join(directory.name, "changes.jsonl")
+
+        call_command("export_changes", "students", "attendance", state=state, output=output, page_size=2, stderr=io.StringIO())
+        with open(output) as lines:
+            exported = [json.loads(line) for line in lines]
+        self.assertEqual(Counter(line["feed"] for line in exported), {"students": 3, "attendance": 4})
+
+        self.students[0].address = "New Address"
+        self.students[0].save()
+        call_command("export_changes", "students", "attendance", state=state, output=output, stderr=io.StringIO())
+        with open(output) as lines:
+            exported = [json.loads(line) for line in lines][7:]
+        self.assertEqual(exported, [{"feed": "students", "row": json.loads(json.dumps(
+            Students.objects.values(*feed_fields(Students)).get(id=self.students[0].id), cls=DjangoJSONEncoder
+        ))}])
+
+
+class QueryBudgetTests(QueryBudgetMixin, BaseDataTestCase):
+    # Views that redirect once they're done, all others answer 200
+    REDIRECTS = {
+        "logout_user", "student_apply_leave_save", "student_feedback_save", "student_profile_update",
+        "staff_apply_leave_save", "staff_feedback_save", "staff_profile_update", "staff_add_result_save",
+        "add_staff_save", "edit_staff_save", "delete_staff", "add_course_save", "edit_course_save", "delete_course",
+        "add_session_save", "edit_session_save", "delete_session", "add_student_save", "edit_student_save", "delete_student",
+        "add_subject_save", "edit_subject_save", "delete_subject", "student_leave_approve", "student_leave_reject",
+        "staff_leave_approve", "staff_leave_reject", "admin_profile_update",
+    }
+
+    # Sent incomplete or wrong credentials, they answer with an error message
+    ERROR_PAGES = {"doLogin", "doRegistration"}
+
+    # Maximum number of queries per URL name against the data seeded below.
+    # Every named URL in urls.py must have a budget here.
+    QUERY_BUDGETS = {
+        "home": 0,
+        "contact": 0,
+        "login": 0,
+        "logout_user": 4,
+        "registration": 0,
+        "doLogin": 1,
+        "doRegistration": 0,
+        "metrics": 0,
+        "change_feed": 3,
+        "upload_students_excel": 3,
+        "upload_file": 2,
+        "import_job_status": 3,
+        "cancel_import_job": 5,
+        "student_home": 5,
+        "student_view_attendance": 5,
+        "student_view_attendance_post": 6,
+        "student_attendance_export": 5,
+        "student_apply_leave": 4,
+        "student_apply_leave_save": 4,
+        "student_feedback": 4,
+        "student_feedback_save": 4,
+        "student_profile": 4,
+        "student_profile_update": 6,
+        "student_view_result": 4,
+        "student_result_export": 3,
+        "staff_home": 8,
+        "staff_take_attendance": 4,
+        "get_students": 1,
+        "save_attendance_data": 19,
+        "save_attendance_batch_data": 19,
+        "attendance_submission_status": 3,
+        "staff_update_attendance": 4,
+        "get_attendance_dates": 1,
+        "get_attendance_student": 2,
+        "update_attendance_data": 12,
+        "staff_attendance_export": 4,
+        "staff_attendance_alerts": 3,
+        "staff_apply_leave": 4,
+        "staff_apply_leave_save": 4,
+        "staff_feedback": 2,
+        "staff_feedback_save": 4,
+        "staff_profile": 4,
+        "staff_profile_update": 6,
+        "staff_add_result": 4,
+        "staff_add_result_save": 6,
+        "staff_result_export": 3,
+        "admin_home": 12,
+        "add_staff": 2,
+        "add_staff_save": 5,
+        "manage_staff": 3,
+        "edit_staff": 4,
+        "edit_staff_save": 4,
+        "delete_staff": 7,
+        "add_course": 2,
+        "add_course_save": 1,
+        "manage_course": 3,
+        "edit_course": 3,
+        "edit_course_save": 2,
+        "delete_course": 3,
+        "manage_session": 3,
+        "add_session": 2,
+        "add_session_save": 1,
+        "edit_session": 3,
+        "edit_session_save": 2,
+        "delete_session": 7,
+        "add_student": 4,
+        "add_student_save": 11,
+        "edit_student": 11,
+        "edit_student_save": 12,
+        "manage_student": 3,
+        "delete_student": 12,
+        "add_subject": 4,
+        "add_subject_save": 3,
+        "manage_subject": 3,
+        "edit_subject": 7,
+        "edit_subject_save": 4,
+        "delete_subject": 5,
+        "check_email_exist": 1,
+        "check_username_exist": 1,
+        "student_feedback_message": 3,
+        "student_feedback_message_reply": 2,
+        "staff_feedback_message": 3,
+        "staff_feedback_message_reply": 2,
+        "student_leave_view": 3,
+        "student_leave_approve": 3,
+        "student_leave_reject": 3,
+        "staff_leave_view": 3,
+        "staff_leave_approve": 3,
+        "staff_leave_reject": 3,
+        "admin_view_attendance": 4,
+        "admin_get_attendance_dates": 1,
+        "admin_get_attendance_student": 2,
+        "admin_attendance_export": 2,
+        "admin_attendance_alerts": 3,
+        "admin_profile": 3,
+        "admin_profile_update": 4,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.hod_user = CustomUser.objects.create_user(username="hod", password="password", email="hod@example.com", first_name="Head", last_name="Department", user_type=1)
+        cls.course, cls.subjects, cls.students = create_course_with_students("Physics", cls.staff_user, cls.session_year, students=5, subjects=2, days=3)
+        cls.student_user = cls.students[0].admin
+        cls.attendance = Attendance.objects.filter(subject_id=cls.subjects[0]).first()
+
+        # Spare rows for the delete views
+        cls.spare_course = Courses.objects.create(course_name="Spare")
+        cls.spare_session = SessionYearModel.objects.create(session_start_year="2019-01-01", session_end_year="2019-12-31")
+        cls.spare_subject = Subjects.objects.create(subject_name="Spare", course_id=cls.course, staff_id=cls.staff_user)
+
+        for student in cls.students:
+            LeaveReportStudent.objects.create(student_id=student, leave_date="2021-06-01", leave_message="Leave", leave_status=0)
+            FeedBackStudent.objects.create(student_id=student, feedback="Feedback", feedback_reply="")
+            StudentResult.objects.create(student_id=student, subject_id=cls.subjects[0], subject_exam_marks=40, subject_assignment_marks=20)
+        cls.student_leave = LeaveReportStudent.objects.first()
+        cls.staff_leave = LeaveReportStaff.objects.create(staff_id=cls.staff_user.staffs, leave_date="2021-06-01", leave_message="Leave", leave_status=0)
+        cls.student_feedback = FeedBackStudent.objects.first()
+        cls.staff_feedback = FeedBackStaffs.objects.create(staff_id=cls.staff_user.staffs, feedback="Feedback", feedback_reply="")
+        refresh_attendance_percentages(cls.session_year, as_of=datetime.date(2021, 6, 30))
+        cls.ticket = enqueue_attendance(cls.staff_user.id, [])
+        cls.import_job = ImportJob.objects.create(created_by=cls.hod_user, file_name="students.xlsx")
+
+    def url_specs(self):
+        # url name -> (user, method, url kwargs, data)
+        students_json = json.dumps([{"id": student.admin_id, "status": i % 2} for i, student in enumerate(self.students)])
+        profile = {"first_name": "First", "last_name": "Last", "password": "", "address": "Address"}
+        new_student = {
+            "first_name": "New", "last_name": "Student", "username": "new_student", "email": "new_student@example.com",
+            "address": "Address", "course_id": self.course.id, "session_year_id": self.session_year.id, "gender": "Male",
+        }
+        anonymous = None
+        hod, staff, student = self.hod_user, self.staff_user, self.student_user
+        return {
+            "home": (anonymous, "get", {}, {}),
+            "contact": (anonymous, "get", {}, {}),
+            "login": (anonymous, "get", {}, {}),
+            "logout_user": (hod, "get", {}, {}),
+            "registration": (anonymous, "get", {}, {}),
+            "doLogin": (anonymous, "get", {}, {"email": "hod@example.com", "password": "wrong"}),
+            "doRegistration": (anonymous, "get", {}, {}),
+            "metrics": (anonymous, "get", {}, {}),
+            "change_feed": (hod, "get", {"feed": "students"}, {}),
+            "upload_students_excel": (hod, "post", {}, {"dry_run": "1", "file": SimpleUploadedFile("students.csv", b"Roll Number,Email,Name,Gender,Address,Course ID,Session Year ID\n2000,new_student@example.com,New Student,Male,Address,%d,%d\n" % (self.course.id, self.session_year.id))}),
+            "upload_file": (hod, "get", {}, {}),
+            "import_job_status": (hod, "get", {}, {"job_id": self.import_job.id}),
+            "cancel_import_job": (hod, "post", {}, {"job_id": self.import_job.id}),
+            "student_home": (student, "get", {}, {}),
+            "student_view_attendance": (student, "get", {}, {}),
+            "student_view_attendance_post": (student, "post", {}, {"subject": self.subjects[0].id, "start_date": "2021-06-01", "end_date": "2021-06-30"}),
+            "student_attendance_export": (student, "post", {}, {"subject": "all", "start_date": "2021-06-01", "end_date": "2021-06-30", "format": "csv"}),
+            "student_apply_leave": (student, "get", {}, {}),
+            "student_apply_leave_save": (student, "post", {}, {"leave_date": "2021-06-10", "leave_message": "Leave"}),
+            "student_feedback": (student, "get", {}, {}),
+            "student_feedback_save": (student, "post", {}, {"feedback_message": "Feedback"}),
+            "student_profile": (student, "get", {}, {}),
+            "student_profile_update": (student, "post", {}, profile),
+            "student_view_result": (student, "get", {}, {}),
+            "student_result_export": (student, "post", {}, {"format": "csv"}),
+            "staff_home": (staff, "get", {}, {}),
+            "staff_take_attendance": (staff, "get", {}, {}),
+            "get_students": (staff, "post", {}, {"subject": self.subjects[0].id, "session_year": self.session_year.id}),
+            "save_attendance_data": (staff, "post", {}, {"student_ids": students_json, "subject_id": self.subjects[0].id, "attendance_date": "2021-07-01", "session_year_id": self.session_year.id}),
+            "save_attendance_batch_data": (staff, "post", {}, {"sessions": json.dumps([{"subject_id": self.subjects[0].id, "attendance_date": date, "session_year_id": self.session_year.id, "student_ids": json.loads(students_json)} for date in ["2021-07-01", "2021-07-02"]])}),
+            "attendance_submission_status": (staff, "post", {}, {"ticket": self.ticket}),
+            "staff_update_attendance": (staff, "get", {}, {}),
+            "get_attendance_dates": (staff, "post", {}, {"subject": self.subjects[0].id, "session_year_id": self.session_year.id}),
+            "get_attendance_student": (staff, "post", {}, {"attendance_date": self.attendance.id}),
+            "update_attendance_data": (staff, "post", {}, {"student_ids": students_json, "attendance_date": self.attendance.id}),
+            "staff_attendance_export": (staff, "post", {}, {"subject": "all", "start_date": "2021-06-01", "end_date": "2021-06-30", "format": "csv"}),
+            "staff_attendance_alerts": (staff, "get", {}, {}),
+            "staff_apply_leave": (staff, "get", {}, {}),
+            "staff_apply_leave_save": (staff, "post", {}, {"leave_date": "2021-06-10", "leave_message": "Leave"}),
+            "staff_feedback": (staff, "get", {}, {}),
+            "staff_feedback_save": (staff, "post", {}, {"feedback_message": "Feedback"}),
+            "staff_profile": (staff, "get", {}, {}),
+            "staff_profile_update": (staff, "post", {}, profile),
+            "staff_add_result": (staff, "get", {}, {}),
+            "staff_add_result_save": (staff, "post", {}, {"student_list": self.student_user.id, "assignment_marks": 10, "exam_marks": 30, "subject": self.subjects[0].id}),
+            "staff_result_export": (staff, "post", {}, {"subject": "all", "format": "csv"}),
+            "admin_home": (hod, "get", {}, {}),
+            "add_staff": (hod, "get", {}, {}),
+            "add_staff_save": (hod, "post", {}, {"first_name": "New", "last_name": "Staff", "username": "new_staff", "email": "new_staff@example.com", "password": "password", "address": "Address"}),
+            "manage_staff": (hod, "get", {}, {}),
+            "edit_staff": (hod, "get", {"staff_id": staff.id}, {}),
+            "edit_staff_save": (hod, "post", {}, {"staff_id": staff.id, "username": "staff", "email": "staff@example.com", "first_name": "Staff", "last_name": "User", "address": "Address"}),
+            "delete_staff": (hod, "get", {"staff_id": staff.id}, {}),
+            "add_course": (hod, "get", {}, {}),
+            "add_course_save": (hod, "post", {}, {"course": "Chemistry"}),
+            "manage_course": (hod, "get", {}, {}),
+            "edit_course": (hod, "get", {"course_id": self.course.id}, {}),
+            "edit_course_save": (hod, "post", {}, {"course_id": self.course.id, "course": "Physics"}),
+            "delete_course": (hod, "get", {"course_id": self.spare_course.id}, {}),
+            "manage_session": (hod, "get", {}, {}),
+            "add_session": (hod, "get", {}, {}),
+            "add_session_save": (hod, "post", {}, {"session_start_year": "2022-01-01", "session_end_year": "2022-12-31"}),
+            "edit_session": (hod, "get", {"session_id": self.session_year.id}, {}),
+            "edit_session_save": (hod, "post", {}, {"session_id": self.session_year.id, "session_start_year": "2021-01-01", "session_end_year": "2021-12-31"}),
+            "delete_session": (hod, "get", {"session_id": self.spare_session.id}, {}),
+            "add_student": (hod, "get", {}, {}),
+            "add_student_save": (hod, "post", {}, dict(new_student, password="password")),
+            "edit_student": (hod, "get", {"student_id": student.id}, {}),
+            "edit_student_save": (hod, "post", {}, dict(new_student, username=student.username, email=student.email)),
+            "manage_student": (hod, "get", {}, {}),
+            "delete_student": (hod, "get", {"student_id": self.students[-1].admin_id}, {}),
+            "add_subject": (hod, "get", {}, {}),
+            "add_subject_save": (hod, "post", {}, {"subject": "Optics", "course": self.course.id, "staff": staff.id}),
+            "manage_subject": (hod, "get", {}, {}),
+            "edit_subject": (hod, "get", {"subject_id": self.subjects[0].id}, {}),
+            "edit_subject_save": (hod, "post", {}, {"subject_id": self.subjects[0].id, "subject": "Mechanics", "course": self.course.id, "staff": staff.id}),
+            "delete_subject": (hod, "get", {"subject_id": self.spare_subject.id}, {}),
+            "check_email_exist": (hod, "post", {}, {"email": "staff@example.com"}),
+            "check_username_exist": (hod, "post", {}, {"username": "staff"}),
+            "student_feedback_message": (hod, "get", {}, {}),
+            "student_feedback_message_reply": (hod, "post", {}, {"id": self.student_feedback.id, "reply": "Reply"}),
+            "staff_feedback_message": (hod, "get", {}, {}),
+            "staff_feedback_message_reply": (hod, "post", {}, {"id": self.staff_feedback.id, "reply": "Reply"}),
+            "student_leave_view": (hod, "get", {}, {}),
+            "student_leave_approve": (hod, "get", {"leave_id": self.student_leave.id}, {}),
+            "student_leave_reject": (hod, "get", {"leave_id": self.student_leave.id}, {}),
+            "staff_leave_view": (hod, "get", {}, {}),
+            "staff_leave_approve": (hod, "get", {"leave_id": self.staff_leave.id}, {}),
+            "staff_leave_reject": (hod, "get", {"leave_id": self.staff_leave.id}, {}),
+            "admin_view_attendance": (hod, "get", {}, {}),
+            "admin_get_attendance_dates": (hod, "post", {}, {"subject": self.subjects[0].id, "session_year_id": self.session_year.id}),
+            "admin_get_attendance_student": (hod, "post", {}, {"attendance_date": self.attendance.id}),
+            "admin_attendance_export": (hod, "post", {}, {"subject": "all", "start_date": "2021-06-01", "end_date": "2021-06-30", "format": "csv"}),
+            "admin_attendance_alerts": (hod, "get", {}, {}),
+            "admin_profile": (hod, "get", {}, {}),
+            "admin_profile_update": (hod, "post", {}, profile),
+        }
+
+    def url_sessions(self):
+        # url name -> session data left by the page before it
+        return {"edit_student_save": {"student_id": str(self.student_user.id)}}
+
+    def test_every_url_has_a_budget(self):
+        names = {pattern.name for pattern in urls.urlpatterns if isinstance(pattern, URLPattern)}
+        self.assertEqual(names - set(self.QUERY_BUDGETS), set())
+        self.assertEqual(set(self.url_specs()), set(self.QUERY_BUDGETS))
+
+    def test_query_budgets(self):
+        for name, (user, method, kwargs, data) in self.url_specs().items():
+            with self.subTest(url=name):
+                client = Client(raise_request_exception=False)
+                if user is not None:
+                    client.force_login(user)
+                if name in self.url_sessions():
+                    session = client.session
+                    session.update(self.url_sessions()[name])
+                    session.save()
+                cache.clear()
+                with transaction.atomic():
+                    with self.assertMaxQueries(self.QUERY_BUDGETS[name], name):
+                        response = getattr(client, method)(reverse(name, kwargs=kwargs), data)
+                        # Streamed responses run their queries while being read
+                        if response.streaming:
+                            b"".join(response.streaming_content)
+                    # A budget only counts if the request did its work
+                    self.assertEqual(response.status_code, 302 if name in self.REDIRECTS else 200)
+                    if name not in self.ERROR_PAGES:
+                        self.assertEqual([str(message) for message in get_messages(response.wsgi_request) if message.level == messages.ERROR], [])
+                    # Keep each request's writes away from the next one
+                    transaction.set_rollback(True)
+
+
+class QueryShapeRecorderTests(BaseDataTestCase):
+
+    def test_repeated_shapes(self):
+        course, subjects, students = create_course_with_students("Physics", self.staff_user, self.session_year, students=4, subjects=1, days=1)
+        recorder = QueryShapeRecorder()
+        with connection.execute_wrapper(recorder):
+            for student in Students.objects.filter(course_id=course):
+                student.admin.first_name
+
+        repeated = recorder.repeated(threshold=4)
+        self.assertEqual(len(repeated), 1)
+        shape, count, call_site = repeated[0]
+        self.assertEqual(count, 4)
+        self.assertIn("student_management_app_customuser", shape)
+        self.assertIn("tests.py", call_site)
+
+
+class ExplainQueriesTests(BaseDataTestCase):
+
+    def test_flags_full_scans_only(self):
+        plan, scans = explain(str(Courses.objects.all().query), ())
+        self.assertEqual(scans, [Courses._meta.db_table])
+
+        dates = Attendance.objects.filter(subject_id=1, session_year_id=1).order_by('attendance_date')
+        sql, params = dates.query.sql_with_params()
+        plan, scans = explain(sql, params)
+        self.assertEqual(scans, [])
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"], ALLOWED_HOSTS=["localhost"])
+class DatasetCommandTests(TestCase):
+
+    def test_generate_and_benchmark(self):
+        call_command("generate_dataset", courses=2, subjects=2, staff=2, students=6, days=3, seed=1, prefix="smoke", stdout=io.StringIO())
+
+        self.assertEqual(
+            [model.objects.count() for model in (Courses, Subjects, Staffs, Students, Attendance, AttendanceReport, StudentResult)],
+            # 3 students per course, a session per subject and day
+            [2, 4, 2, 6, 12, 36, 12]
+        )
+        self.assertEqual(find_attendance_summary_mismatches(), [])
+        self.assertEqual(sum(AttendanceSummary.objects.values_list(F('present_count') + F('absent_count'), flat=True)), 36)
+
+        CustomUser.objects.create_user(username="hod", password="password", email="hod@example.com", user_type=1)
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "benchmark.json")
+            call_command("benchmark_dashboards", iterations=1, output=output, stdout=io.StringIO())
+            with open(output) as report_file:
+                report = json.load(report_file)
+
+        self.assertEqual(report["iterations"], 1)
+        self.assertIn("admin_home", report["endpoints"])
+        for name, result in report["endpoints"].items():
+            self.assertEqual(result["status_code"], 200, name)
+            self.assertGreater(result["queries"], 0, name)
+        # The benchmark rolls its writes back
+        self.assertEqual(AttendanceReport.objects.count(), 36)
+
+        for iterations in [0, -1]:
+            with self.assertRaisesMessage(CommandError, "--iterations must be at least 1."):
+                call_command("benchmark_dashboards", iterations=iterations, output=output, stdout=io.StringIO())
+
+
+class MetricsTests(BaseDataTestCase):
+
+    def setUp(self):
+        super().setUp()
+        registry.reset()
+
+    def test_records_requests_per_url_name(self):
+        self.client.force_login(self.staff_user)
+        self.client.get("/staff_home/")
+        self.client.get("/staff_home/")
+
+        response = self.client.get("/metrics")
+
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('student_management_request_duration_seconds_count{view="staff_home",method="GET"} 2', body)
+        self.assertIn('student_management_request_sql_queries_bucket{view="staff_home",method="GET",le="+Inf"} 2', body)
+        self.assertIn('student_management_response_size_bytes_count{view="staff_home",method="GET"} 2', body)
+        self.assertIn("student_management_dashboard_cache_hits_total 1", body)
+
+    def test_only_served_locally(self):
+        response = self.client.get("/metrics", REMOTE_ADDR="10.0.0.5")
+        self.assertEqual(response.status_code, 403)
@@ -16,15 +16,20 @@ urlpatterns = [
     path('registration', views.registration, name="registration"),
     path('doLogin', views.doLogin, name="doLogin"),
     path('doRegistration', views.doRegistration, name="doRegistration"),
+    path('metrics', views.metrics, name="metrics"),
+    path('change_feed/<feed>/', views.change_feed, name="change_feed"),
 
     #URLS for excel uplaod 
     path('upload_students_excel/', views.upload_students_excel, name='upload_students_excel'),
     path("upload/", upload_file, name="upload_file"),
+    path('import_job_status/', views.import_job_status, name='import_job_status'),
+    path('cancel_import_job/', views.cancel_import_job, name='cancel_import_job'),
     
       # URLS for Student
     path('student_home/', StudentViews.student_home, name="student_home"),
     path('student_view_attendance/', StudentViews.student_view_attendance, name="student_view_attendance"),
     path('student_view_attendance_post/', StudentViews.student_view_attendance_post, name="student_view_attendance_post"),
+    path('student_attendance_export/', StudentViews.student_attendance_export, name="student_attendance_export"),
     path('student_apply_leave/', StudentViews.student_apply_leave, name="student_apply_leave"),
     path('student_apply_leave_save/', StudentViews.student_apply_leave_save, name="student_apply_leave_save"),
     path('student_feedback/', StudentViews.student_feedback, name="student_feedback"),
@@ -32,6 +37,7 @@ urlpatterns = [
     path('student_profile/', StudentViews.student_profile, name="student_profile"),
     path('student_profile_update/', StudentViews.student_profile_update, name="student_profile_update"),
     path('student_view_result/', StudentViews.student_view_result, name="student_view_result"),
+    path('student_result_export/', StudentViews.student_result_export, name="student_result_export"),
 
 
      # URLS for Staff
@@ -39,10 +45,14 @@ urlpatterns = [
     path('staff_take_attendance/', StaffViews.staff_take_attendance, name="staff_take_attendance"),
     path('get_students/', StaffViews.get_students, name="get_students"),
     path('save_attendance_data/', StaffViews.save_attendance_data, name="save_attendance_data"),
+    path('save_attendance_batch_data/', StaffViews.save_attendance_batch_data, name="save_attendance_batch_data"),
+    path('attendance_submission_status/', StaffViews.attendance_submission_status, name="attendance_submission_status"),
     path('staff_update_attendance/', StaffViews.staff_update_attendance, name="staff_update_attendance"),
     path('get_attendance_dates/', StaffViews.get_attendance_dates, name="get_attendance_dates"),
     path('get_attendance_student/', StaffViews.get_attendance_student, name="get_attendance_student"),
     path('update_attendance_data/', StaffViews.update_attendance_data, name="update_attendance_data"),
+    path('staff_attendance_export/', StaffViews.staff_attendance_export, name="staff_attendance_export"),
+    path('staff_attendance_alerts/', StaffViews.staff_attendance_alerts, name="staff_attendance_alerts"),
     path('staff_apply_leave/', StaffViews.staff_apply_leave, name="staff_apply_leave"),
     path('staff_apply_leave_save/', StaffViews.staff_apply_leave_save, name="staff_apply_leave_save"),
     path('staff_feedback/', StaffViews.staff_feedback, name="staff_feedback"),
@@ -51,6 +61,7 @@ urlpatterns = [
     path('staff_profile_update/', StaffViews.staff_profile_update, name="staff_profile_update"),
     path('staff_add_result/', StaffViews.staff_add_result, name="staff_add_result"),
     path('staff_add_result_save/', StaffViews.staff_add_result_save, name="staff_add_result_save"),
+    path('staff_result_export/', StaffViews.staff_result_export, name="staff_result_export"),
     
     # URL for Admin
     path('admin_home/', HodViews.admin_home, name="admin_home"),
@@ -99,6 +110,8 @@ urlpatterns = [
     path('admin_view_attendance/', HodViews.admin_view_attendance, name="admin_view_attendance"),
     path('admin_get_attendance_dates/', HodViews.admin_get_attendance_dates, name="admin_get_attendance_dates"),
     path('admin_get_attendance_student/', HodViews.admin_get_attendance_student, name="admin_get_attendance_student"),
+    path('admin_attendance_export/', HodViews.admin_attendance_export, name="admin_attendance_export"),
+    path('admin_attendance_alerts/', HodViews.admin_attendance_alerts, name="admin_attendance_alerts"),
     path('admin_profile/', HodViews.admin_profile, name="admin_profile"),
     path('admin_profile_update/', HodViews.admin_profile_update, name="admin_profile_update"),
     
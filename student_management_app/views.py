@@ -5,7 +5,6 @@ from django.contrib import messages
 
 #excel uplaod
 
-import pandas as pd
 from django.http import JsonResponse
 from django.core.files.storage import FileSystemStorage
 from .models import Students, CustomUser, Courses, SessionYearModel
@@ -14,6 +13,12 @@ from django.http import HttpResponse
 from django.shortcuts import render, redirect
 from django.core.files.storage import FileSystemStorage
 from django.views.decorators.csrf import csrf_exempt
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
+from .change_feed import DEFAULT_PAGE_SIZE, FEEDS, change_page, since_cursor
+from .metrics import registry
+from .import_jobs import import_job_progress, request_import_job_cancel, submit_import_job
+from .student_import import check_import_columns, validate_student_sheet
 
 
 @csrf_exempt
@@ -33,54 +38,81 @@ def upload_file(request):
 def upload_students_excel(request):
     if request.method == "POST" and request.FILES.get("file"):
         file = request.FILES["file"]
-        fs = FileSystemStorage()
-        filename = fs.save(file.name, file)
-        file_path = fs.path(filename)
 
+        # A dry run only validates the sheet and reports every bad row
+        if request.POST.get("dry_run"):
+            try:
+                report = validate_student_sheet(file)
+            except ValueError as e:
+                return JsonResponse({"error": str(e)}, status=400)
+            except Exception as e:
+                return JsonResponse({"error": f"Unexpected error: {str(e)}"}, status=400)
+            message = "%d of %d rows are valid" % (report["valid"], report["rows"])
+            return JsonResponse(dict(report, message=message))
+
+        # Only the header is checked here; the rows are imported by the
+        # import worker process, and the page polls import_job_status
         try:
-            df = pd.read_excel(file_path)
-
-            for index, row in df.iterrows():
-                try:
-                    # Check if course exists
-                    course = Courses.objects.filter(id=row["Course ID"]).first()
-                    if not course:
-                        return JsonResponse({"error": f"Course ID {row['Course ID']} does not exist at row {index + 2}"}, status=400)
-
-                    # Check if session exists
-                    session = SessionYearModel.objects.filter(id=row["Session Year ID"]).first()
-                    if not session:
-                        return JsonResponse({"error": f"Session Year ID {row['Session Year ID']} does not exist at row {index + 2}"}, status=400)
-
-                    # Create user account
-                    user = CustomUser.objects.create_user(
-                        username=row["Roll Number"],  
-                        email=row["Email"],
-                        first_name=row["Name"].split()[0],  
-                        last_name=" ".join(row["Name"].split()[1:]) if len(row["Name"].split()) > 1 else "",
-                        password="defaultpassword123"
-                    )
-
-                    # Create student record
-                    Students.objects.create(
-                        admin=user,
-                        gender=row["Gender"],
-                        address=row["Address"],
-                        course_id=course,
-                        session_year_id=session
-                    )
-
-                except Exception as row_error:
-                    return JsonResponse({"error": f"Error processing row {index + 2}: {str(row_error)}"}, status=400)
-
-            return JsonResponse({"message": "Students uploaded successfully"}, status=201)
-
+            check_import_columns(file)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
         except Exception as e:
             return JsonResponse({"error": f"Unexpected error: {str(e)}"}, status=400)
 
+        job = submit_import_job(request.user.id, file)
+        return JsonResponse({"message": "Import queued", "job_id": job.id, "status": "Queued"}, status=202)
+
     return JsonResponse({"error": "Invalid request"}, status=400)
+
+
+def import_job_status(request):
+    # Polled by the add student page while an import job runs
+    try:
+        status = import_job_progress(int(request.GET.get("job_id") or request.POST.get("job_id")), request.user.id)
+    except (TypeError, ValueError):
+        status = None
+    if status is None:
+        return JsonResponse({"error": "No such import job"}, status=404)
+    return JsonResponse(status)
+
+
+def cancel_import_job(request):
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request"}, status=400)
+    try:
+        job_id = int(request.POST.get("job_id"))
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "No such import job"}, status=404)
+    # A finished job can't be cancelled any more
+    if not request_import_job_cancel(job_id, request.user.id):
+        return JsonResponse({"error": "The import job can't be cancelled"}, status=409)
+    return JsonResponse(import_job_progress(job_id, request.user.id))
 #excel upload
 
+def change_feed(request, feed):
+	# Rows of `feed` changed after ?cursor= (or ?since=), for the HOD or a
+	# client sending "Authorization: Bearer <CHANGE_FEED_TOKEN>"
+	token = getattr(settings, 'CHANGE_FEED_TOKEN', None)
+	authorization = request.META.get('HTTP_AUTHORIZATION', '')
+	if not (request.user.is_authenticated and request.user.user_type == CustomUser.HOD) and not (token and constant_time_compare(authorization, "Bearer " + token)):
+		return JsonResponse({"error": "Forbidden"}, status=403)
+	if feed not in FEEDS:
+		return JsonResponse({"error": "Unknown feed, use one of: %s" % ", ".join(FEEDS)}, status=404)
+	try:
+		cursor = request.GET.get('cursor') or (since_cursor(request.GET['since']) if request.GET.get('since') else None)
+		page = change_page(feed, cursor, int(request.GET.get('limit') or DEFAULT_PAGE_SIZE))
+	except ValueError as e:
+		return JsonResponse({"error": str(e)}, status=400)
+	return JsonResponse(page)
+
+
+def metrics(request):
+	# Prometheus scrape endpoint, only answered for local addresses
+	if request.META.get('REMOTE_ADDR') not in getattr(settings, 'METRICS_ALLOWED_IPS', ('127.0.0.1', '::1')):
+		return HttpResponse(status=403)
+	return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 def home(request):
 	return render(request, 'home.html')
 
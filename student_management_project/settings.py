@@ -34,14 +34,24 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its latency covers every other middleware
+    'student_management_app.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Logs queries repeated QUERY_SHAPE_THRESHOLD or more times in one request (N+1)
+    # 'student_management_app.middleware.QueryShapeMiddleware',
 ]
 
+QUERY_SHAPE_THRESHOLD = 5
+
+# Request metrics served on /metrics (Prometheus text format)
+METRICS_SAMPLE_RATE = 1.0
+METRICS_ALLOWED_IPS = ('127.0.0.1', '::1')
+
 ROOT_URLCONF = 'student_management_project.urls'
 
 TEMPLATES = [
@@ -80,6 +90,78 @@ DATABASES = {
 }
 
 
+# Cache
+# Dashboards are cached here (see student_management_app/dashboard_cache.py).
+# The cache has to be shared by every process that writes: the web workers,
+# the import worker (IMPORT_JOB_AUTOSTART), drain_attendance_queue and the
+# convert/archive commands bump dashboard versions from their own process.
+# The file cache below is shared by the processes of one machine; use a
+# database cache or memcached across machines. LocMemCache is per process,
+# manage.py check warns (W001) when it's used with other writers.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+        # 'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        # 'LOCATION': 'dashboard_cache',
+    }
+}
+
+DASHBOARD_CACHE_ALIAS = 'default'
+DASHBOARD_CACHE_TIMEOUT = 300
+
+
+# Attendance storage for new sessions: "rows" (one AttendanceReport per
+# student) or "bitmap" (one packed AttendanceBitmap per session, see
+# student_management_app/attendance_bitmap.py). Existing sessions keep their
+# storage; move them with manage.py convert_attendance_storage.
+ATTENDANCE_STORAGE = 'rows'
+
+# Students below ATTENDANCE_THRESHOLD percent over the last
+# ATTENDANCE_WINDOW_DAYS days or the whole session year are flagged by
+# manage.py compute_attendance_percentages.
+ATTENDANCE_THRESHOLD = 75
+ATTENDANCE_WINDOW_DAYS = 30
+
+# Write-behind attendance saves: when on, save_attendance_data and
+# save_attendance_batch_data queue the submission and answer with a ticket.
+# The queue is drained by a thread in each web process, or, with
+# ATTENDANCE_QUEUE_THREAD = False, by manage.py drain_attendance_queue --loop.
+ATTENDANCE_WRITE_BEHIND = False
+ATTENDANCE_QUEUE_THREAD = True
+ATTENDANCE_QUEUE_INTERVAL = 5
+ATTENDANCE_QUEUE_BATCH_SIZE = 50
+# Tries before a submission that keeps hitting database errors fails,
+# seconds a submission waits between those tries, and seconds after which a
+# batch claimed by a worker that died is taken over
+ATTENDANCE_QUEUE_MAX_ATTEMPTS = 5
+ATTENDANCE_QUEUE_RETRY_DELAY = 5
+ATTENDANCE_QUEUE_CLAIM_TIMEOUT = 300
+
+# Rows per transaction of the Excel student import (upload_students_excel)
+STUDENT_IMPORT_CHUNK_SIZE = 1000
+
+# Uploaded imports run as background jobs in a separate process, started for
+# each upload. With IMPORT_JOB_AUTOSTART = False run
+# manage.py run_import_jobs --loop as a service instead.
+IMPORT_JOB_AUTOSTART = True
+# Seconds without progress after which a running import job is taken for
+# dead (its worker writes progress after each chunk)
+IMPORT_JOB_STALE_SECONDS = 600
+
+# Processes hashing passwords during bulk user creation (None: one per core)
+PASSWORD_HASHING_WORKERS = None
+
+# Change feed (change_feed/<feed>/ and manage.py export_changes): rows
+# younger than CHANGE_FEED_SETTLE_SECONDS wait for the next sync, so
+# transactions still committing aren't skipped. Besides the HOD, clients
+# sending "Authorization: Bearer <CHANGE_FEED_TOKEN>" may read it.
+CHANGE_FEED_SETTLE_SECONDS = 60
+CHANGE_FEED_TOKEN = None
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 